@@ -0,0 +1,294 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+from double_elimination_tournament import DoubleEliminationTournament, immutable_type
+from engines import ENGINES
+from folder_scanner import scan_images
+from insertion_ranking import InsertionRanking
+from list_file import read_list
+from sharded_tournament import ShardedTournament
+from top_k_selection import TopKSelection
+
+judge_type = Callable[[immutable_type, immutable_type], immutable_type]
+
+
+class BatchResult(NamedTuple):
+    standings: List[immutable_type]
+    matches: int
+    seconds: float
+
+
+def run_headless(
+    participants: Union[set, Dict[immutable_type, Any]],
+    judge: judge_type,
+    engine: Callable = DoubleEliminationTournament,
+) -> BatchResult:
+    """
+    Run a tournament without a display, asking the judge for the winner of every match.
+    """
+    tournament = engine(participants)
+    gen = tournament.run_tournament()
+    matches = 0
+    start = time.perf_counter()
+    try:
+        a, b = next(gen)
+        while True:
+            matches += 1
+            a, b = gen.send(judge(a, b))
+    except StopIteration as e:
+        return BatchResult(e.value, matches, time.perf_counter() - start)
+
+
+def run_concurrent(
+    participants: Union[set, Dict[immutable_type, Any]],
+    judge: judge_type,
+    workers: int,
+    engine: Callable = DoubleEliminationTournament,
+) -> BatchResult:
+    """
+    Run a tournament without a display, with several workers judging the independent matches of a round at once.
+    """
+    tournament = engine(participants)
+    matches = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while not tournament.finished:
+            pending = tournament.pending_matches()
+            winners = executor.map(lambda match: judge(match[1], match[2]), pending)
+            for (match_id, _, _), winner in zip(pending, winners):
+                tournament.submit_result(match_id, winner)
+            matches += len(pending)
+    return BatchResult(tournament.final_standings, matches, time.perf_counter() - start)
+
+
+def score_judge(score: Callable[[immutable_type], float]) -> judge_type:
+    """
+    Judge that picks the participant with the higher score, the first one on a tie.
+    """
+
+    def judge(a, b):
+        return b if score(b) > score(a) else a
+
+    return judge
+
+
+def random_judge(seed: Optional[int] = None) -> judge_type:
+    """
+    Judge that picks a winner at random, reproducibly for a given seed.
+    """
+    rng = random.Random(seed)
+
+    def judge(a, b):
+        return a if rng.random() < 0.5 else b
+
+    return judge
+
+
+def pixel_count(path: str) -> int:
+    """
+    Width times height of the image, read from its header.
+    """
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size[0] * img.size[1]
+
+
+# scores over file metadata, by name for the command line
+METADATA_SCORES: Dict[str, Callable[[str], float]] = {
+    "size": lambda path: os.stat(path).st_size,
+    "mtime": lambda path: os.stat(path).st_mtime,
+    "pixels": pixel_count,
+}
+
+
+def load_scores(path: os.PathLike) -> Dict[str, float]:
+    """
+    Read precomputed scores, either a JSON object of name to score or a CSV of name,score rows.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        with open(path) as f:
+            return {str(name): float(score) for name, score in json.load(f).items()}
+    with open(path, newline="") as f:
+        return {row[0]: float(row[1]) for row in csv.reader(f) if len(row) >= 2}
+
+
+def score_file_judge(path: os.PathLike) -> judge_type:
+    """
+    Judge that picks the participant with the higher precomputed score. Participants are looked up by their full
+    path, then by file name.
+    """
+    scores = load_scores(path)
+
+    def score(participant):
+        if participant in scores:
+            return scores[participant]
+        name = os.path.basename(participant)
+        if name in scores:
+            return scores[name]
+        raise KeyError(f"No score for {participant} in {path}")
+
+    return score_judge(score)
+
+
+def collect_participants(
+    paths: Iterable[str], list_file: Optional[str], recursive: bool = False
+) -> List[str]:
+    """
+    Participants from the command line: files, the images in folders, and the lines of a list file.
+    """
+    participants = []
+    for path in paths:
+        if os.path.isdir(path):
+            participants += sorted(scan_images(path, recursive))
+        else:
+            participants.append(path)
+    if list_file:
+        with open(list_file) as f:
+            participants += [line.strip() for line in f if line.strip()]
+    # keep the first occurrence, so the bracket order follows the command line
+    return list(dict.fromkeys(participants))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Rank images in a double elimination tournament without a display."
+    )
+    parser.add_argument("paths", nargs="*", help="images, or folders of images")
+    parser.add_argument("--list", help="file with one image path per line")
+    parser.add_argument(
+        "--recursive", action="store_true", help="include images in subfolders"
+    )
+    parser.add_argument(
+        "--judge",
+        choices=["random", "scores", *METADATA_SCORES],
+        default="random",
+        help="how the winner of each match is picked",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=list(ENGINES),
+        default=DoubleEliminationTournament.NAME,
+        help="how the matches are chosen and the standings decided",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=ShardedTournament.DEFAULT_SHARD_SIZE,
+        help="with --engine sharded, most participants in a shard",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        help=f"with --engine sharded, how many of each shard go to the final, {ShardedTournament.DEFAULT_TOP_K} by "
+        f"default. with --engine top_k, how many places to decide, {TopKSelection.DEFAULT_TOP_K} by default",
+    )
+    parser.add_argument(
+        "--ranking",
+        metavar="PATH",
+        help="with --engine insertion, the standings to insert the other participants into, one per line, best first",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        help="with --engine bradley_terry, stop once this share of the pairs of participants is expected to be in the "
+        "right order, 0.8 by default",
+    )
+    parser.add_argument("--seed", type=int, help="seed for the random judge")
+    parser.add_argument("--scores", help="JSON or CSV of precomputed scores")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        metavar="N",
+        help="rank N synthetic participants instead of images, for throughput testing",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="judge this many independent matches at once",
+    )
+    parser.add_argument(
+        "--preferences",
+        metavar="PATH",
+        help="remember every judgment in this file, and decide matches that follow from those of earlier runs",
+    )
+    parser.add_argument("--output", help="write the standings to this file")
+    args = parser.parse_args(argv)
+
+    if args.synthetic is not None:
+        participants = {i: True for i in range(1, args.synthetic + 1)}
+    else:
+        participants = dict.fromkeys(
+            collect_participants(args.paths, args.list, args.recursive), True
+        )
+        if not participants:
+            parser.error("no images to rank")
+
+    if args.confidence is not None and not 0 < args.confidence <= 1:
+        parser.error("--confidence must be above 0 and at most 1")
+    if args.synthetic is not None and args.judge != "random":
+        parser.error("synthetic participants can only be judged at random")
+    if args.judge == "random":
+        judge = random_judge(args.seed)
+    elif args.judge == "scores":
+        if not args.scores:
+            parser.error("--judge scores requires --scores")
+        judge = score_file_judge(args.scores)
+    else:
+        judge = score_judge(METADATA_SCORES[args.judge])
+
+    engine = ENGINES[args.engine]
+    if engine is ShardedTournament:
+        engine = partial(
+            engine,
+            shard_size=args.shard_size,
+            top_k=args.top_k or ShardedTournament.DEFAULT_TOP_K,
+        )
+    elif engine is TopKSelection and args.top_k:
+        engine = partial(engine, top_k=args.top_k)
+    elif engine is InsertionRanking and args.ranking:
+        ranked = read_list(args.ranking)
+        if args.synthetic is not None:
+            ranked = [int(participant) for participant in ranked]
+        engine = partial(engine, ranked=ranked)
+    elif args.engine == "bradley_terry" and args.confidence is not None:
+        engine = partial(engine, confidence=args.confidence)
+    preferences = None
+    if args.preferences:
+        # sqlite3 is only imported when asked for, most runs do not need it
+        from preference_graph import InferringTournament, PreferenceStore
+
+        preferences = PreferenceStore(args.preferences)
+        engine = InferringTournament.wrap(engine, preferences)
+    if args.workers > 1:
+        result = run_concurrent(participants, judge, args.workers, engine)
+    else:
+        result = run_headless(participants, judge, engine)
+    if preferences is not None:
+        preferences.close()
+
+    standings = "\n".join(str(participant) for participant in result.standings)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(standings + "\n")
+    else:
+        print(standings)
+    print(
+        f"{len(participants)} participants, {result.matches} matches in {result.seconds:.3f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from batch_ranker import random_judge, run_headless
+from engines import ENGINES
+from image_prefetcher import render_image, resize_image
+
+# participant counts per engine. the full ranking plays O(n log n) matches, each refitting every score, so it stops
+# at sizes a person could rank anyway.
+DEFAULT_SIZES = {
+    "double_elimination": [10, 100, 1_000, 10_000, 100_000, 1_000_000],
+    "bradley_terry": [10, 100, 1_000],
+    "sharded": [10, 100, 1_000, 10_000, 100_000],
+    "top_k": [10, 100, 1_000, 10_000, 100_000, 1_000_000],
+    "insertion": [10, 100, 1_000, 10_000, 100_000, 1_000_000],
+}
+QUICK_SIZES = {
+    "double_elimination": [10, 100, 1_000, 10_000],
+    "bradley_terry": [10, 100],
+    "sharded": [10, 100, 1_000],
+    "top_k": [10, 100, 1_000, 10_000],
+    "insertion": [10, 100, 1_000, 10_000],
+}
+# modules whose import time is measured: the core batch jobs import, and the entry points
+IMPORT_MODULES = [
+    "double_elimination_tournament",
+    "match_journal",
+    "batch_ranker",
+    "web_ranker",
+    "image_ranker",
+]
+RESOLUTIONS = [(640, 480), (1920, 1080), (4000, 3000)]
+QUICK_RESOLUTIONS = [(640, 480)]
+FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+# the image box of a maximized window on a 1080p screen, two images side by side
+DISPLAY_BOX = (940, 960)
+
+result_type = Dict[str, Any]
+
+
+def environment() -> Dict[str, Any]:
+    """
+    What the results depend on besides the code: the commit, the interpreter and the libraries.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "pillow": PIL.__version__,
+        "numpy": np.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def bench_tournament(
+    engine_name: str, size: int, repeat: int = 3, seed: int = 1, memory: bool = True
+) -> result_type:
+    """
+    Run a tournament over size synthetic participants with a random judge. The time is the best of repeat runs, the
+    memory peak is traced on a run of its own, since tracing slows every allocation down.
+    """
+    participants = {i: True for i in range(1, size + 1)}
+    engine = ENGINES[engine_name]
+    if engine_name == "insertion":
+        # what it is for: a ranking of most participants, with one in ten new
+        engine = partial(
+            engine,
+            ranked=[participant for participant in participants if participant % 10],
+        )
+    best = None
+    for _ in range(repeat):
+        result = run_headless(participants, random_judge(seed), engine)
+        if best is None or result.seconds < best.seconds:
+            best = result
+    peak_bytes = None
+    if memory:
+        tracemalloc.start()
+        run_headless(participants, random_judge(seed), engine)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "name": f"tournament/{engine_name}/{size}",
+        "benchmark": "tournament",
+        "engine": engine_name,
+        "size": size,
+        "matches": best.matches,
+        "seconds": best.seconds,
+        "matches_per_second": best.matches / best.seconds if best.seconds else None,
+        "peak_bytes": peak_bytes,
+    }
+
+
+def bench_import(module: str, rounds: int = 10) -> result_type:
+    """
+    Time importing the module in a fresh interpreter, as a short-lived job or starting the app does, and list which
+    of the heavy dependencies the import loaded.
+    """
+    code = (
+        "import sys, time; start = time.perf_counter(); "
+        f"import {module}; seconds = time.perf_counter() - start; "
+        "print(seconds, *[m for m in ('numpy', 'PIL', 'tkinter') if m in sys.modules])"
+    )
+    samples = []
+    for _ in range(rounds):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        samples.append(float(output[0]))
+    return {
+        "name": f"import/{module}",
+        "benchmark": "import",
+        "module": module,
+        "loaded": output[1:],
+        **timings(samples),
+    }
+
+
+def generate_image(folder: Path, size: Tuple[int, int], format: str) -> Path:
+    """
+    A photo-like test image: smooth gradients under noise, so it compresses like a photo rather than a flat fill.
+    """
+    width, height = size
+    rng = np.random.default_rng(width * height)
+    y, x = np.mgrid[0:height, 0:width]
+    channels = [
+        (x * 255 // max(width - 1, 1)),
+        (y * 255 // max(height - 1, 1)),
+        ((x + y) * 255 // max(width + height - 2, 1)),
+    ]
+    pixels = np.stack(channels, axis=-1).astype(np.int16)
+    pixels += rng.integers(-24, 25, pixels.shape, dtype=np.int16)
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+    path = folder / f"{width}x{height}{FORMATS[format]}"
+    img.save(path, format)
+    return path
+
+
+def timings(samples: List[float]) -> Dict[str, float]:
+    """
+    Summary of a list of durations in seconds, in milliseconds.
+    """
+    ordered = sorted(samples)
+    return {
+        "median_ms": statistics.median(ordered) * 1000,
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+def bench_display(
+    path: Path, format: str, rounds: int, photo_root: Optional[Any]
+) -> List[result_type]:
+    """
+    Time every stage of showing the image: opening and decoding it, resize_image to the display box, and building
+    the PhotoImage, plus render_image, the reduced-resolution decode and resize the prefetcher uses instead. A match
+    shows two images, so a match costs twice the sum of the stages.
+    """
+    from PIL import ImageTk
+
+    stages: Dict[str, List[float]] = {"open": [], "resize": [], "render": []}
+    if photo_root is not None:
+        stages["photo"] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        with Image.open(path) as img:
+            img.load()
+        stages["open"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        resized = resize_image(img, *DISPLAY_BOX)
+        stages["resize"].append(time.perf_counter() - start)
+
+        if photo_root is not None:
+            start = time.perf_counter()
+            ImageTk.PhotoImage(resized, master=photo_root)
+            stages["photo"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        render_image(str(path), DISPLAY_BOX)
+        stages["render"].append(time.perf_counter() - start)
+
+    width, height = img.size
+    results = []
+    for stage, samples in stages.items():
+        results.append(
+            {
+                "name": f"display/{format}/{width}x{height}/{stage}",
+                "benchmark": "display",
+                "format": format,
+                "width": width,
+                "height": height,
+                "file_bytes": path.stat().st_size,
+                "stage": stage,
+                **timings(samples),
+            }
+        )
+    return results
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Peak resident memory of the process so far, where the platform reports it.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def hidden_root() -> Optional[Any]:
+    """
+    A withdrawn Tk root to build PhotoImages on, or None without a display to connect to.
+    """
+    try:
+        import tkinter
+    except ImportError:
+        return None
+    try:
+        root = tkinter.Tk()
+    except tkinter.TclError:
+        return None
+    root.withdraw()
+    return root
+
+
+def run(
+    engines: Sequence[str],
+    sizes: Optional[Sequence[int]],
+    resolutions: Sequence[Tuple[int, int]],
+    formats: Sequence[str],
+    repeat: int = 3,
+    rounds: int = 10,
+    memory: bool = True,
+    quick: bool = False,
+    imports: Sequence[str] = IMPORT_MODULES,
+) -> Dict[str, Any]:
+    """
+    Run the benchmarks and return the results with the environment they ran in.
+    """
+    results = []
+    for engine_name in engines:
+        engine_sizes = sizes or (QUICK_SIZES if quick else DEFAULT_SIZES)[engine_name]
+        for size in engine_sizes:
+            results.append(bench_tournament(engine_name, size, repeat, memory=memory))
+            print(
+                f"{results[-1]['name']}: {results[-1]['seconds']:.3f}s", file=sys.stderr
+            )
+
+    photo_root = hidden_root()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for resolution in resolutions:
+                for format in formats:
+                    path = generate_image(Path(folder), resolution, format)
+                    results += bench_display(path, format, rounds, photo_root)
+                    print(
+                        f"display/{format}/{resolution[0]}x{resolution[1]}",
+                        file=sys.stderr,
+                    )
+    finally:
+        if photo_root is not None:
+            photo_root.destroy()
+
+    for module in imports:
+        results.append(bench_import(module, rounds))
+        print(
+            f"{results[-1]['name']}: {results[-1]['median_ms']:.1f}ms", file=sys.stderr
+        )
+
+    meta = environment()
+    meta["display"] = photo_root is not None
+    meta["peak_rss_bytes"] = peak_rss_bytes()
+    return {"meta": meta, "results": results}
+
+
+# the metric of each benchmark that regressions are judged on, lower is better
+METRICS = {"tournament": "seconds", "display": "median_ms", "import": "median_ms"}
+
+
+def compare(
+    baseline: Dict[str, Any], current: Dict[str, Any]
+) -> List[Tuple[str, float, float, float]]:
+    """
+    Returns (name, baseline, current, current / baseline) for every benchmark in both runs.
+    """
+    before = {result["name"]: result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        if result["name"] not in before:
+            continue
+        metric = METRICS[result["benchmark"]]
+        old, new = before[result["name"]][metric], result[metric]
+        rows.append((result["name"], old, new, new / old if old else float("inf")))
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ranking engines and the image display pipeline."
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        choices=list(ENGINES),
+        default=list(ENGINES),
+        help="engines to benchmark",
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, help="participant counts, for every engine"
+    )
+    parser.add_argument(
+        "--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS)
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="tournament runs per size"
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=10, help="timed decodes per image"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="skip the traced tournament runs"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="small sizes and images, for a smoke test"
+    )
+    parser.add_argument(
+        "--imports",
+        nargs="*",
+        default=IMPORT_MODULES,
+        help="modules to time importing in a fresh interpreter, none to skip",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "--compare",
+        metavar="BASELINE",
+        help="JSON results of an earlier run to compare to",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.25,
+        help="with --compare, fail if any benchmark is this many times slower",
+    )
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.engines,
+        args.sizes,
+        QUICK_RESOLUTIONS if args.quick else RESOLUTIONS,
+        args.formats,
+        repeat=args.repeat,
+        rounds=args.rounds,
+        memory=not args.no_memory,
+        quick=args.quick,
+        imports=args.imports,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        slower = 0
+        for name, old, new, ratio in compare(baseline, report):
+            flag = " SLOWER" if ratio > args.max_slowdown else ""
+            slower += bool(flag)
+            print(
+                f"{name}: {old:.4g} -> {new:.4g} ({ratio:.2f}x){flag}", file=sys.stderr
+            )
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import math
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from double_elimination_tournament import immutable_type, match_type
+
+
+class BradleyTerryRanking:
+    """
+    Ranks every participant from as few matches as it can, by actively choosing each match.
+
+    Each participant has a Bradley-Terry score, a log-strength, so a beats b with probability
+    1 / (1 + exp(score[b] - score[a])). The scores follow the most likely ones given the results so far and a Gaussian
+    prior, those of the participants of each match moved towards them after it, and their uncertainty comes from the
+    information each participant's matches carry. The next match is the one expected to tell the most: the least
+    known participant against the one it is closest to beating, weighted by how little is known about it. The ranking
+    stops once the expected share of correctly ordered pairs of participants reaches the confidence.
+    """
+
+    NAME = "bradley_terry"
+
+    # variance of the prior on the scores, which keeps them finite while a participant has only won or only lost
+    PRIOR_VARIANCE = 4.0
+    # Newton steps towards the most likely scores of the participants of each match, warm started from their scores
+    FIT_ITERATIONS = 2
+    # the expected share of correctly ordered pairs of participants the ranking stops at
+    DEFAULT_CONFIDENCE = 0.8
+    # the share of correctly ordered pairs is estimated over this many pairs, drawn once
+    CONFIDENCE_SAMPLES = 10_000
+
+    def __init__(
+        self,
+        participants: Union[set, Dict[immutable_type, Any]],
+        confidence: float = DEFAULT_CONFIDENCE,
+        max_matches: Optional[int] = None,
+        seed: int = 0,
+    ):
+        """
+        Initializes the ranking with participants. Unless the confidence is reached first, it stops after
+        max_matches, by default as many as a binary insertion sort of the participants needs at most.
+        """
+        if isinstance(participants, set):
+            participants = {participant: True for participant in participants}
+
+        self.participants = participants
+        self.keys: List[immutable_type] = list(participants.keys())
+        count = len(self.keys)
+        self.confidence = confidence
+        if max_matches is None:
+            max_matches = sum(math.ceil(math.log2(n)) for n in range(2, count + 1))
+        self.max_matches = max_matches
+        self.scores = np.zeros(count)
+        # precision of each score, the prior's plus the Fisher information of its matches
+        self.information = np.full(count, 1 / self.PRIOR_VARIANCE)
+        # the opponents of each participant in its matches so far, and whether it won each, 1 or 0
+        self.opponents: List[List[int]] = [[] for _ in self.keys]
+        self.outcomes: List[List[float]] = [[] for _ in self.keys]
+        # the winner and the loser of every match so far, their scores from before it, and the participants whose
+        # information it changed with their information from before it
+        self.results: List[Tuple[int, int, np.ndarray, np.ndarray, np.ndarray]] = []
+        self.next_match_id = 0
+        rng = np.random.default_rng(seed)
+        first = rng.integers(0, max(count, 1), self.CONFIDENCE_SAMPLES)
+        second = rng.integers(0, max(count, 1), self.CONFIDENCE_SAMPLES)
+        distinct = first != second
+        self.sample_pairs = (first[distinct], second[distinct])
+        # a tiny random preference, so ties between participants are not broken by the order they were given in
+        self.tiebreak = 1 + rng.random(count) * 1e-9
+        self.final_standings: Optional[List[immutable_type]] = None
+        # called with the match id and the winner of every decided match, e.g. to journal it
+        self.result_listeners: List[Callable[[int, immutable_type], None]] = []
+        # called with the match id of every decision taken back
+        self.undo_listeners: List[Callable[[int], None]] = []
+        # the pair of every decided match, in the order it was offered, so undo offers it again
+        self.history: List[Tuple[int, int]] = []
+        self.current: Optional[Tuple[int, int]] = None
+        self.next_match()
+
+    def select_pair(self) -> Tuple[int, int]:
+        """
+        The match expected to tell the most, in O(participants).
+        """
+        variance = self.tiebreak / self.information
+        a = int(np.argmax(variance))
+        win_probability = 1 / (1 + np.exp(self.scores - self.scores[a]))
+        gain = win_probability * (1 - win_probability) * (variance[a] + variance)
+        gain[a] = -1
+        return a, int(np.argmax(gain))
+
+    def fit(self, participants: List[int]):
+        """
+        Move the scores of the participants towards the most likely ones, with Newton steps over their own matches,
+        in O(their matches). The other scores are kept, they move when their participants play, but the information
+        of the opponents follows.
+        """
+        matches = [
+            (
+                np.array(self.opponents[participant]),
+                np.array(self.outcomes[participant]),
+            )
+            for participant in participants
+        ]
+        for _ in range(self.FIT_ITERATIONS):
+            for participant, (opponents, outcomes) in zip(participants, matches):
+                p = 1 / (1 + np.exp(self.scores[opponents] - self.scores[participant]))
+                gradient = (
+                    np.sum(outcomes - p)
+                    - self.scores[participant] / self.PRIOR_VARIANCE
+                )
+                before = p * (1 - p)
+                self.information[participant] = np.sum(before) + 1 / self.PRIOR_VARIANCE
+                self.scores[participant] += gradient / self.information[participant]
+                # what the match tells about each opponent changed with the score
+                p = 1 / (1 + np.exp(self.scores[opponents] - self.scores[participant]))
+                np.add.at(self.information, opponents, p * (1 - p) - before)
+
+    def estimated_confidence(self) -> float:
+        """
+        Expected share of pairs of participants the current ranking orders correctly.
+        """
+        first, second = self.sample_pairs
+        if len(first) == 0:
+            return 1.0
+        variance = 1 / self.information
+        spread = variance[first] + variance[second]
+        # probability the better scored of each pair is the stronger, the Gaussian tail of the difference of their
+        # scores below zero, with the logistic approximation of the Gaussian cumulative distribution. not the
+        # probability it wins their match, which the randomness of the match itself caps however sure the scores are
+        z = np.abs(self.scores[first] - self.scores[second]) / np.sqrt(spread)
+        return float(np.mean(1 / (1 + np.exp(-1.702 * z))))
+
+    def next_match(self):
+        """
+        Choose the next match, or finish the ranking.
+        """
+        if (
+            len(self.keys) < 2
+            or self.next_match_id >= self.max_matches
+            or (
+                self.next_match_id > 0
+                and self.estimated_confidence() >= self.confidence
+            )
+        ):
+            self.current = None
+            order = np.argsort(-self.scores, kind="stable")
+            self.final_standings = [self.keys[participant] for participant in order]
+        else:
+            self.current = self.select_pair()
+
+    def record(self, winner: int, loser: int):
+        """
+        Add a result and refit the scores of its participants.
+        """
+        participants = [winner, loser]
+        self.opponents[winner].append(loser)
+        self.outcomes[winner].append(1.0)
+        self.opponents[loser].append(winner)
+        self.outcomes[loser].append(0.0)
+        changed = np.array(
+            participants + self.opponents[winner] + self.opponents[loser]
+        )
+        self.results.append(
+            (
+                winner,
+                loser,
+                self.scores[participants],
+                changed,
+                self.information[changed],
+            )
+        )
+        self.next_match_id += 1
+        self.fit(participants)
+
+    def forget(self) -> int:
+        """
+        Drop the last result, restoring the scores from before it. Returns its winner.
+        """
+        winner, loser, scores, changed, information = self.results.pop()
+        for participant in (winner, loser):
+            self.opponents[participant].pop()
+            self.outcomes[participant].pop()
+        self.scores[[winner, loser]] = scores
+        self.information[changed] = information
+        self.next_match_id -= 1
+        return winner
+
+    @property
+    def finished(self) -> bool:
+        return self.final_standings is not None
+
+    def pending_matches(self, count: Optional[int] = None) -> List[match_type]:
+        """
+        Returns the match in play, as (match id, participant, participant). Each match is chosen from the results of
+        all the previous ones, so there is at most one.
+        """
+        if self.current is None or count == 0:
+            return []
+        a, b = self.current
+        return [(self.next_match_id, self.keys[a], self.keys[b])]
+
+    def submit_result(self, match_id: int, winner: immutable_type):
+        """
+        Decide the match in play.
+        """
+        if self.current is None or match_id != self.next_match_id:
+            if 0 <= match_id < self.next_match_id:
+                raise ValueError(f"Match {match_id} was already decided.")
+            raise KeyError(f"Match {match_id} is not scheduled.")
+        a, b = self.current
+        if winner == self.keys[a]:
+            self.decide(a, b)
+        elif winner == self.keys[b]:
+            self.decide(b, a)
+        else:
+            raise ValueError(f"{winner!r} is not in match {match_id}.")
+
+    def decide(self, winner: int, loser: int):
+        """
+        Record the result of the match in play and choose the next one.
+        """
+        match_id = self.next_match_id
+        self.history.append(self.current)
+        self.record(winner, loser)
+        for listener in self.result_listeners:
+            listener(match_id, self.keys[winner])
+        self.next_match()
+
+    def undo(self) -> Tuple[int, immutable_type]:
+        """
+        Take back the last decision and offer its match again. Returns the match id and the winner of the match taken
+        back. The results are an operation log, so this only drops the last one, and the scores are the ones from
+        before it.
+        """
+        if not self.history:
+            raise IndexError("There is no decision to undo.")
+        self.current = self.history.pop()
+        winner = self.forget()
+        self.final_standings = None
+        for listener in self.undo_listeners:
+            listener(self.next_match_id)
+        return self.next_match_id, self.keys[winner]
+
+    def run_tournament(
+        self,
+    ) -> Generator[
+        Tuple[immutable_type, immutable_type], immutable_type, List[immutable_type]
+    ]:
+        """
+        Generator to run the ranking. Yields pairs of participants to compete in a match and accepts the winner of
+        each match.
+        """
+        while not self.finished:
+            a, b = self.current
+            winner = yield (self.keys[a], self.keys[b])
+            # if the winner is None, it is an usage error
+            if not winner:
+                raise ValueError("Winner must be provided via generator send.")
+            if self.current != (a, b):
+                raise ValueError("Match was decided through submit_result.")
+            if winner == self.keys[b]:
+                self.decide(b, a)
+            else:
+                self.decide(a, b)
+        return self.final_standings
+
+    def upcoming_matches(
+        self, count: int
+    ) -> List[Tuple[immutable_type, immutable_type]]:
+        """
+        Returns up to count matches that could follow the match in play, the next match for each of its outcomes.
+        """
+        if self.current is None or count <= 0:
+            return []
+        a, b = self.current
+        upcoming = []
+        for winner, loser in ((a, b), (b, a)):
+            self.record(winner, loser)
+            if self.next_match_id < self.max_matches:
+                c, d = self.select_pair()
+                match = (self.keys[c], self.keys[d])
+                if match not in upcoming:
+                    upcoming.append(match)
+            self.forget()
+        return upcoming[:count]
@@ -1,20 +1,245 @@
-from typing import Any, Dict, Generator, List, Tuple, Union
+from array import array
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
 
 immutable_type = Union[int, float, str, bool, tuple, frozenset, bytes]
+match_type = Tuple[int, immutable_type, immutable_type]
+
+UNDECIDED = -1
+
+
+class BracketRound:
+    """
+    One round of a bracket: neighbours are paired, and the odd participant out gets a bye.
+    Matches are numbered from first_match_id, in bracket order.
+    """
+
+    LOSERS = "losers"
+    WINNERS = "winners"
+    GRAND_FINAL = "grand_final"
+
+    def __init__(self, kind: str, bracket: array, first_match_id: int):
+        self.kind = kind
+        self.bracket = bracket
+        self.first_match_id = first_match_id
+        self.match_count = len(bracket) // 2
+        self.winners = array("q", [UNDECIDED]) * self.match_count
+        # every match before the cursor is decided
+        self.cursor = 0
+
+    def pair(self, index: int) -> Tuple[int, int]:
+        return self.bracket[2 * index], self.bracket[2 * index + 1]
+
+    def decide(self, index: int, winner: int):
+        self.winners[index] = winner
+        while self.cursor < self.match_count and self.winners[self.cursor] != UNDECIDED:
+            self.cursor += 1
+
+    def undecide(self, index: int):
+        self.winners[index] = UNDECIDED
+        self.cursor = min(self.cursor, index)
+
+    def outcome(self) -> Tuple[array, array]:
+        """
+        The winners in match order followed by the bye, if any, and the losers in match order.
+        """
+        survivors = array("q", self.winners)
+        end = 2 * self.match_count
+        losers = array(
+            "q",
+            [
+                b if winner == a else a
+                for winner, a, b in zip(
+                    self.winners, self.bracket[0:end:2], self.bracket[1:end:2]
+                )
+            ],
+        )
+        if len(self.bracket) % 2 != 0:
+            survivors.append(self.bracket[-1])
+        return survivors, losers
 
 
 class DoubleEliminationTournament:
+    NAME = "double_elimination"
+
     def __init__(self, participants: Union[set, Dict[immutable_type, Any]]):
         """
         Initializes the double elimination tournament with participants.
+
+        Participants are referred to by integer ids, their index in keys, and the brackets are compact arrays of
+        ids. Every round builds the next bracket by appending, so each match takes constant time.
+
+        Brackets are never changed once a round is fixed over them, the next rounds get new ones. So each decision
+        can be undone by keeping the match it decided and, if it completed the rounds in play, references to the
+        brackets and rounds it replaced, in constant memory rather than a copy of the brackets.
         """
         if isinstance(participants, set):
             participants = {participant: True for participant in participants}
 
         self.participants = participants
-        self.winners_bracket = list(participants.keys())
-        self.losers_bracket = []
-        self.standings = []
+        self.keys: List[immutable_type] = list(participants.keys())
+        self.winners_bracket = array("q", range(len(self.keys)))
+        self.losers_bracket = array("q")
+        self.standings = array("q")
+        self.final_standings: Optional[List[immutable_type]] = None
+        # the rounds in play. a losers bracket round and a winners bracket round do not depend on each other, so
+        # both are played at once, and the next rounds are only fixed once every match of both is decided.
+        self.rounds: List[BracketRound] = []
+        self.undecided = 0
+        self.next_match_id = 0
+        # called with the match id and the winner of every decided match, e.g. to journal it
+        self.result_listeners: List[Callable[[int, immutable_type], None]] = []
+        # called with the match id of every decision taken back
+        self.undo_listeners: List[Callable[[int], None]] = []
+        # every decision in the order made: the round, the index of the match and, if it completed the rounds in
+        # play, what fixing the next rounds replaced
+        self.history: List[Tuple[BracketRound, int, Optional[tuple]]] = []
+        self.start_rounds()
+
+    def start_rounds(self):
+        """
+        Fix the next rounds, or finish the tournament.
+        """
+        rounds = []
+        # Losers Bracket, if applicable. the losers bracket will continue more rounds than the winners bracket
+        if len(self.losers_bracket) > 1:
+            rounds.append(self.new_round(BracketRound.LOSERS, self.losers_bracket))
+        # Winners Bracket, if applicable. the winners bracket will finish before the losers bracket
+        if len(self.winners_bracket) > 1:
+            rounds.append(self.new_round(BracketRound.WINNERS, self.winners_bracket))
+        # Grand Final, once there is only one winner in the winners bracket and one winner in the losers bracket.
+        if (
+            not rounds
+            and len(self.winners_bracket) == 1
+            and len(self.losers_bracket) == 1
+        ):
+            finalists = array("q", [self.winners_bracket[0], self.losers_bracket[0]])
+            rounds.append(self.new_round(BracketRound.GRAND_FINAL, finalists))
+
+        self.rounds = rounds
+        self.undecided = sum(bracket_round.match_count for bracket_round in rounds)
+        if not rounds and self.final_standings is None:
+            # this is an exception.
+            # this means no grand final was run, and the tournament is over.
+            self.final_standings = list(self.keys)
+
+    def new_round(self, kind: str, bracket: array) -> BracketRound:
+        bracket_round = BracketRound(kind, bracket, self.next_match_id)
+        self.next_match_id += bracket_round.match_count
+        return bracket_round
+
+    def finish_rounds(self):
+        """
+        Move the participants of the rounds in play on to their next brackets.
+        """
+        for bracket_round in self.rounds:
+            survivors, losers = bracket_round.outcome()
+            if bracket_round.kind == BracketRound.LOSERS:
+                self.standings.extend(losers)
+                self.losers_bracket = survivors
+            elif bracket_round.kind == BracketRound.WINNERS:
+                # losers join the end of the losers bracket, after the survivors of the losers bracket round.
+                # in a new array, the old one may still be needed to undo this
+                self.losers_bracket = self.losers_bracket + losers
+                self.winners_bracket = survivors
+            else:
+                self.standings.extend(losers)
+                self.standings.extend(survivors)
+                self.winners_bracket = array("q")
+                self.losers_bracket = array("q")
+                self.final_standings = [
+                    self.keys[participant] for participant in reversed(self.standings)
+                ]
+
+    @property
+    def finished(self) -> bool:
+        return self.final_standings is not None
+
+    def pending_matches(self, count: Optional[int] = None) -> List[match_type]:
+        """
+        Returns up to count undecided matches, as (match id, participant, participant), in match id order.
+        None of them depends on the outcome of another, so they can be decided in any order.
+        """
+        pending = []
+        for bracket_round in self.rounds:
+            for index in range(bracket_round.cursor, bracket_round.match_count):
+                if count is not None and len(pending) >= count:
+                    return pending
+                if bracket_round.winners[index] == UNDECIDED:
+                    a, b = bracket_round.pair(index)
+                    match_id = bracket_round.first_match_id + index
+                    pending.append((match_id, self.keys[a], self.keys[b]))
+        return pending
+
+    def submit_result(self, match_id: int, winner: immutable_type):
+        """
+        Decide a pending match. Results can be submitted in any order, the standings do not depend on it.
+        """
+        for bracket_round in self.rounds:
+            index = match_id - bracket_round.first_match_id
+            if 0 <= index < bracket_round.match_count:
+                break
+        else:
+            if 0 <= match_id < self.next_match_id:
+                raise ValueError(f"Match {match_id} was already decided.")
+            raise KeyError(f"Match {match_id} is not scheduled.")
+        if bracket_round.winners[index] != UNDECIDED:
+            raise ValueError(f"Match {match_id} was already decided.")
+        a, b = bracket_round.pair(index)
+        if winner == self.keys[a]:
+            self.decide(bracket_round, index, a)
+        elif winner == self.keys[b]:
+            self.decide(bracket_round, index, b)
+        else:
+            raise ValueError(f"{winner!r} is not in match {match_id}.")
+
+    def decide(self, bracket_round: BracketRound, index: int, winner: int):
+        """
+        Record the winner of an undecided match of a round in play, and fix the next rounds once every match is
+        decided.
+        """
+        bracket_round.decide(index, winner)
+        for listener in self.result_listeners:
+            listener(bracket_round.first_match_id + index, self.keys[winner])
+        self.undecided -= 1
+        replaced = None
+        if self.undecided == 0:
+            replaced = (
+                self.rounds,
+                self.winners_bracket,
+                self.losers_bracket,
+                len(self.standings),
+                self.next_match_id,
+            )
+            self.finish_rounds()
+            self.start_rounds()
+        self.history.append((bracket_round, index, replaced))
+
+    def undo(self) -> Tuple[int, immutable_type]:
+        """
+        Take back the last decision, restoring the tournament to what it was before it without copying brackets.
+        Returns the match id and the winner of the match taken back, which is undecided again.
+        """
+        if not self.history:
+            raise IndexError("There is no decision to undo.")
+        bracket_round, index, replaced = self.history.pop()
+        if replaced is not None:
+            (
+                self.rounds,
+                self.winners_bracket,
+                self.losers_bracket,
+                standings,
+                self.next_match_id,
+            ) = replaced
+            del self.standings[standings:]
+            self.final_standings = None
+            self.undecided = 0
+        winner = bracket_round.winners[index]
+        bracket_round.undecide(index)
+        self.undecided += 1
+        match_id = bracket_round.first_match_id + index
+        for listener in self.undo_listeners:
+            listener(match_id)
+        return match_id, self.keys[winner]
 
     def run_tournament(
         self,
@@ -25,75 +250,28 @@ class DoubleEliminationTournament:
         Generator to run the double elimination tournament. Yields pairs of participants to compete in a match and
         accepts the winner of each match.
         """
-        # Run the tournament until there is only one winner in the winners bracket and one winner in the losers bracket.
-        while len(self.winners_bracket) > 1 or len(self.losers_bracket) > 1:
-            # Losers Bracket, if applicable. the losers bracket will continue more rounds than the winners bracket
-            if len(self.losers_bracket) > 1:
-                for a, b in self.prepare_matches(self.losers_bracket):
-                    if b is None:
-                        winner = a
-                    else:
-                        winner = yield (a, b)
-                    self.process_match_result(
-                        (a, b), winner, self.losers_bracket, self.standings
-                    )
-
-            # Winners Bracket, if applicable. the winners bracket will finish before the losers bracket
-            if len(self.winners_bracket) > 1:
-                for a, b in self.prepare_matches(self.winners_bracket):
-                    if b is None:
-                        winner = a
-                    else:
-                        winner = yield (a, b)
-                    self.process_match_result(
-                        (a, b), winner, self.winners_bracket, self.losers_bracket
-                    )
-
-        # Grand Final
-        if len(self.winners_bracket) == 1 and len(self.losers_bracket) == 1:
-            winners_champion = self.winners_bracket[0]
-            losers_champion = self.losers_bracket[0]
-            final_winner = yield (winners_champion, losers_champion)
-            second_place = (
-                losers_champion
-                if final_winner == winners_champion
-                else winners_champion
-            )
-            self.standings.append(second_place)
-            self.standings.append(final_winner)
-            return list(
-                reversed(self.standings)
-            )  # Final standings can also be yielded or returned.
-        # this is an exception.
-        # this means no grand final was run, and the tournament is over.
-        return list(self.participants.keys())
-
-    def prepare_matches(
-        self, bracket: List[immutable_type]
+        keys = self.keys
+        while not self.finished:
+            for bracket_round in self.rounds:
+                bracket = bracket_round.bracket
+                for index in range(bracket_round.cursor, bracket_round.match_count):
+                    if bracket_round.winners[index] != UNDECIDED:
+                        continue
+                    a = bracket[2 * index]
+                    b = bracket[2 * index + 1]
+                    winner = yield (keys[a], keys[b])
+                    # if the winner is None, it is an usage error
+                    if not winner:
+                        raise ValueError("Winner must be provided via generator send.")
+                    if bracket_round.winners[index] != UNDECIDED:
+                        raise ValueError("Match was decided through submit_result.")
+                    self.decide(bracket_round, index, b if winner == keys[b] else a)
+        return self.final_standings  # Final standings can also be yielded or returned.
+
+    def upcoming_matches(
+        self, count: int
     ) -> List[Tuple[immutable_type, immutable_type]]:
         """
-        Prepare pairs of participants for matches from the given bracket.
+        Returns up to count matches that are already fixed, following the match in play. Byes are skipped.
         """
-        # Adding a bye if the number of participants is odd.
-        if len(bracket) % 2 != 0:
-            bracket.append(None)
-        return [(bracket[i], bracket[i + 1]) for i in range(0, len(bracket), 2)]
-
-    def process_match_result(
-        self,
-        match: Tuple[immutable_type, immutable_type],
-        winner: immutable_type,
-        current_bracket: List[immutable_type],
-        next_bracket: List[immutable_type],
-    ):
-        """
-        Process the match result, updating brackets accordingly.
-        """
-        # if the winner is None, it is an usage error
-        if not winner:
-            raise ValueError("Winner must be provided via generator send.")
-        loser = match[0] if winner == match[1] else match[1]
-        current_bracket.remove(loser)
-        # if it's not a bye, add loser to the next bracket
-        if loser:
-            next_bracket.append(loser)
+        return [(a, b) for _, a, b in self.pending_matches(count + 1)[1:]]
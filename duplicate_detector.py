@@ -0,0 +1,153 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+# side of the grayscale thumbnail every hash is computed from
+THUMBNAIL_SIZE = 32
+# side of the grid of bits of each hash, 8 x 8 = 64 bits
+HASH_SIZE = 8
+METHODS = ("ahash", "dhash", "phash")
+
+
+def load_thumbnail(path: str) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Grayscale THUMBNAIL_SIZE square thumbnail of the image and its pixel count. The thumbnail is None if the image
+    cannot be read.
+    """
+    try:
+        with Image.open(path) as img:
+            pixels = img.size[0] * img.size[1]
+            # JPEGs are decoded at reduced resolution, the thumbnail only needs a few pixels
+            img.draft("L", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            thumbnail = img.convert("L").resize(
+                (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.BOX
+            )
+            return np.asarray(thumbnail, dtype=np.float32), pixels
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, 0
+
+
+def area_matrix(source: int, target: int) -> np.ndarray:
+    """
+    target x source matrix that averages source samples down to target samples, weighted by overlap.
+    """
+    edges = np.linspace(0, source, target + 1)
+    lower = np.maximum(edges[:-1, None], np.arange(source)[None, :])
+    upper = np.minimum(edges[1:, None], np.arange(source)[None, :] + 1)
+    weights = np.clip(upper - lower, 0, None)
+    return (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def dct_matrix(size: int) -> np.ndarray:
+    """
+    Orthonormal DCT-II matrix, so the 2D DCT of x is D @ x @ D.T.
+    """
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] *= np.sqrt(1 / size)
+    matrix[1:] *= np.sqrt(2 / size)
+    return matrix.astype(np.float32)
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """
+    Pack the N x 64 booleans into N 64-bit hashes.
+    """
+    return np.packbits(bits.reshape(len(bits), -1), axis=1).view(">u8")[:, 0]
+
+
+def perceptual_hashes(thumbnails: np.ndarray, method: str = "phash") -> np.ndarray:
+    """
+    64-bit perceptual hashes of the N x THUMBNAIL_SIZE x THUMBNAIL_SIZE thumbnails, all computed at once.
+    """
+    rows = area_matrix(THUMBNAIL_SIZE, HASH_SIZE)
+    if method == "ahash":
+        # is each cell brighter than the image
+        cells = rows @ thumbnails @ rows.T
+        bits = cells > cells.mean(axis=(1, 2), keepdims=True)
+    elif method == "dhash":
+        # is each cell brighter than its right neighbour
+        columns = area_matrix(THUMBNAIL_SIZE, HASH_SIZE + 1)
+        cells = rows @ thumbnails @ columns.T
+        bits = cells[:, :, :-1] > cells[:, :, 1:]
+    elif method == "phash":
+        # is each low frequency above the median of the low frequencies, ignoring the overall brightness
+        dct = dct_matrix(THUMBNAIL_SIZE)
+        frequencies = (dct @ thumbnails @ dct.T)[:, :HASH_SIZE, :HASH_SIZE]
+        flat = frequencies.reshape(len(frequencies), -1)
+        median = np.median(flat[:, 1:], axis=1)
+        bits = flat > median[:, None]
+    else:
+        raise ValueError(f"Unknown hash method {method!r}, expected one of {METHODS}")
+    return pack_bits(bits)
+
+
+def similar_pairs(hashes: Sequence[int], threshold: int) -> List[Tuple[int, int]]:
+    """
+    Index pairs of hashes within threshold bits of each other, found with multi-index hashing: the hashes are split
+    into threshold + 1 chunks, and by the pigeonhole principle similar hashes agree on at least one whole chunk, so
+    only hashes sharing a chunk are compared.
+    """
+    hashes = [int(value) for value in hashes]
+    chunk_count = min(threshold + 1, 64)
+    bounds = [64 * chunk // chunk_count for chunk in range(chunk_count + 1)]
+    pairs = set()
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        mask = (1 << (end - start)) - 1
+        buckets: Dict[int, List[int]] = {}
+        for index, value in enumerate(hashes):
+            buckets.setdefault((value >> start) & mask, []).append(index)
+        for bucket in buckets.values():
+            for i, first in enumerate(bucket):
+                for second in bucket[i + 1 :]:
+                    if (hashes[first] ^ hashes[second]).bit_count() <= threshold:
+                        pairs.add((first, second))
+    return sorted(pairs)
+
+
+def find_duplicates(
+    paths: Sequence[str],
+    threshold: int = 6,
+    method: str = "phash",
+    workers: Optional[int] = None,
+) -> Dict[str, List[str]]:
+    """
+    Cluster near-duplicate images. Returns each cluster's representative, the image with the most pixels, mapped to
+    the other images of the cluster. Images without near-duplicates, or that cannot be read, are left out.
+    """
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        loaded = list(executor.map(load_thumbnail, paths))
+    readable = [
+        index for index, (thumbnail, _) in enumerate(loaded) if thumbnail is not None
+    ]
+    if not readable:
+        return {}
+    thumbnails = np.stack([loaded[index][0] for index in readable])
+    hashes = perceptual_hashes(thumbnails, method)
+
+    # union find over the similar pairs
+    parents = list(range(len(readable)))
+
+    def root(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    for first, second in similar_pairs(hashes, threshold):
+        parents[root(first)] = root(second)
+
+    clusters: Dict[int, List[int]] = {}
+    for index in range(len(readable)):
+        clusters.setdefault(root(index), []).append(readable[index])
+
+    duplicates = {}
+    for members in clusters.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda index: (-loaded[index][1], paths[index]))
+        duplicates[paths[members[0]]] = [paths[index] for index in members[1:]]
+    return duplicates
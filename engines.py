@@ -0,0 +1,43 @@
+from importlib import import_module
+from typing import Any, Dict, Iterator, Mapping
+
+# ranking engines by name, as module and class. each is imported when it is first used, so choosing one does not
+# import what the others depend on, e.g. numpy for the full ranking.
+ENGINE_CLASSES = {
+    "double_elimination": (
+        "double_elimination_tournament",
+        "DoubleEliminationTournament",
+    ),
+    "bradley_terry": ("bradley_terry_ranking", "BradleyTerryRanking"),
+    "sharded": ("sharded_tournament", "ShardedTournament"),
+    "top_k": ("top_k_selection", "TopKSelection"),
+    "insertion": ("insertion_ranking", "InsertionRanking"),
+}
+
+
+class EngineRegistry(Mapping):
+    """
+    Read-only mapping of engine names to engine classes, importing each class on first lookup.
+    """
+
+    def __init__(self, classes: Dict[str, tuple]):
+        self.classes = classes
+        self.loaded: Dict[str, Any] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name not in self.loaded:
+            module, attribute = self.classes[name]
+            self.loaded[name] = getattr(import_module(module), attribute)
+        return self.loaded[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.classes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.classes)
+
+    def __len__(self) -> int:
+        return len(self.classes)
+
+
+ENGINES = EngineRegistry(ENGINE_CLASSES)
@@ -0,0 +1,124 @@
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+IMAGE_EXTENSIONS = frozenset(
+    {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff", ".webp"}
+)
+
+# leading bytes of the image formats in IMAGE_EXTENSIONS, webp also has "WEBP" at offset 8
+IMAGE_SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",
+    b"GIF87a",
+    b"GIF89a",
+    b"BM",
+    b"II*\x00",
+    b"MM\x00*",
+)
+
+
+def has_image_header(path: str) -> bool:
+    """
+    Whether the file starts like one of the supported image formats, without decoding it.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+    except OSError:
+        return False
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return True
+    return header.startswith(IMAGE_SIGNATURES)
+
+
+def scan_images(
+    folder: str,
+    recursive: bool = False,
+    extensions: Iterable[str] = IMAGE_EXTENSIONS,
+    check_headers: bool = True,
+) -> Iterator[str]:
+    """
+    Generator of the image files in the folder, as they are found. Files are filtered by extension and, optionally,
+    by their first bytes. Subfolders that cannot be read are skipped.
+    """
+    extensions = {extension.lower() for extension in extensions}
+    folders = [folder]
+    while folders:
+        current = folders.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            if current == folder:
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            folders.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                if check_headers and not has_image_header(entry.path):
+                    continue
+                yield entry.path
+
+
+class FolderScanner:
+    """
+    Runs scan_images on a background thread, handing the images found to the caller in batches.
+    """
+
+    BATCH_SIZE = 256
+
+    def __init__(self, folder: str, recursive: bool = False):
+        self.folder = folder
+        self.recursive = recursive
+        self.found: "queue.Queue[List[str]]" = queue.Queue()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.error: Optional[OSError] = None
+        self.thread = threading.Thread(target=self.run, name="scan", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        batch = []
+        try:
+            for path in scan_images(self.folder, self.recursive):
+                if self.cancelled.is_set():
+                    return
+                batch.append(path)
+                if len(batch) >= self.BATCH_SIZE:
+                    self.found.put(batch)
+                    batch = []
+        except OSError as e:
+            self.error = e
+        finally:
+            if batch:
+                self.found.put(batch)
+            self.done.set()
+
+    def poll(self) -> Tuple[List[str], bool]:
+        """
+        Returns the images found since the last poll, and whether the scan is over.
+        """
+        # read done first, so no batch put before the scan ended is missed
+        done = self.done.is_set()
+        paths = []
+        while True:
+            try:
+                paths += self.found.get_nowait()
+            except queue.Empty:
+                return paths, done
@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, Iterator, Optional, Set, Tuple
+
+from PIL import Image
+
+# modes Pillow stores in one byte per pixel, every other mode takes four
+ONE_BYTE_MODES = frozenset({"1", "L", "P"})
+# Pillow allocates bitmaps in blocks of this size. Blocks above 32 MB, the most glibc ever serves from its heaps, are
+# always mapped and unmapped on their own, so a freed bitmap goes back to the system instead of staying reserved in
+# the heap of whichever worker thread decoded it.
+BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def bitmap_bytes(size: Tuple[int, int], mode: str) -> int:
+    """
+    Memory Pillow needs for a decoded image of the size and mode.
+    """
+    return size[0] * size[1] * (1 if mode in ONE_BYTE_MODES else 4)
+
+
+class ImagePool:
+    """
+    Keeps decoded renditions and Tk photos within a memory budget, evicting the least recently used first, and bounds
+    the memory of the full size bitmaps decoded at once.
+
+    Entries that are pinned, e.g. the images on screen, are never evicted. Photos must only be made and dropped on
+    the Tk thread, and only the Tk thread adds entries, so that is also where evicted photos are freed.
+    """
+
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # key to (value, size in bytes), least recently used first
+        self.entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self.bytes = 0
+        # keys that must not be evicted, by who pinned them
+        self.pins: Dict[str, Set[Hashable]] = {}
+        self.lock = threading.Lock()
+        # bytes of full size bitmaps being decoded
+        self.decoding = 0
+        self.decoded = threading.Condition()
+        if Image.core.get_block_size() < BLOCK_SIZE:
+            Image.core.set_block_size(BLOCK_SIZE)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def add(self, key: Hashable, value: Any, size: int):
+        """
+        Keep the value, then evict least recently used entries until the pool fits its budget again.
+        """
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            evicted = self.evict()
+        # dropped outside the lock, photos free their Tk image as they are garbage collected
+        del evicted
+
+    def add_image(self, key: Hashable, img: Image.Image):
+        self.add(key, img, bitmap_bytes(img.size, img.mode))
+
+    def evict(self) -> list:
+        """
+        Remove least recently used, unpinned entries while over budget. Returns the removed values.
+        """
+        pinned = set().union(*self.pins.values())
+        evicted = []
+        for key in list(self.entries):
+            if self.bytes <= self.max_bytes:
+                break
+            if key in pinned:
+                continue
+            value, size = self.entries.pop(key)
+            self.bytes -= size
+            evicted.append(value)
+        return evicted
+
+    def discard(self, key: Hashable):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def pin(self, owner: str, keys: Iterable[Hashable]):
+        """
+        Protect the keys from eviction, replacing whatever the owner pinned before.
+        """
+        with self.lock:
+            self.pins[owner] = set(keys)
+            evicted = self.evict()
+        del evicted
+
+    def photo(self, key: Hashable, img: Image.Image):
+        """
+        The Tk photo of the rendition, made once and kept in the pool while the rendition stays the same.
+        """
+        from PIL import ImageTk
+
+        photo_key = ("photo", key)
+        entry = self.get(photo_key)
+        if entry is not None and entry[0] is img:
+            return entry[1]
+        photo = ImageTk.PhotoImage(img)
+        # Tk keeps its own 32 bit copy, and the entry keeps the rendition to compare with
+        size = img.size[0] * img.size[1] * 4 + bitmap_bytes(img.size, img.mode)
+        self.add(photo_key, (img, photo), size)
+        return photo
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[None]:
+        """
+        Wait until a bitmap of size bytes can be decoded within the budget, alongside the ones being decoded already.
+        A bitmap larger than the whole budget is decoded once nothing else is.
+        """
+        with self.decoded:
+            self.decoded.wait_for(
+                lambda: self.decoding == 0 or self.decoding + size <= self.max_bytes
+            )
+            self.decoding += size
+        try:
+            yield
+        finally:
+            with self.decoded:
+                self.decoding -= size
+                self.decoded.notify_all()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.pins.clear()
@@ -0,0 +1,359 @@
+import io
+import os
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from PIL import Image, UnidentifiedImageError
+
+from image_pool import ImagePool, bitmap_bytes
+from latency import NULL_RECORDER, LatencyRecorder, NullRecorder
+from thumbnail_cache import ThumbnailCache
+
+box_type = Tuple[int, int]
+key_type = Tuple[str, box_type]
+recorder_type = Union[LatencyRecorder, NullRecorder]
+
+
+# how much larger than the target size the decoder is asked to produce before the final resize, as in Image.thumbnail
+REDUCING_GAP = 2
+
+
+def fit_size(size: Tuple[int, int], box: box_type) -> Tuple[int, int]:
+    """
+    The largest size with the same aspect ratio as size that fits in the box.
+    """
+    original_width, original_height = size
+    ratio = min(box[0] / original_width, box[1] / original_height)
+    return max(1, int(original_width * ratio)), max(1, int(original_height * ratio))
+
+
+def resize_image(img, max_width, max_height):
+    """
+    Resize the image to fit the given box, while maintaining the aspect ratio.
+    """
+    return img.resize(
+        fit_size(img.size, (max_width, max_height)), Image.Resampling.LANCZOS
+    )
+
+
+def fit_image(
+    img: Image.Image,
+    box: box_type,
+    recorder: recorder_type = NULL_RECORDER,
+    pool: Optional[ImagePool] = None,
+) -> Image.Image:
+    """
+    High quality rendition of an opened, not yet loaded, image that fits the box. The decoded bitmap is freed before
+    returning, and the image cannot be used afterwards. With a pool, decoding waits for room in its budget.
+    """
+    size = fit_size(img.size, box)
+    # formats that support it (JPEG) skip decoding detail that the resize would throw away anyway
+    img.draft(None, (size[0] * REDUCING_GAP, size[1] * REDUCING_GAP))
+    reservation = bitmap_bytes(img.size, img.mode)
+    with pool.reserve(reservation) if pool is not None else nullcontext():
+        with recorder.span("decode"):
+            img.load()
+        with recorder.span("resize"):
+            rendition = img.resize(size, Image.Resampling.LANCZOS)
+        img.close()
+    return rendition
+
+
+def fit_intermediate(
+    img: Image.Image,
+    box: box_type,
+    intermediate_box: box_type,
+    recorder: recorder_type = NULL_RECORDER,
+    pool: Optional[ImagePool] = None,
+) -> Tuple[Image.Image, Image.Image]:
+    """
+    Like fit_image, but also returns an intermediate rendition to resize for other boxes without decoding the file
+    again: the decoded bitmap reduced by a whole factor, to no smaller than what fits intermediate_box.
+    """
+    size = fit_size(img.size, box)
+    largest = fit_size(img.size, intermediate_box)
+    img.draft(
+        None,
+        (
+            max(size[0] * REDUCING_GAP, largest[0]),
+            max(size[1] * REDUCING_GAP, largest[1]),
+        ),
+    )
+    reservation = bitmap_bytes(img.size, img.mode)
+    with pool.reserve(reservation) if pool is not None else nullcontext():
+        with recorder.span("decode"):
+            img.load()
+        with recorder.span("reduce"):
+            factor = max(1, min(img.size[0] // largest[0], img.size[1] // largest[1]))
+            intermediate = img.reduce(factor) if factor > 1 else img.copy()
+        img.close()
+    return resize_intermediate(intermediate, box, recorder), intermediate
+
+
+def resize_intermediate(
+    intermediate: Image.Image, box: box_type, recorder: recorder_type = NULL_RECORDER
+) -> Image.Image:
+    with recorder.span("resize"):
+        return intermediate.resize(
+            fit_size(intermediate.size, box), Image.Resampling.LANCZOS
+        )
+
+
+def serves(intermediate: Image.Image, box: box_type) -> bool:
+    """
+    Whether renditions for the box can be resized from the intermediate, without enlarging it.
+    """
+    size = fit_size(intermediate.size, box)
+    return size[0] <= intermediate.size[0] and size[1] <= intermediate.size[1]
+
+
+def preview_image(img: Image.Image, box: box_type) -> Optional[Image.Image]:
+    """
+    Coarse rendition of an opened, not yet loaded, image that fits the box, decoded at reduced resolution.
+    Returns None if the format cannot be decoded at reduced resolution.
+    """
+    original_size = img.size
+    size = fit_size(original_size, box)
+    img.draft(None, size)
+    if img.size == original_size:
+        return None
+    return img.resize(size, Image.Resampling.BILINEAR)
+
+
+def read_image(path: str, recorder: recorder_type = NULL_RECORDER) -> Image.Image:
+    """
+    Open the image at path, not decoded yet. The file is read whole first, so reading it and decoding it are timed
+    apart.
+    """
+    with recorder.span("read"):
+        with open(path, "rb") as f:
+            data = f.read()
+    try:
+        return Image.open(io.BytesIO(data))
+    except UnidentifiedImageError as e:
+        # it would name the buffer rather than the file
+        raise UnidentifiedImageError(f"cannot identify image file {path!r}") from e
+
+
+def render_image(
+    path: str,
+    box: box_type,
+    recorder: recorder_type = NULL_RECORDER,
+    pool: Optional[ImagePool] = None,
+) -> Image.Image:
+    """
+    Open, decode and resize the image at path to fit the box.
+    """
+    with read_image(path, recorder) as img:
+        return fit_image(img, box, recorder, pool)
+
+
+class ImagePrefetcher:
+    """
+    Decodes and resizes images on a thread pool ahead of time, so they are ready when a match is shown.
+    Renditions are read from and written to the thumbnail cache, if one is given.
+
+    The renditions of the matches on screen and coming up are kept as renders. Once they are no longer retained they
+    move to the image pool, which keeps them while its memory budget allows, in case they come up again.
+
+    With an intermediate box, e.g. the largest the images are shown in, each image decoded is also kept reduced to fit
+    it, the same way, so renditions for another box, after the window is resized, are resized from that instead.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cache: Optional[ThumbnailCache] = None,
+        recorder: recorder_type = NULL_RECORDER,
+        pool: Optional[ImagePool] = None,
+        intermediate_box: Optional[box_type] = None,
+    ):
+        if max_workers is None:
+            max_workers = min(4, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+        self.renders: Dict[key_type, Future] = {}
+        # coarse renditions decoded at reduced resolution, for images asked for without waiting before they were
+        # prefetched
+        self.previews: Dict[key_type, Future] = {}
+        self.cache = cache
+        self.recorder = recorder
+        self.pool = pool if pool is not None else ImagePool()
+        self.intermediate_box = intermediate_box
+        # the intermediates of the images retained, by path. workers add to it, the Tk thread moves them to the pool
+        self.intermediates: Dict[str, Image.Image] = {}
+
+    def intermediate(self, path: str, box: box_type) -> Optional[Image.Image]:
+        """
+        The intermediate of the image, if it was decoded and renditions for the box can be resized from it.
+        """
+        intermediate = self.intermediates.get(path)
+        if intermediate is None:
+            intermediate = self.pool.get(("intermediate", path))
+        if intermediate is not None and serves(intermediate, box):
+            return intermediate
+        return None
+
+    def decode(self, path: str, box: box_type) -> Image.Image:
+        """
+        Render the image from its file, keeping its intermediate.
+        """
+        if self.intermediate_box is None:
+            return render_image(path, box, self.recorder, self.pool)
+        with read_image(path, self.recorder) as source:
+            img, self.intermediates[path] = fit_intermediate(
+                source, box, self.intermediate_box, self.recorder, self.pool
+            )
+        return img
+
+    def render(self, path: str, box: box_type) -> Image.Image:
+        """
+        Render the image, from its intermediate or the thumbnail cache if possible.
+        """
+        intermediate = self.intermediate(path, box)
+        if intermediate is not None:
+            return resize_intermediate(intermediate, box, self.recorder)
+        if self.cache is None:
+            return self.decode(path, box)
+        with self.recorder.span("cache_read"):
+            img = self.cache.get(path, box)
+        if img is None:
+            img = self.decode(path, box)
+            with self.recorder.span("cache_write"):
+                self.cache_put(path, box, img)
+        return img
+
+    def cache_put(self, path: str, box: box_type, img: Image.Image):
+        """
+        Store a rendition in the thumbnail cache. One that cannot be stored, e.g. the disk is full, is still shown.
+        """
+        try:
+            self.cache.put(path, box, img)
+        except (OSError, ValueError, sqlite3.Error):
+            pass
+
+    def store(self, path: str, box: box_type, img: Image.Image):
+        """
+        Keep a rendition that was made outside the thread pool.
+        """
+        future = Future()
+        future.set_result(img)
+        self.renders[(path, box)] = future
+
+    def prefetch(self, paths: Iterable[str], box: box_type):
+        """
+        Start rendering the given images in the background, in order.
+        """
+        for path in paths:
+            key = (path, box)
+            if key in self.renders:
+                continue
+            img = self.pool.get(key)
+            if img is not None:
+                self.store(path, box, img)
+            else:
+                self.renders[key] = self.executor.submit(self.render, path, box)
+
+    def ready(self, path: str, box: box_type) -> Optional[Image.Image]:
+        """
+        Returns the rendered image if it is done, otherwise None, also if it could not be rendered.
+        """
+        future = self.renders.get((path, box))
+        if future is not None and future.done() and future.exception() is None:
+            return future.result()
+        return None
+
+    def failure(self, path: str, box: box_type) -> Optional[BaseException]:
+        """
+        Returns why the image could not be rendered, if its render failed, otherwise None.
+        """
+        future = self.renders.get((path, box))
+        if future is not None and future.done():
+            return future.exception()
+        return None
+
+    def preview(self, path: str, box: box_type) -> Optional[Image.Image]:
+        """
+        Coarse rendition of the image decoded at reduced resolution, or None if its format cannot be.
+        """
+        with Image.open(path) as source:
+            with self.recorder.span("preview"):
+                return preview_image(source, box)
+
+    def ready_preview(self, path: str, box: box_type) -> Optional[Image.Image]:
+        """
+        Returns the preview of the image if it is decoded, otherwise None.
+        """
+        future = self.previews.get((path, box))
+        if future is not None and future.done() and future.exception() is None:
+            return future.result()
+        return None
+
+    def get_progressive(
+        self, path: str, box: box_type
+    ) -> Tuple[Optional[Image.Image], bool]:
+        """
+        Returns the rendered image if it is ready, otherwise a coarse preview while the rendered image is finished in
+        the background. The flag is True when the returned image is the final rendition.
+
+        Nothing is read from disk or decoded on the calling thread, e.g. the Tk thread: the preview is only made from
+        an intermediate, and None is returned if there is none. The preview is then decoded in the background, ahead
+        of the rendition, for ready_preview.
+        """
+        img = self.ready(path, box)
+        if img is not None:
+            return img, True
+        key = (path, box)
+        if key not in self.renders:
+            img = self.pool.get(key)
+            if img is not None:
+                self.store(path, box, img)
+                return img, True
+        intermediate = self.intermediate(path, box)
+        if intermediate is not None:
+            # e.g. the window was resized, the rendition for the new box is finished from it in the background
+            with self.recorder.span("preview"):
+                preview = intermediate.resize(
+                    fit_size(intermediate.size, box), Image.Resampling.BILINEAR
+                )
+            self.prefetch([path], box)
+            return preview, False
+        if key not in self.renders and key not in self.previews:
+            self.previews[key] = self.executor.submit(self.preview, path, box)
+        self.prefetch([path], box)
+        return None, False
+
+    def retain(self, paths: Iterable[str], box: box_type):
+        """
+        Move every render that is not one of the given images at the given box to the pool, cancelling it if not
+        finished yet, and the intermediates of other images.
+        """
+        paths = set(paths)
+        for path in list(self.intermediates):
+            if path not in paths:
+                self.pool.add_image(
+                    ("intermediate", path), self.intermediates.pop(path)
+                )
+        keep = {(path, box) for path in paths}
+        for key in list(self.previews):
+            if key not in keep:
+                self.previews.pop(key).cancel()
+        for key in list(self.renders):
+            if key not in keep:
+                future = self.renders.pop(key)
+                if not future.done() or future.cancelled():
+                    future.cancel()
+                elif future.exception() is None:
+                    self.pool.add_image(key, future.result())
+
+    def shutdown(self):
+        """
+        Stop the worker threads, dropping renders that have not started.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.renders.clear()
+        self.previews.clear()
+        self.intermediates.clear()
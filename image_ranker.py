@@ -1,16 +1,44 @@
+import argparse
 import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from pathlib import Path
-from tkinter import TOP, Button, Label, Tk, filedialog
-from typing import Optional
-
-from PIL import Image, ImageTk
+from tkinter import (
+    TOP,
+    BooleanVar,
+    Button,
+    Checkbutton,
+    Label,
+    StringVar,
+    Tk,
+    filedialog,
+    ttk,
+)
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
 
 from double_elimination_tournament import DoubleEliminationTournament
+from engines import ENGINES
+from folder_scanner import FolderScanner
+from image_pool import ImagePool
+from image_prefetcher import ImagePrefetcher, resize_image
+from insertion_ranking import read_standings, write_standings
+from latency import LatencyRecorder, profiled
+from match_journal import MatchJournal
+from preference_graph import InferringTournament, PreferenceStore
+from thumbnail_cache import ThumbnailCache, default_cache_dir
+
+if TYPE_CHECKING:
+    from PIL import Image, ImageTk
+
+    from prerenderer import Prerenderer
 
 
 class ImageRanker:
     """
-    Tkinter application to rank images in a double elimination tournament.
+    Tkinter application to rank images by picking the winner of each match between two of them.
     """
 
     # modes are used to show and hide parts of the UI
@@ -25,8 +53,90 @@ class ImageRanker:
         SHOW_STANDINGS,
     }
 
-    def __init__(self, root, setup_ui=True):
+    # names of the ranking engines to choose from, by the label shown for them. the engine is only imported once a
+    # tournament is started with it, so the window opens without e.g. numpy for the full ranking
+    ENGINES = {
+        "Double elimination, best first": "double_elimination",
+        "Full ranking, fewest decisions": "bradley_terry",
+        "Sharded by folder, best of each to a final": "sharded",
+        "Best 10 only, fewest decisions": "top_k",
+        "New images into the last ranking": "insertion",
+    }
+    # engines whose standings are in order all the way down, the only ones new images can be inserted into later. the
+    # sharded tournament's are not: below the final, images of different shards were never compared
+    FULL_ORDER_ENGINES = {"double_elimination", "bradley_terry", "insertion"}
+
+    # how many upcoming matches to decode ahead of the one on screen
+    PREFETCH_MATCHES = 4
+    # how often to check whether the final renditions replacing the previews are ready
+    REFINE_INTERVAL_MS = 20
+    # how often to collect the images found by the folder scan
+    SCAN_POLL_MS = 50
+    # how often to update the progress of pre-rendering
+    PRERENDER_POLL_MS = 250
+    # how long the window must keep its size before the images are rendered for it
+    RESIZE_DEBOUNCE_MS = 150
+
+    def __init__(
+        self,
+        root,
+        setup_ui=True,
+        thumbnail_cache: Optional[ThumbnailCache] = None,
+        journal_dir: Optional[os.PathLike] = None,
+        engine_name: str = DoubleEliminationTournament.NAME,
+        memory_budget: int = ImagePool.DEFAULT_MAX_BYTES,
+        prerender_workers: Optional[int] = None,
+        preferences: Optional[PreferenceStore] = None,
+        standings_dir: Optional[os.PathLike] = None,
+        confidence: Optional[float] = None,
+    ):
         self.root = root
+        self.tournament: Optional[Any] = None
+        # the ranking engine selected when the UI is set up
+        self.engine_name = engine_name
+        # the confidence the full ranking stops at, its own default if None
+        self.confidence = confidence
+        # how long each stage of showing a match takes, and each decision
+        self.latency = LatencyRecorder()
+        self.match_shown_at: Optional[float] = None
+        # when the match being shown was asked for, until its images are on screen
+        self.match_requested_at: Optional[float] = None
+        # the id of the match being shown, and of the match whose images are on screen, the one decisions are about
+        self.match_id: Optional[int] = None
+        self.shown_match: Optional[int] = None
+        # (match id, winner) of the decisions made and not taken yet, in order, and the idle callback taking them
+        self.decisions: Deque[Tuple[int, str]] = deque()
+        self.deciding: Optional[str] = None
+        # every decoded rendition and Tk photo is kept within the memory budget here
+        self.pool = ImagePool(memory_budget)
+        self.prefetcher = ImagePrefetcher(
+            cache=thumbnail_cache,
+            recorder=self.latency,
+            pool=self.pool,
+            intermediate_box=self.screen_box(),
+        )
+        # the box the images on screen were rendered for
+        self.box: Optional[Tuple[int, int]] = None
+        # the pending render for a new window size, until the window stops changing
+        self.resize_after: Optional[str] = None
+        # renders every image into the thumbnail cache at the start of a tournament, if asked to
+        self.prerenderer: Optional["Prerenderer"] = None
+        self.prerender_workers = prerender_workers
+        # every decision is journaled here, so an interrupted tournament resumes when its folder is picked again
+        self.journal_dir = journal_dir
+        self.journal: Optional[MatchJournal] = None
+        # every judgment is remembered here, and matches whose result follows from earlier ones are not shown
+        self.preferences = preferences
+        # the standings of every folder ranked, so new images can be inserted into them later
+        self.standings_dir = standings_dir
+        self.scanner: Optional[FolderScanner] = None
+        self.images = set()
+        # representative image to the near-duplicates of it that were left out of the tournament
+        self.duplicates: Dict[str, List[str]] = {}
+        # for work that is neither image rendering nor folder scanning
+        self.background = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="background"
+        )
         if setup_ui:
             self.setup_ui()
 
@@ -47,9 +157,51 @@ class ImageRanker:
             self.root, text="Select Folder", command=self.select_folder
         )
 
-        # label to show the selected folder
+        # whether to look for images in subfolders too
+        self.recursive = BooleanVar(self.root, value=False)
+        self.recursive_checkbutton = Checkbutton(
+            self.root, text="Include subfolders", variable=self.recursive
+        )
+
+        # whether only one image of each group of near-duplicates enters the tournament
+        self.collapse_duplicates = BooleanVar(self.root, value=False)
+        self.collapse_duplicates_checkbutton = Checkbutton(
+            self.root,
+            text="Set aside near-duplicates",
+            variable=self.collapse_duplicates,
+        )
+
+        # label to show the selected folder and how many images were found in it
         self.folder_label = Label(self.root, text="")
 
+        # busy indicator while the folder is scanned
+        self.scan_progress = ttk.Progressbar(self.root, mode="indeterminate")
+
+        # which engine runs the tournament
+        self.engine = StringVar(
+            self.root,
+            value=next(
+                label
+                for label, name in self.ENGINES.items()
+                if name == self.engine_name
+            ),
+        )
+        self.engine_combobox = ttk.Combobox(
+            self.root,
+            textvariable=self.engine,
+            values=list(self.ENGINES),
+            state="readonly",
+        )
+
+        # whether every image is rendered into the thumbnail cache on all cores when the tournament starts
+        self.prerender = BooleanVar(self.root, value=False)
+        self.prerender_checkbutton = Checkbutton(
+            self.root,
+            text="Pre-render all images",
+            variable=self.prerender,
+            state="disabled" if self.prefetcher.cache is None else "normal",
+        )
+
         # button to start the tournament
         self.start_tournament_button = Button(
             self.root,
@@ -61,19 +213,49 @@ class ImageRanker:
         # show the images
         self.image1_name: str = None
         self.image2_name: str = None
-        self.image1: Image = None
-        self.image2: Image = None
-        self.image1_tk: ImageTk = None
-        self.image2_tk: ImageTk = None
+        self.image1: Optional["Image.Image"] = None
+        self.image2: Optional["Image.Image"] = None
+        self.image1_tk: Optional["ImageTk.PhotoImage"] = None
+        self.image2_tk: Optional["ImageTk.PhotoImage"] = None
+        # why an image of the match could not be rendered, shown in its place
+        self.image1_error: Optional[str] = None
+        self.image2_error: Optional[str] = None
         self.image1_label = Label(self.root, image=self.image1_tk, text="Image 1")
         self.image2_label = Label(self.root, image=self.image2_tk, text="Image 2")
 
         # buttons to select the winner
         self.image1_button = Button(
-            self.root, text="Select Image 1", command=self.select_image1
+            self.root, text="Select Image 1 (Left)", command=self.select_image1
         )
         self.image2_button = Button(
-            self.root, text="Select Image 2", command=self.select_image2
+            self.root, text="Select Image 2 (Right)", command=self.select_image2
+        )
+        # keys to pick the winner without reaching for the mouse
+        for key in ("<Left>", "1"):
+            self.root.bind(key, self.select_image1)
+        for key in ("<Right>", "2"):
+            self.root.bind(key, self.select_image2)
+
+        # buttons to take decisions back and make them again
+        self.undo_button = Button(
+            self.root, text="Undo (Ctrl+Z)", command=self.undo, state="disabled"
+        )
+        self.redo_button = Button(
+            self.root, text="Redo (Ctrl+Y)", command=self.redo, state="disabled"
+        )
+        # (match id, winner) of the decisions taken back, the last one on top
+        self.redo_stack: List[Tuple[int, Any]] = []
+        # the match shown before the one on screen, kept rendered so stepping back to it is instant
+        self.previous_match: Tuple[Optional[str], Optional[str]] = (None, None)
+        self.root.bind("<Control-z>", self.undo)
+        self.root.bind("<Control-y>", self.redo)
+        self.root.bind("<Control-Shift-Z>", self.redo)
+        self.root.bind("<Configure>", self.window_configured)
+
+        # progress of pre-rendering, while judging
+        self.prerender_progress = ttk.Progressbar(self.root, mode="determinate")
+        self.prerender_button = Button(
+            self.root, text="Stop pre-rendering", command=self.cancel_prerender
         )
 
         # the list of standings at the end of the tournament
@@ -88,6 +270,7 @@ class ImageRanker:
         self.update_ui()
 
     def update_ui(self):
+        start = time.perf_counter()
         # clear all grids before updating
         for widget in self.root.winfo_children():
             widget.grid_remove()
@@ -98,45 +281,168 @@ class ImageRanker:
                 self.select_folder_button.grid(
                     row=1, column=0, columnspan=2, sticky="ew"
                 )
-                self.folder_label.grid(row=2, column=0, columnspan=2, sticky="ew")
+                self.recursive_checkbutton.grid(row=2, column=0)
+                self.collapse_duplicates_checkbutton.grid(row=2, column=1)
+                self.folder_label.grid(row=3, column=0, columnspan=2, sticky="ew")
+                self.scan_progress.grid(row=4, column=0, columnspan=2, sticky="ew")
+                self.engine_combobox.grid(row=5, column=0, columnspan=2, sticky="ew")
+                self.prerender_checkbutton.grid(row=6, column=0, columnspan=2)
                 self.start_tournament_button.grid(
-                    row=3, column=0, columnspan=2, sticky="ew"
+                    row=7, column=0, columnspan=2, sticky="ew"
                 )
             case self.PICK_WINNER:
                 self.image1_label.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
                 self.image2_label.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
                 self.image1_button.grid(row=1, column=0, sticky="ew")
                 self.image2_button.grid(row=1, column=1, sticky="ew")
+                self.undo_button.grid(row=2, column=0, sticky="ew")
+                self.redo_button.grid(row=2, column=1, sticky="ew")
+                if self.prerenderer is not None:
+                    self.prerender_progress.grid(row=3, column=0, sticky="ew")
+                    self.prerender_button.grid(row=3, column=1, sticky="ew")
             case self.SHOW_STANDINGS:
                 self.standings_text.grid(row=0, column=0, columnspan=2, sticky="nsew")
                 self.copy_button.grid(row=1, column=0, columnspan=2, sticky="ew")
-                self.standings_text.config(
-                    text="Click to copy final standings to clipboard:\n"
-                )
+                text = "Click to copy final standings to clipboard:\n"
+                set_aside = sum(len(others) for others in self.duplicates.values())
+                if set_aside:
+                    text += f"{set_aside} near-duplicates set aside are listed after the image ranked of their group\n"
+                self.standings_text.config(text=text)
+        self.latency.record("layout", time.perf_counter() - start)
 
     def select_folder(self):
         """
-        Select a folder containing images.
+        Select a folder containing images. The folder is scanned in the background, the images found are
+        collected by poll_scan.
         """
         folder = filedialog.askdirectory()
-        folder_path = Path(folder)
-        self.folder_label.config(text=str(folder_path))
-        # Use pathlib for path operations
-        self.images = {str(folder_path / file) for file in os.listdir(folder)}
+        if not folder:
+            return
+        if self.scanner is not None:
+            self.scanner.cancel()
+        self.folder = folder
+        self.folder_label.config(text=str(Path(folder)))
+        self.images = set()
+        self.duplicates = {}
+        self.start_tournament_button.config(state="disabled")
+        self.scanner = FolderScanner(folder, recursive=self.recursive.get())
+        self.scanner.start()
+        self.scan_progress.start()
+        self.root.after(self.SCAN_POLL_MS, self.poll_scan, self.scanner)
+
+    def poll_scan(self, scanner: FolderScanner):
+        """
+        Collect the images found by the folder scan so far, and show how many there are.
+        """
+        if scanner is not self.scanner:
+            # another folder was picked since
+            return
+        paths, done = scanner.poll()
+        self.images.update(paths)
+        folder = str(Path(scanner.folder))
+        if not done:
+            self.folder_label.config(
+                text=f"{folder}\nScanning, {len(self.images)} images found so far"
+            )
+            self.root.after(self.SCAN_POLL_MS, self.poll_scan, scanner)
+            return
+        if scanner.error is not None:
+            self.images_ready(f"{folder}\n{scanner.error}")
+        elif self.collapse_duplicates.get() and len(self.images) > 1:
+            from duplicate_detector import find_duplicates
+
+            self.folder_label.config(
+                text=f"{folder}\nLooking for near-duplicates among {len(self.images)} images"
+            )
+            future = self.background.submit(find_duplicates, sorted(self.images))
+            self.root.after(self.SCAN_POLL_MS, self.poll_duplicates, scanner, future)
+        else:
+            self.images_ready(f"{folder}\n{len(self.images)} images")
+
+    def poll_duplicates(self, scanner: FolderScanner, future: Future):
+        """
+        Once the near-duplicates are found, keep only one image of each group in the tournament.
+        """
+        if scanner is not self.scanner:
+            return
+        if not future.done():
+            self.root.after(self.SCAN_POLL_MS, self.poll_duplicates, scanner, future)
+            return
+        self.duplicates = future.result()
+        for others in self.duplicates.values():
+            self.images.difference_update(others)
+        set_aside = sum(len(others) for others in self.duplicates.values())
+        self.images_ready(
+            f"{Path(scanner.folder)}\n{len(self.images)} images, {set_aside} near-duplicates set aside"
+        )
+
+    def images_ready(self, text: str):
+        """
+        The images to rank are known, allow starting the tournament if there are any.
+        """
+        self.scan_progress.stop()
+        self.folder_label.config(text=text)
         if self.images:
             self.start_tournament_button.config(state="normal")
 
-    @staticmethod
-    def resize_image(img, max_width, max_height):
-        original_width, original_height = img.size
-        ratio = min(max_width / original_width, max_height / original_height)
-        new_width = int(original_width * ratio)
-        new_height = int(original_height * ratio)
-        return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    resize_image = staticmethod(resize_image)
+
+    def image_box(self):
+        """
+        The box each image is resized to fit, half the window wide.
+        """
+        max_width = max(1, self.root.winfo_width() // 2)
+        max_height = max(1, int(self.root.winfo_height() * 0.90))
+        return max_width, max_height
+
+    def screen_box(self):
+        """
+        The largest box an image is shown in, with the window maximized.
+        """
+        return (
+            max(1, self.root.winfo_screenwidth() // 2),
+            max(1, int(self.root.winfo_screenheight() * 0.90)),
+        )
+
+    def window_configured(self, event):
+        """
+        Render the images for the new window size once it stops changing, e.g. at the end of a drag.
+        """
+        if event.widget is not self.root:
+            # every widget of the window reports its own changes here too
+            return
+        if self.resize_after is not None:
+            self.root.after_cancel(self.resize_after)
+        self.resize_after = self.root.after(
+            self.RESIZE_DEBOUNCE_MS, self.window_resized
+        )
+
+    def window_resized(self):
+        """
+        Render the match on screen for the new window size, from the images already decoded.
+        """
+        self.resize_after = None
+        if self.mode != self.PICK_WINNER or self.image1_name is None:
+            return
+        if self.image_box() != self.box:
+            self.fit_images()
+
+    def prefetch_upcoming(self, box):
+        """
+        Decode and resize the images of the next few matches in the background.
+        """
+        paths = [self.image1_name, self.image2_name]
+        if self.tournament is not None:
+            for a, b in self.tournament.upcoming_matches(self.PREFETCH_MATCHES):
+                paths += [a, b]
+        paths += [path for path in self.previous_match if path is not None]
+        self.prefetcher.retain(paths, box)
+        self.prefetcher.prefetch(paths, box)
 
     def update_images(self, image1, image2):
         """
-        Open the images and update the UI.
+        Show the images of a match, as far as they are rendered, and the rest once they are. Nothing is decoded here,
+        so the window never waits on it.
         """
         if image1 is None or image2 is None:
             print("image1 or image2 is None, unexpectedly.", image1, image2)
@@ -147,74 +453,339 @@ class ImageRanker:
             self.image2_button.config(state="disabled")
             return
 
+        start = time.perf_counter()
+        if (image1, image2) != (self.image1_name, self.image2_name):
+            self.previous_match = (self.image1_name, self.image2_name)
         self.image1_name = image1
         self.image2_name = image2
-        self.image1 = Image.open(image1)
-        self.image2 = Image.open(image2)
+        self.image1_error = None
+        self.image2_error = None
+        self.shown_match = None
+        self.match_requested_at = start
+        self.fit_images()
 
-        # Resize the images  to fit the window, while maintaining the aspect ratio
-        max_width = max(1, self.root.winfo_width() // 2)
-        max_height = max(1, self.root.winfo_height() * 0.90)
+    def fit_images(self):
+        """
+        Show the images of the match resized to fit the window, while maintaining the aspect ratio.
+        """
+        # usually they were already decoded and resized in the background. if not, a coarse preview is shown if one
+        # can be resized from an image already decoded, otherwise one is decoded at reduced resolution in the
+        # background and shown by refine_images, as is the final rendition once it is ready
+        image1, image2 = self.image1_name, self.image2_name
+        box = self.box = self.image_box()
+        with self.latency.span("fetch"):
+            self.image1, image1_final = self.prefetcher.get_progressive(image1, box)
+            self.image2, image2_final = self.prefetcher.get_progressive(image2, box)
+        self.show_images()
+        with self.latency.span("prefetch"):
+            self.prefetch_upcoming(box)
+        if not (image1_final and image2_final):
+            self.root.after(
+                self.REFINE_INTERVAL_MS, self.refine_images, image1, image2, box
+            )
+
+    def refine_images(self, image1, image2, box):
+        """
+        Replace previews with the final renditions as they become ready, while the match is still shown at the box.
+        An image not shown at all yet is shown as soon as its preview is decoded, if it comes before the rendition.
+        An image that could not be rendered, e.g. a truncated file, is replaced by why, and the match can be decided.
+        """
+        if (image1, image2, box) != (self.image1_name, self.image2_name, self.box):
+            return
+        ready1 = self.prefetcher.ready(image1, box)
+        ready2 = self.prefetcher.ready(image2, box)
+        failure1 = self.prefetcher.failure(image1, box)
+        failure2 = self.prefetcher.failure(image2, box)
+        changed = False
+        if failure1 is not None and self.image1_error is None:
+            self.image1_error = str(failure1) or type(failure1).__name__
+            changed = True
+        if failure2 is not None and self.image2_error is None:
+            self.image2_error = str(failure2) or type(failure2).__name__
+            changed = True
+        if ready1 is not None and ready1 is not self.image1:
+            self.image1 = ready1
+            changed = True
+        elif ready1 is None and self.image1 is None:
+            self.image1 = self.prefetcher.ready_preview(image1, box)
+            changed = self.image1 is not None
+        if ready2 is not None and ready2 is not self.image2:
+            self.image2 = ready2
+            changed = True
+        elif ready2 is None and self.image2 is None:
+            self.image2 = self.prefetcher.ready_preview(image2, box)
+            changed = changed or self.image2 is not None
+        if changed:
+            self.show_images()
+        if (ready1 is None and failure1 is None) or (
+            ready2 is None and failure2 is None
+        ):
+            self.root.after(
+                self.REFINE_INTERVAL_MS, self.refine_images, image1, image2, box
+            )
+
+    def match_on_screen(self, start: float):
+        """
+        The match is drawn, the decision starts now.
+        """
+        self.match_shown_at = time.perf_counter()
+        self.latency.record("on_screen", self.match_shown_at - start)
 
-        self.image1 = self.resize_image(self.image1, max_width, max_height)
-        self.image2 = self.resize_image(self.image2, max_width, max_height)
+    def match_decided(self):
+        """
+        Record how long the decision on the match on screen took.
+        """
+        if self.match_shown_at is not None:
+            self.latency.record("decision", time.perf_counter() - self.match_shown_at)
+            self.match_shown_at = None
 
-        self.image1_tk = ImageTk.PhotoImage(self.image1)
-        self.image2_tk = ImageTk.PhotoImage(self.image2)
+    def show_images(self):
+        """
+        Show the current images in the image labels.
+        """
+        # a photo for each box, so the match shown again after a resize back or in a rematch is not converted again
+        key1 = (self.image1_name, self.box)
+        key2 = (self.image2_name, self.box)
+        # the photos on screen must outlive any eviction, Tk would show blank labels otherwise
+        self.pool.pin("shown", [("photo", key1), ("photo", key2)])
+        # an image not rendered yet is left blank
+        with self.latency.span("photo"):
+            self.image1_tk = (
+                self.pool.photo(key1, self.image1) if self.image1 is not None else ""
+            )
+            self.image2_tk = (
+                self.pool.photo(key2, self.image2) if self.image2 is not None else ""
+            )
+        text1 = os.path.basename(self.image1_name)
+        text2 = os.path.basename(self.image2_name)
+        if self.image1_error is not None:
+            text1 += f"\n{self.image1_error}"
+        if self.image2_error is not None:
+            text2 += f"\n{self.image2_error}"
         self.image1_label.config(
             image=self.image1_tk,
-            text=os.path.basename(self.image1_name),
+            text=text1,
             compound="top",
             anchor="center",
             state="normal",
         )
         self.image2_label.config(
             image=self.image2_tk,
-            text=os.path.basename(self.image2_name),
+            text=text2,
             compound="top",
             anchor="center",
             state="normal",
         )
+        # an image that could not be rendered is shown as the reason, so the match can still be decided
+        shown = (self.image1 is not None or self.image1_error is not None) and (
+            self.image2 is not None or self.image2_error is not None
+        )
+        self.image1_button.config(state="normal" if shown else "disabled")
+        self.image2_button.config(state="normal" if shown else "disabled")
+        if shown and self.match_requested_at is not None:
+            self.shown_match = self.match_id
+            # idle callbacks run after Tk has laid out and redrawn the window
+            self.root.after_idle(self.match_on_screen, self.match_requested_at)
+            self.match_requested_at = None
 
     def start_tournament(self):
         """
-        Start the tournament.
+        Start the tournament, with the selected engine.
         """
-        self.tournament = DoubleEliminationTournament(self.images)
-        self.gen = self.tournament.run_tournament()
+        name = self.ENGINES[self.engine.get()]
+        engine = ENGINES[name]
+        if name == "insertion" and self.standings_dir is not None:
+            engine = partial(
+                engine, ranked=read_standings(self.standings_dir, self.folder)
+            )
+        elif name == "bradley_terry" and self.confidence is not None:
+            engine = partial(engine, confidence=self.confidence)
+        create = engine
+        if self.preferences is not None:
+            create = InferringTournament.wrap(engine, self.preferences)
+        if self.journal_dir is not None:
+            self.journal = MatchJournal(
+                MatchJournal.path_for(self.journal_dir, self.folder, name)
+            )
+            self.tournament = self.journal.open_tournament(self.images, create)
+        else:
+            self.tournament = create(self.images)
+        self.redo_stack = []
+        self.cancel_prerender()
+        if self.prerender.get() and self.prefetcher.cache is not None:
+            self.start_prerender()
         self.mode = self.PICK_WINNER
         self.update_ui()
-        try:
-            (image1, image2) = next(self.gen)
-            self.update_images(image1, image2)
-        except StopIteration as e:
-            self.final_standings = e.value
-            self.mode = self.SHOW_STANDINGS
-            self.update_ui()
+        self.decisions.clear()
+        self.show_next_match()
 
-    def select_image1(self):
+    def show_next_match(self):
+        """
+        Show the next match of the tournament, or the standings once it is finished.
+        """
+        self.update_history_buttons()
+        pending = self.tournament.pending_matches(1)
+        if not pending:
+            self.match_id = None
+            self.end_tournament(self.tournament.final_standings)
+            return
+        ((self.match_id, image1, image2),) = pending
+        self.update_images(image1, image2)
+
+    def update_history_buttons(self):
+        """
+        Enable undo and redo when there is a decision to take back or to make again.
+        """
+        can_undo = self.tournament is not None and self.tournament.history
+        self.undo_button.config(state="normal" if can_undo else "disabled")
+        self.redo_button.config(state="normal" if self.redo_stack else "disabled")
+
+    def undo(self, event=None):
+        """
+        Take back the last decision and show its match again.
+        """
+        if self.mode != self.PICK_WINNER or not self.tournament.history:
+            return
+        self.match_shown_at = None
+        self.decisions.clear()
+        self.redo_stack.append(self.tournament.undo())
+        self.show_next_match()
+
+    def redo(self, event=None):
+        """
+        Make the last decision taken back again.
+        """
+        if self.mode != self.PICK_WINNER or not self.redo_stack:
+            return
+        self.match_shown_at = None
+        match_id, winner = self.redo_stack.pop()
+        self.decisions.clear()
+        self.tournament.submit_result(match_id, winner)
+        self.show_next_match()
+
+    def start_prerender(self):
+        """
+        Render every image of the tournament into the thumbnail cache in the background, starting with those of the
+        matches fixed first.
+        """
+        first = [
+            path
+            for _, image1, image2 in self.tournament.pending_matches()
+            for path in (image1, image2)
+        ]
+        paths = list(dict.fromkeys(first + list(self.tournament.keys)))
+        from prerenderer import Prerenderer
+
+        self.prerenderer = Prerenderer(
+            paths, self.image_box(), self.prefetcher.cache, self.prerender_workers
+        )
+        self.prerenderer.start()
+        self.prerender_progress.config(maximum=len(paths), value=0)
+        self.root.after(self.PRERENDER_POLL_MS, self.poll_prerender, self.prerenderer)
+
+    def poll_prerender(self, prerenderer: "Prerenderer"):
+        """
+        Show how many images are pre-rendered, until all of them are.
+        """
+        if prerenderer is not self.prerenderer:
+            # cancelled since
+            return
+        completed, total = prerenderer.progress()
+        self.prerender_progress.config(value=completed)
+        self.prerender_button.config(
+            text=f"Stop pre-rendering, {completed} of {total} done"
+        )
+        if prerenderer.done.is_set():
+            self.prerenderer = None
+            self.prerender_progress.grid_remove()
+            self.prerender_button.grid_remove()
+        else:
+            self.root.after(self.PRERENDER_POLL_MS, self.poll_prerender, prerenderer)
+
+    def cancel_prerender(self):
+        """
+        Stop pre-rendering, the images left are rendered when their matches come up.
+        """
+        if self.prerenderer is None:
+            return
+        self.prerenderer.cancel()
+        self.prerenderer = None
+        self.prerender_progress.grid_remove()
+        self.prerender_button.grid_remove()
+
+    def select_image1(self, event=None):
         """
         Select image 1 as the winner.
         """
-        try:
-            (image1, image2) = self.gen.send(self.image1_name)
-            self.update_images(image1, image2)
-        except StopIteration as e:
-            self.final_standings = e.value
-            self.mode = self.SHOW_STANDINGS
-            self.update_ui()
+        self.queue_decision(self.image1_name)
 
-    def select_image2(self):
+    def select_image2(self, event=None):
         """
         Select image 2 as the winner.
         """
-        try:
-            (image1, image2) = self.gen.send(self.image2_name)
-            self.update_images(image1, image2)
-        except StopIteration as e:
-            self.final_standings = e.value
-            self.mode = self.SHOW_STANDINGS
-            self.update_ui()
+        self.queue_decision(self.image2_name)
+
+    def queue_decision(self, winner: str):
+        """
+        Queue the decision on the match on screen, to be taken once Tk is idle, so a click or key press is handled at
+        once however fast they come. Nothing is decided while the images of the match are not on screen yet.
+        """
+        if self.mode != self.PICK_WINNER or self.shown_match is None:
+            return
+        self.match_decided()
+        self.decisions.append((self.shown_match, winner))
+        if self.deciding is None:
+            self.deciding = self.root.after_idle(self.take_decisions)
+
+    def take_decisions(self):
+        """
+        Take the queued decisions in order. A decision on a match that is no longer the one shown, e.g. a second
+        click before the next match was shown, is dropped rather than deciding a match that was never seen.
+        """
+        self.deciding = None
+        while self.decisions:
+            match_id, winner = self.decisions.popleft()
+            if match_id != self.match_id:
+                continue
+            self.redo_stack.clear()
+            self.tournament.submit_result(match_id, winner)
+            self.show_next_match()
+
+    def end_tournament(self, standings):
+        """
+        Show the final standings, and keep them for new images to be inserted into. The journal is no longer needed.
+        The near-duplicates set aside follow the image of their group that was ranked.
+        """
+        self.final_standings = [
+            image
+            for ranked in standings
+            for image in [ranked, *self.duplicates.get(ranked, [])]
+        ]
+        if (
+            self.standings_dir is not None
+            and self.tournament.NAME in self.FULL_ORDER_ENGINES
+        ):
+            write_standings(self.standings_dir, self.folder, self.final_standings)
+        self.cancel_prerender()
+        self.mode = self.SHOW_STANDINGS
+        self.update_ui()
+        if self.journal is not None:
+            self.journal.discard()
+            self.journal = None
+
+    def close(self):
+        """
+        Stop background work and close files, when the window is closed.
+        """
+        if self.prerenderer is not None:
+            self.prerenderer.cancel()
+        self.prefetcher.shutdown()
+        self.pool.clear()
+        self.background.shutdown(wait=False, cancel_futures=True)
+        if self.scanner is not None:
+            self.scanner.cancel()
+        if self.journal is not None:
+            self.journal.close()
 
     def copy(self):
         """
@@ -228,10 +799,93 @@ class ImageRanker:
         self.standings_text.config(text="Copied to clipboard!")
 
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rank a folder of images.")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=ThumbnailCache.DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="size limit of the thumbnail cache in MB, 0 disables the cache",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=ImagePool.DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="MB of decoded images to keep, and to decode at once",
+    )
+    parser.add_argument(
+        "--prerender-workers",
+        type=int,
+        help="processes rendering every image when pre-rendering is ticked, by default one per core but one",
+    )
+    parser.add_argument(
+        "--no-journal",
+        action="store_true",
+        help="do not journal decisions, so an interrupted tournament cannot be resumed",
+    )
+    parser.add_argument(
+        "--no-preferences",
+        action="store_true",
+        help="ask every match, rather than deciding those that follow from judgments in this or earlier sessions",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=list(ImageRanker.ENGINES.values()),
+        default=DoubleEliminationTournament.NAME,
+        help="ranking engine selected at start",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        help="stop the full ranking once this share of the pairs of images is expected to be in the right order, 0.8 "
+        "by default",
+    )
+    parser.add_argument(
+        "--latency-report",
+        metavar="PATH",
+        help="at exit, write how long each stage of showing a match and each decision took, as JSON or .csv",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="profile the session with cProfile and tracemalloc, writing the reports to DIR",
+    )
+    args = parser.parse_args(argv)
+    if args.confidence is not None and not 0 < args.confidence <= 1:
+        parser.error("--confidence must be above 0 and at most 1")
+
+    thumbnail_cache = None
+    if args.cache_size > 0:
+        thumbnail_cache = ThumbnailCache(max_bytes=args.cache_size * 1024 * 1024)
+    preferences = None
+    if not args.no_preferences:
+        preferences = PreferenceStore(default_cache_dir() / "preferences.sqlite3")
+
     root = Tk()
     root.title("Image Ranker")
     # start maximized
     root.state("zoomed")
-    image_ranker = ImageRanker(root)
-    root.mainloop()
+    image_ranker = ImageRanker(
+        root,
+        thumbnail_cache=thumbnail_cache,
+        journal_dir=None if args.no_journal else default_cache_dir() / "journals",
+        engine_name=args.engine,
+        memory_budget=args.memory_budget * 1024 * 1024,
+        prerender_workers=args.prerender_workers,
+        preferences=preferences,
+        standings_dir=default_cache_dir() / "standings",
+        confidence=args.confidence,
+    )
+    with profiled(args.profile) if args.profile else nullcontext():
+        root.mainloop()
+    image_ranker.close()
+    if args.latency_report:
+        image_ranker.latency.write(args.latency_report)
+    if thumbnail_cache is not None:
+        thumbnail_cache.close()
+    if preferences is not None:
+        preferences.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import csv
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import ContextManager, Dict, Iterator, List, Sequence
+
+
+def percentile(ordered: Sequence[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of sorted samples.
+    """
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class LatencyRecorder:
+    """
+    Collects how long each stage of showing a match takes, e.g. reading, decoding or resizing an image, and how long
+    each decision takes. Spans can be recorded from any thread.
+    """
+
+    PERCENTILES = (50, 90, 95, 99)
+    # upper bounds of the histogram buckets in milliseconds, slower samples fall in a last, unbounded bucket
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 60000)
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """
+        Time the block as one sample of the stage, even if it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Count, mean, percentiles and histogram of every stage, in milliseconds.
+        """
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items()}
+        summary = {}
+        for stage, ordered in samples.items():
+            if not ordered:
+                continue
+            milliseconds = [value * 1000 for value in ordered]
+            histogram = {f"<={bound}ms": 0 for bound in self.BUCKETS_MS}
+            histogram[f">{self.BUCKETS_MS[-1]}ms"] = 0
+            bucket = 0
+            for value in milliseconds:
+                while bucket < len(self.BUCKETS_MS) and value > self.BUCKETS_MS[bucket]:
+                    bucket += 1
+                histogram[list(histogram)[bucket]] += 1
+            summary[stage] = {
+                "count": len(milliseconds),
+                "total_ms": sum(milliseconds),
+                "mean_ms": sum(milliseconds) / len(milliseconds),
+                **{
+                    f"p{percent}_ms": percentile(milliseconds, percent)
+                    for percent in self.PERCENTILES
+                },
+                "max_ms": milliseconds[-1],
+                "histogram": histogram,
+            }
+        return summary
+
+    def write(self, path: os.PathLike):
+        """
+        Export the summary, as CSV if the path ends in .csv, otherwise as JSON.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        summary = self.summary()
+        if path.suffix.lower() == ".csv":
+            with open(path, "w", newline="") as f:
+                writer = None
+                for stage, stats in summary.items():
+                    row = {"stage": stage, **stats, **stats["histogram"]}
+                    del row["histogram"]
+                    if writer is None:
+                        writer = csv.DictWriter(f, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+        else:
+            path.write_text(json.dumps(summary, indent=2) + "\n")
+
+
+class NullRecorder:
+    """
+    Stands in for a LatencyRecorder where nothing is recorded.
+    """
+
+    def span(self, stage: str) -> ContextManager[None]:
+        return nullcontext()
+
+    def record(self, stage: str, seconds: float):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+
+
+@contextmanager
+def profiled(directory: os.PathLike) -> Iterator[None]:
+    """
+    Profile the block with cProfile and trace its allocations with tracemalloc. Writes profile.pstats, for pstats or
+    snakeviz, profile.txt, the functions by cumulative time, and allocations.txt, the lines that allocated the most
+    memory still held at the end, to the directory. cProfile only sees the thread the block runs on.
+    """
+    # imported here, only a profiled session pays for them
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        profiler.dump_stats(directory / "profile.pstats")
+        with open(directory / "profile.txt", "w") as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(50)
+        with open(directory / "allocations.txt", "w") as f:
+            f.write(f"peak traced memory: {peak} bytes\n")
+            for statistic in snapshot.statistics("lineno")[:50]:
+                f.write(f"{statistic}\n")
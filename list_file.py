@@ -0,0 +1,20 @@
+import os
+from typing import List, Sequence
+
+from double_elimination_tournament import immutable_type
+
+
+def read_list(path: os.PathLike) -> List[str]:
+    """
+    The participants in a list file, one per line, skipping blank lines.
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_list(path: os.PathLike, participants: Sequence[immutable_type]):
+    """
+    Write the participants to a list file, one per line.
+    """
+    with open(path, "w") as f:
+        f.write("".join(f"{participant}\n" for participant in participants))
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from double_elimination_tournament import DoubleEliminationTournament, immutable_type
+
+
+class MatchJournal:
+    """
+    Append-only journal of match results, one JSON object per line.
+
+    The first line records the participants in bracket order, so replaying the results rebuilds the tournament
+    exactly. Decisions taken back are recorded too, and taken back again on replay. Each line is flushed as it is
+    appended, and a truncated last line, from a crash mid-write, is dropped.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: os.PathLike, fsync: bool = False):
+        self.path = Path(path)
+        # fsync survives power loss as well as crashes, at the cost of a disk round trip per result
+        self.fsync = fsync
+        self.file: Optional[IO[str]] = None
+
+    @staticmethod
+    def path_for(
+        journal_dir: os.PathLike,
+        folder: os.PathLike,
+        engine_name: str = DoubleEliminationTournament.NAME,
+    ) -> Path:
+        """
+        The journal of the tournament over the given folder, each ranking engine keeping its own.
+        """
+        digest = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()
+        if engine_name != DoubleEliminationTournament.NAME:
+            digest += f"-{engine_name}"
+        return Path(journal_dir) / f"{digest}.jsonl"
+
+    def read(
+        self,
+    ) -> Tuple[Optional[List[immutable_type]], List[Tuple[int, immutable_type]], int]:
+        """
+        Returns the participants, the results as (match id, winner), and the length of the intact part of the file.
+        A decision taken back is returned as (match id, None).
+        """
+        participants = None
+        results = []
+        valid_length = 0
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None, [], 0
+        for number, line in enumerate(lines):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("truncated line")
+                record = json.loads(line)
+            except ValueError:
+                if number == len(lines) - 1:
+                    break
+                raise ValueError(f"{self.path} is corrupt at line {number + 1}")
+            if number == 0:
+                if record.get("version") != self.VERSION:
+                    raise ValueError(f"{self.path} is not a match journal")
+                participants = record["participants"]
+            elif "undo" in record:
+                results.append((record["undo"], None))
+            else:
+                results.append((record["match"], record["winner"]))
+            valid_length += len(line)
+        return participants, results, valid_length
+
+    def open_tournament(
+        self,
+        participants: Iterable[immutable_type],
+        engine: Callable[
+            [Dict[immutable_type, Any]], Any
+        ] = DoubleEliminationTournament,
+    ):
+        """
+        Resume the journaled tournament if it is over the same participants, otherwise start a new journal.
+        The tournament appends every result, and every undo, to the journal from now on. Any engine with submit_result,
+        undo and their listeners can be journaled, as long as it plays the same matches given the same results.
+        """
+        participants = list(participants)
+        journaled, results, valid_length = self.read()
+        if journaled is not None and set(journaled) == set(participants):
+            tournament = engine(dict.fromkeys(journaled, True))
+            for match_id, winner in results:
+                if winner is None:
+                    tournament.undo()
+                else:
+                    tournament.submit_result(match_id, winner)
+            # drop a truncated last line, so the next result starts on a line of its own
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_length)
+            self.file = open(self.path, "a", encoding="utf-8", newline="\n")
+        else:
+            tournament = engine(dict.fromkeys(participants, True))
+            self.start(tournament.keys)
+        tournament.result_listeners.append(self.append)
+        tournament.undo_listeners.append(self.append_undo)
+        return tournament
+
+    def start(self, participants: List[immutable_type]):
+        """
+        Start a new journal over the participants, in bracket order, replacing any existing one.
+        """
+        self.close()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, "w", encoding="utf-8", newline="\n")
+        self.write({"version": self.VERSION, "participants": participants})
+
+    def append(self, match_id: int, winner: immutable_type):
+        """
+        Record the result of a match.
+        """
+        self.write({"match": match_id, "winner": winner})
+
+    def append_undo(self, match_id: int):
+        """
+        Record that the decision of a match was taken back.
+        """
+        self.write({"undo": match_id})
+
+    def write(self, record: dict):
+        """
+        Append a line to the journal and hand it to the operating system.
+        """
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """
+        Close the journal file, keeping it for a later resume.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def discard(self):
+        """
+        Close and delete the journal, once the tournament is over.
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
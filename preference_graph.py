@@ -0,0 +1,377 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from double_elimination_tournament import immutable_type, match_type
+
+engine_type = Callable[[Dict[immutable_type, Any]], Any]
+
+
+class PreferenceStore:
+    """
+    Every judgment ever made, as (winner, loser) pairs of participants, stored in a single SQLite file so a later
+    session over any of the same participants knows them. Participants are stored as JSON, paths as strings.
+
+    Judgments are written on a background thread, those made while it writes committed together after, so making one
+    never waits on the disk. Loading waits for the writes before it.
+    """
+
+    def __init__(self, path: os.PathLike):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # the web ranker and the concurrent batch judge from other threads, so the connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS preferences (
+                    winner TEXT NOT NULL,
+                    loser TEXT NOT NULL,
+                    PRIMARY KEY (winner, loser)
+                ) WITHOUT ROWID
+                """)
+        # statements and their parameters, None to stop
+        self.writes: "queue.Queue[Optional[Tuple[str, Tuple[str, str]]]]" = (
+            queue.Queue()
+        )
+        self.error: Optional[sqlite3.Error] = None
+        self.thread = threading.Thread(target=self.run, name="preferences", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            writes = [self.writes.get()]
+            while True:
+                try:
+                    writes.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.lock, self.connection:
+                    for write in writes:
+                        if write is None:
+                            stopped = True
+                        else:
+                            self.connection.execute(*write)
+            except sqlite3.Error as e:
+                # e.g. the disk is full. the judgments are still known for this session
+                self.error = e
+            finally:
+                for _ in writes:
+                    self.writes.task_done()
+
+    def flush(self):
+        """
+        Wait for the judgments made so far to be written.
+        """
+        self.writes.join()
+
+    @staticmethod
+    def encode(participant: immutable_type) -> str:
+        return json.dumps(participant)
+
+    def load(self, participants: Iterable[immutable_type]) -> List[Tuple[str, str]]:
+        """
+        Returns the judgments between the participants, as encoded (winner, loser) pairs.
+        """
+        self.flush()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS session (participant TEXT PRIMARY KEY)"
+            )
+            self.connection.execute("DELETE FROM session")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO session VALUES (?)",
+                ((self.encode(participant),) for participant in participants),
+            )
+            return self.connection.execute("""
+                SELECT winner, loser FROM preferences
+                JOIN session AS winners ON winners.participant = winner
+                JOIN session AS losers ON losers.participant = loser
+                """).fetchall()
+
+    def add(self, winner: immutable_type, loser: immutable_type):
+        self.writes.put(
+            (
+                "INSERT OR IGNORE INTO preferences VALUES (?, ?)",
+                (self.encode(winner), self.encode(loser)),
+            )
+        )
+
+    def remove(self, winner: immutable_type, loser: immutable_type):
+        self.writes.put(
+            (
+                "DELETE FROM preferences WHERE winner = ? AND loser = ?",
+                (self.encode(winner), self.encode(loser)),
+            )
+        )
+
+    def close(self):
+        """
+        Write the judgments left, and close the file.
+        """
+        self.writes.put(None)
+        self.thread.join()
+        with self.lock:
+            self.connection.close()
+
+
+class PreferenceGraph:
+    """
+    The judgments between a set of participants, as a graph of edges from winner to loser, with its transitive closure
+    as a reachability index: a bitset for every participant of those it beat, directly or not. Whether one
+    participant is known to be better than another is then a single bit test. A judgment adds what the loser beat to
+    the winner and to those above it, found along the edges back from the winner, stopping at any that already had it.
+    What each judgment added is kept, so taking back the last one restores the closure from before it.
+    """
+
+    def __init__(
+        self,
+        participants: Iterable[immutable_type],
+        store: Optional[PreferenceStore] = None,
+    ):
+        """
+        Initializes the graph over the participants, with every judgment between them the store knows of.
+        """
+        self.keys: List[immutable_type] = list(participants)
+        self.index = {participant: index for index, participant in enumerate(self.keys)}
+        self.store = store
+        self.edges: Set[Tuple[int, int]] = set()
+        self.below = [0] * len(self.keys)
+        # the participants each one lost to directly
+        self.beaten_by: List[List[int]] = [[] for _ in self.keys]
+        # the judgments added, in order, with the participants whose closure each changed and what it was before
+        self.changes: List[Tuple[Tuple[int, int], List[Tuple[int, int]]]] = []
+        if store is not None:
+            encoded = {
+                store.encode(participant): index
+                for index, participant in enumerate(self.keys)
+            }
+            for winner, loser in store.load(self.keys):
+                self.link(encoded[winner], encoded[loser])
+
+    def link(self, winner: int, loser: int) -> List[Tuple[int, int]]:
+        """
+        Add an edge, and everything it implies, to the closure. Returns the participants whose closure changed, with
+        what it was before.
+        """
+        self.edges.add((winner, loser))
+        self.beaten_by[loser].append(winner)
+        below = self.below[loser] | 1 << loser
+        changed = []
+        stack = [winner]
+        while stack:
+            participant = stack.pop()
+            if self.below[participant] | below == self.below[participant]:
+                # so does everyone above it
+                continue
+            changed.append((participant, self.below[participant]))
+            self.below[participant] |= below
+            stack += self.beaten_by[participant]
+        return changed
+
+    def winner(self, a: immutable_type, b: immutable_type) -> Optional[immutable_type]:
+        """
+        The better of a and b if earlier judgments imply it, otherwise None. Judgments that contradict each other,
+        a > b > c > a, imply nothing about the participants in the cycle.
+        """
+        i = self.index[a]
+        j = self.index[b]
+        a_beats_b = self.below[i] >> j & 1
+        b_beats_a = self.below[j] >> i & 1
+        if a_beats_b and not b_beats_a:
+            return a
+        if b_beats_a and not a_beats_b:
+            return b
+        return None
+
+    def add(self, winner: immutable_type, loser: immutable_type) -> bool:
+        """
+        Record a judgment, and store it. Returns whether it was new, rather than a judgment already made.
+        """
+        edge = (self.index[winner], self.index[loser])
+        if edge in self.edges:
+            return False
+        self.changes.append((edge, self.link(*edge)))
+        if self.store is not None:
+            self.store.add(winner, loser)
+        return True
+
+    def remove(self, winner: immutable_type, loser: immutable_type):
+        """
+        Forget a judgment, e.g. one taken back. The closure is restored if it was the last one added, and rebuilt
+        without it otherwise.
+        """
+        edge = (self.index[winner], self.index[loser])
+        self.edges.discard(edge)
+        if self.store is not None:
+            self.store.remove(winner, loser)
+        if self.changes and self.changes[-1][0] == edge:
+            _, changed = self.changes.pop()
+            self.beaten_by[edge[1]].pop()
+            for participant, below in changed:
+                self.below[participant] = below
+            return
+        # what later judgments added was on top of this one
+        self.changes.clear()
+        edges = self.edges
+        self.edges = set()
+        self.below = [0] * len(self.keys)
+        self.beaten_by = [[] for _ in self.keys]
+        for edge in edges:
+            self.link(*edge)
+
+
+class InferringTournament:
+    """
+    Wraps a ranking engine so matches whose result follows from earlier judgments are decided without asking, a > b
+    and b > c deciding a against c, within the tournament and, with a store, across sessions.
+
+    Matches are decided as they come up, when the pending matches are asked for, and go to the result listeners like
+    any other, so a journal replays them without the graph. Undo takes back the last decision that was asked for, and
+    those inferred after it. Decisions submitted are treated as asked for, so a replayed journal undoes the same.
+    """
+
+    def __init__(self, tournament, graph: PreferenceGraph):
+        self.tournament = tournament
+        self.graph = graph
+        self.NAME = tournament.NAME
+        # the listeners of the engine, so inferred results are journaled too
+        self.result_listeners = tournament.result_listeners
+        self.undo_listeners = tournament.undo_listeners
+        # every decision asked for: its winner and loser, whether it was a new judgment, and how many inferred
+        # decisions followed it
+        self.history: List[Tuple[immutable_type, immutable_type, bool, int]] = []
+        # matches decided from earlier judgments, before any was asked for or since
+        self.inferred = 0
+        # the participants of the pending matches seen so far, by match id, to tell the loser of a decision
+        self.matches: Dict[int, Tuple[immutable_type, immutable_type]] = {}
+
+    @classmethod
+    def wrap(
+        cls, engine: engine_type, store: Optional[PreferenceStore] = None
+    ) -> engine_type:
+        """
+        An engine like the given one, inferring what it can from the judgments in the store.
+        """
+
+        def create(participants: Dict[immutable_type, Any]):
+            tournament = engine(participants)
+            return cls(tournament, PreferenceGraph(tournament.keys, store))
+
+        return create
+
+    @property
+    def keys(self) -> List[immutable_type]:
+        return self.tournament.keys
+
+    @property
+    def finished(self) -> bool:
+        return self.tournament.finished
+
+    @property
+    def final_standings(self) -> Optional[List[immutable_type]]:
+        return self.tournament.final_standings
+
+    def pending_matches(self, count: Optional[int] = None) -> List[match_type]:
+        """
+        Returns up to count undecided matches whose result does not follow from earlier judgments. Only the matches
+        that would be returned are looked at, those implied are decided and the next looked at in their place.
+        """
+        while True:
+            pending = self.tournament.pending_matches(count)
+            implied = [
+                (match_id, winner)
+                for match_id, a, b in pending
+                if (winner := self.graph.winner(a, b)) is not None
+            ]
+            if not implied:
+                break
+            for match_id, winner in implied:
+                self.tournament.submit_result(match_id, winner)
+                self.inferred += 1
+                if self.history:
+                    *decision, inferred = self.history[-1]
+                    self.history[-1] = (*decision, inferred + 1)
+        self.matches.update((match_id, (a, b)) for match_id, a, b in pending)
+        return pending
+
+    def submit_result(self, match_id: int, winner: immutable_type):
+        """
+        Decide a pending match, and remember the judgment.
+        """
+        if match_id not in self.matches:
+            # e.g. replayed from a journal, without asking for the pending matches first
+            self.matches.update(
+                (pending_id, (a, b))
+                for pending_id, a, b in self.tournament.pending_matches()
+            )
+        self.tournament.submit_result(match_id, winner)
+        a, b = self.matches.pop(match_id)
+        loser = b if winner == a else a
+        self.history.append((winner, loser, self.graph.add(winner, loser), 0))
+
+    def undo(self) -> Tuple[int, immutable_type]:
+        """
+        Take back the last decision asked for, and the decisions inferred after it. Returns the match id and the
+        winner of the match asked for.
+        """
+        if not self.history:
+            raise IndexError("There is no decision to undo.")
+        winner, loser, new, inferred = self.history.pop()
+        for _ in range(inferred):
+            self.tournament.undo()
+        self.inferred -= inferred
+        if new:
+            self.graph.remove(winner, loser)
+        return self.tournament.undo()
+
+    def run_tournament(
+        self,
+    ) -> Generator[
+        Tuple[immutable_type, immutable_type], immutable_type, List[immutable_type]
+    ]:
+        """
+        Generator to run the tournament, yielding only the matches whose result is not implied, and accepting the
+        winner of each.
+        """
+        while True:
+            # deciding the implied matches may finish the tournament
+            pending = self.pending_matches(1)
+            if not pending:
+                break
+            ((match_id, a, b),) = pending
+            winner = yield (a, b)
+            # if the winner is None, it is an usage error
+            if not winner:
+                raise ValueError("Winner must be provided via generator send.")
+            if self.tournament.pending_matches(1) != [(match_id, a, b)]:
+                raise ValueError("Match was decided through submit_result.")
+            self.submit_result(match_id, b if winner == b else a)
+        return self.final_standings
+
+    def upcoming_matches(
+        self, count: int
+    ) -> List[Tuple[immutable_type, immutable_type]]:
+        """
+        Returns up to count matches that could follow the match in play, leaving out those whose result is implied.
+        """
+        return [
+            (a, b)
+            for a, b in self.tournament.upcoming_matches(count)
+            if self.graph.winner(a, b) is None
+        ]
@@ -0,0 +1,125 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Sequence, Tuple
+
+from PIL import Image
+
+from image_prefetcher import box_type, render_image
+from thumbnail_cache import ThumbnailCache
+
+
+def prerender(path: str, box: box_type) -> bytes:
+    """
+    Render the image at path to fit the box, encoded for the thumbnail cache. Runs in a worker process.
+    """
+    return ThumbnailCache.encode(render_image(path, box))
+
+
+class Prerenderer:
+    """
+    Renders every image of a tournament into the thumbnail cache on a pool of processes, so matches are shown from the
+    cache rather than decoded while judging.
+
+    Images are rendered in the order given, usually the order their matches come up in. Only a few are handed to the
+    workers ahead of time, so cancelling stops the warm-up as soon as the renders already running finish. Each worker
+    decodes one full size image at a time, outside the memory budget of the image pool.
+    """
+
+    def __init__(
+        self,
+        paths: Sequence[str],
+        box: box_type,
+        cache: ThumbnailCache,
+        max_workers: Optional[int] = None,
+    ):
+        if max_workers is None:
+            # leave a core to the UI and the prefetcher
+            max_workers = max(1, (os.cpu_count() or 1) - 1)
+        self.paths = list(paths)
+        self.box = box
+        self.cache = cache
+        self.max_workers = max_workers
+        # images rendered, already cached or that could not be rendered, and of those the ones that could not
+        self.completed = 0
+        self.failed = 0
+        self.error: Optional[BrokenProcessPool] = None
+        # guards the counters, and the cache against renders finishing after cancel
+        self.lock = threading.Lock()
+        # renders handed to the workers and not finished yet
+        self.slots = threading.Semaphore(2 * max_workers)
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="prerender", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Stop rendering. Nothing is written to the cache once this returns.
+        """
+        with self.lock:
+            self.cancelled.set()
+        # wake the thread handing out renders, if it waits for a slot
+        self.slots.release()
+
+    def progress(self) -> Tuple[int, int]:
+        """
+        Returns how many of the images are done, and how many there are.
+        """
+        with self.lock:
+            return self.completed, len(self.paths)
+
+    def run(self):
+        # spawned rather than forked, forking a process running Tk and worker threads is not safe
+        executor = ProcessPoolExecutor(
+            self.max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        try:
+            for path in self.paths:
+                self.slots.acquire()
+                if self.cancelled.is_set():
+                    break
+                try:
+                    cached = self.cache.contains(path, self.box)
+                except OSError:
+                    cached = False
+                if cached:
+                    self.slots.release()
+                    with self.lock:
+                        self.completed += 1
+                    continue
+                future = executor.submit(prerender, path, self.box)
+                future.add_done_callback(
+                    lambda future, path=path: self.store(path, future)
+                )
+        except BrokenProcessPool as e:
+            # a worker died, e.g. out of memory. the images left are rendered on demand
+            self.error = e
+        finally:
+            cancelled = self.cancelled.is_set()
+            executor.shutdown(wait=not cancelled, cancel_futures=cancelled)
+            self.done.set()
+
+    def store(self, path: str, future: Future):
+        """
+        Write a finished render to the cache.
+        """
+        self.slots.release()
+        with self.lock:
+            if self.cancelled.is_set() or future.cancelled():
+                return
+            try:
+                self.cache.put_encoded(path, self.box, future.result())
+            except (
+                OSError,
+                ValueError,
+                Image.DecompressionBombError,
+                BrokenProcessPool,
+            ):
+                # the image is rendered on demand when its match comes up, which reports the error if there is one
+                self.failed += 1
+            self.completed += 1
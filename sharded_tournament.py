@@ -0,0 +1,370 @@
+import argparse
+import math
+import os
+import sys
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from double_elimination_tournament import (
+    DoubleEliminationTournament,
+    immutable_type,
+    match_type,
+)
+from list_file import read_list, write_list
+
+engine_type = Callable[[Dict[immutable_type, Any]], Any]
+
+
+def split_evenly(
+    participants: Sequence[immutable_type], shard_size: int
+) -> List[List[immutable_type]]:
+    """
+    Split the participants, in order, into as few shards of at most shard_size as possible, of nearly equal sizes.
+    """
+    if not participants:
+        return []
+    count = math.ceil(len(participants) / shard_size)
+    bounds = [len(participants) * shard // count for shard in range(count + 1)]
+    return [
+        list(participants[start:end]) for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def partition(
+    participants: Sequence[immutable_type], shard_size: int, by_folder: bool = True
+) -> List[List[immutable_type]]:
+    """
+    Split the participants into shards of at most shard_size. Paths are grouped by the folder they are in first,
+    if by_folder, so each shard holds the images of one folder. Shards follow the order of the participants.
+    """
+    groups: Dict[Any, List[immutable_type]] = {}
+    for participant in participants:
+        folder = (
+            os.path.dirname(participant)
+            if by_folder and isinstance(participant, str)
+            else None
+        )
+        groups.setdefault(folder, []).append(participant)
+    return [
+        shard for group in groups.values() for shard in split_evenly(group, shard_size)
+    ]
+
+
+def promote(
+    shard_standings: Sequence[Sequence[immutable_type]], top_k: int
+) -> List[immutable_type]:
+    """
+    The top_k of each shard, seeded for the final: every shard's winner first, then every shard's runner-up, and so
+    on, so the first matches of the final are between shards.
+    """
+    return [
+        standings[rank]
+        for rank in range(top_k)
+        for standings in shard_standings
+        if rank < len(standings)
+    ]
+
+
+def merge_standings(
+    shard_standings: Sequence[Sequence[immutable_type]],
+    final_standings: Sequence[immutable_type],
+    top_k: int,
+) -> List[immutable_type]:
+    """
+    One order over every participant: the standings of the final, then the participants that were not promoted.
+    Nothing compares those across shards, so they follow by their rank in their shard, and among equal ranks, the
+    shards whose winner did better in the final come first.
+    """
+    final_rank = {participant: rank for rank, participant in enumerate(final_standings)}
+    by_strength = sorted(
+        (standings for standings in shard_standings if standings),
+        key=lambda standings: final_rank.get(standings[0], len(final_rank)),
+    )
+    merged = list(final_standings)
+    deepest = max((len(standings) for standings in by_strength), default=0)
+    for rank in range(top_k, deepest):
+        merged += [
+            standings[rank] for standings in by_strength if rank < len(standings)
+        ]
+    return merged
+
+
+class ShardedTournament:
+    """
+    Splits a large collection into shards, ranks each shard in a tournament of its own, then promotes the top_k of
+    every shard to a final and merges all the standings into one order.
+
+    Shards do not depend on each other, so their matches can be judged in any order, at once or in sessions of their
+    own. Each shard is played to the end before the next is started by run_tournament. Match ids interleave those of
+    the sub-tournaments, shard i's match m being m * (shards + 1) + i and the final's the last residue, so ids stay
+    the same however the shards are played and the tournament can be journaled like any other engine.
+    """
+
+    NAME = "sharded"
+
+    DEFAULT_SHARD_SIZE = 256
+    DEFAULT_TOP_K = 8
+
+    def __init__(
+        self,
+        participants: Union[set, Dict[immutable_type, Any]],
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        top_k: int = DEFAULT_TOP_K,
+        by_folder: bool = True,
+        engine: engine_type = DoubleEliminationTournament,
+    ):
+        """
+        Initializes the shards, and their tournaments, with participants. The shards and the final are played by the
+        engine.
+        """
+        if isinstance(participants, set):
+            participants = {participant: True for participant in participants}
+
+        self.participants = participants
+        self.keys: List[immutable_type] = list(participants.keys())
+        self.top_k = top_k
+        self.engine = engine
+        self.shards: List[List[immutable_type]] = partition(
+            self.keys, shard_size, by_folder
+        )
+        # the sub-tournament of each shard, and the final once every shard is decided
+        self.tournaments = [engine(dict.fromkeys(shard, True)) for shard in self.shards]
+        self.final: Optional[Any] = None
+        self.final_standings: Optional[List[immutable_type]] = None
+        # called with the match id and the winner of every decided match, e.g. to journal it
+        self.result_listeners: List[Callable[[int, immutable_type], None]] = []
+        # called with the match id of every decision taken back
+        self.undo_listeners: List[Callable[[int], None]] = []
+        # the sub-tournament of every decision, in the order made, as its index with the final last
+        self.history: List[int] = []
+        for index, tournament in enumerate(self.tournaments):
+            self.listen(index, tournament)
+        self.start_final()
+
+    @property
+    def stride(self) -> int:
+        return len(self.tournaments) + 1
+
+    def listen(self, index: int, tournament):
+        """
+        Forward the results of a sub-tournament to the listeners, with their global match ids.
+        """
+
+        def forward(match_id: int, winner: immutable_type):
+            for listener in self.result_listeners:
+                listener(match_id * self.stride + index, winner)
+
+        tournament.result_listeners.append(forward)
+
+    def start_final(self):
+        """
+        Once every shard is decided, start the final over the promoted participants, or finish if there is no need
+        for one.
+        """
+        if self.final is not None or not all(
+            tournament.finished for tournament in self.tournaments
+        ):
+            return
+        shard_standings = [
+            tournament.final_standings for tournament in self.tournaments
+        ]
+        if len(self.tournaments) < 2:
+            self.final_standings = list(shard_standings[0]) if shard_standings else []
+            return
+        self.final = self.engine(
+            dict.fromkeys(promote(shard_standings, self.top_k), True)
+        )
+        self.listen(len(self.tournaments), self.final)
+        self.finish()
+
+    def finish(self):
+        """
+        Merge the standings once the final is decided.
+        """
+        if self.final is not None and self.final.finished:
+            self.final_standings = merge_standings(
+                [tournament.final_standings for tournament in self.tournaments],
+                self.final.final_standings,
+                self.top_k,
+            )
+
+    @property
+    def finished(self) -> bool:
+        return self.final_standings is not None
+
+    def active(self) -> Optional[Any]:
+        """
+        The sub-tournament run_tournament plays: the first shard that is not decided, then the final.
+        """
+        for tournament in self.tournaments:
+            if not tournament.finished:
+                return tournament
+        if self.final is not None and not self.final.finished:
+            return self.final
+        return None
+
+    def pending_matches(self, count: Optional[int] = None) -> List[match_type]:
+        """
+        Returns up to count undecided matches, as (match id, participant, participant), shard by shard. None of them
+        depends on the outcome of another, so they can be decided in any order.
+        """
+        pending = []
+        if self.final is not None:
+            sub_tournaments = [(len(self.tournaments), self.final)]
+        else:
+            sub_tournaments = list(enumerate(self.tournaments))
+        for index, tournament in sub_tournaments:
+            left = None if count is None else count - len(pending)
+            if left == 0:
+                break
+            pending += [
+                (match_id * self.stride + index, a, b)
+                for match_id, a, b in tournament.pending_matches(left)
+            ]
+        return pending
+
+    def submit_result(self, match_id: int, winner: immutable_type):
+        """
+        Decide a pending match of a shard, or of the final.
+        """
+        local_id, index = divmod(match_id, self.stride)
+        if index == len(self.tournaments):
+            if self.final is None:
+                raise KeyError(f"Match {match_id} is not scheduled.")
+            self.final.submit_result(local_id, winner)
+            self.history.append(index)
+            self.finish()
+        else:
+            self.tournaments[index].submit_result(local_id, winner)
+            self.history.append(index)
+            self.start_final()
+
+    def undo(self) -> Tuple[int, immutable_type]:
+        """
+        Take back the last decision, in the shard or the final it was made in. Returns the match id and the winner of
+        the match taken back. Taking back the decision that completed the last shard also drops the final, which is
+        started again once that shard is decided.
+        """
+        if not self.history:
+            raise IndexError("There is no decision to undo.")
+        index = self.history.pop()
+        if index == len(self.tournaments):
+            tournament = self.final
+        else:
+            tournament = self.tournaments[index]
+            self.final = None
+        local_id, winner = tournament.undo()
+        self.final_standings = None
+        match_id = local_id * self.stride + index
+        for listener in self.undo_listeners:
+            listener(match_id)
+        return match_id, winner
+
+    def run_tournament(
+        self,
+    ) -> Generator[
+        Tuple[immutable_type, immutable_type], immutable_type, List[immutable_type]
+    ]:
+        """
+        Generator to run the sharded tournament, one shard after the other, then the final. Yields pairs of
+        participants to compete in a match and accepts the winner of each match.
+        """
+        while not self.finished:
+            ((match_id, a, b),) = self.pending_matches(1)
+            winner = yield (a, b)
+            # if the winner is None, it is an usage error
+            if not winner:
+                raise ValueError("Winner must be provided via generator send.")
+            if self.pending_matches(1) != [(match_id, a, b)]:
+                raise ValueError("Match was decided through submit_result.")
+            self.submit_result(match_id, b if winner == b else a)
+        return self.final_standings
+
+    def upcoming_matches(
+        self, count: int
+    ) -> List[Tuple[immutable_type, immutable_type]]:
+        """
+        Returns up to count matches that could follow the match in play, within the shard in play.
+        """
+        tournament = self.active()
+        if tournament is None:
+            return []
+        return tournament.upcoming_matches(count)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Split a large collection into shards that can be ranked separately, e.g. by different people "
+        "with batch_ranker.py --list, then promote the best of each shard to a final and merge the standings."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split = commands.add_parser(
+        "split", help="write the images of each shard to a list file"
+    )
+    split.add_argument("paths", nargs="+", help="images, or folders of images")
+    split.add_argument(
+        "--recursive", action="store_true", help="include images in subfolders"
+    )
+    split.add_argument(
+        "--shard-size", type=int, default=ShardedTournament.DEFAULT_SHARD_SIZE
+    )
+    split.add_argument(
+        "--mixed",
+        action="store_true",
+        help="fill shards in order, regardless of folders",
+    )
+    split.add_argument("--output-dir", default=".", help="where to write shard-NNN.txt")
+
+    final = commands.add_parser(
+        "final",
+        help="list the images promoted from the shard standings, seeded for the final",
+    )
+    final.add_argument("standings", nargs="+", help="standings file of every shard")
+    final.add_argument("--top-k", type=int, default=ShardedTournament.DEFAULT_TOP_K)
+    final.add_argument("--output", required=True, help="list file of the final")
+
+    merge = commands.add_parser("merge", help="merge the shard and final standings")
+    merge.add_argument("standings", nargs="+", help="standings file of every shard")
+    merge.add_argument("--final", required=True, help="standings file of the final")
+    merge.add_argument("--top-k", type=int, default=ShardedTournament.DEFAULT_TOP_K)
+    merge.add_argument("--output", help="write the standings to this file")
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        from batch_ranker import collect_participants
+
+        participants = collect_participants(args.paths, None, args.recursive)
+        if not participants:
+            parser.error("no images to split")
+        shards = partition(participants, args.shard_size, by_folder=not args.mixed)
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        width = max(3, len(str(len(shards))))
+        for number, shard in enumerate(shards, 1):
+            write_list(output_dir / f"shard-{number:0{width}d}.txt", shard)
+        print(f"{len(participants)} images in {len(shards)} shards", file=sys.stderr)
+    elif args.command == "final":
+        shard_standings = [read_list(path) for path in args.standings]
+        write_list(args.output, promote(shard_standings, args.top_k))
+    else:
+        shard_standings = [read_list(path) for path in args.standings]
+        standings = merge_standings(shard_standings, read_list(args.final), args.top_k)
+        if args.output:
+            write_list(args.output, standings)
+        else:
+            print("\n".join(standings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import json
+
+import pytest
+from PIL import Image
+
+from batch_ranker import (
+    collect_participants,
+    main,
+    random_judge,
+    run_concurrent,
+    run_headless,
+    score_file_judge,
+    score_judge,
+)
+
+
+@pytest.fixture(scope="function")
+def image_folder(tmp_path):
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for name, size in [("small.png", (10, 10)), ("medium.png", (20, 20))]:
+        Image.new("RGB", size).save(folder / name)
+    Image.new("RGB", (40, 40)).save(folder / "large.png")
+    (folder / "subfolder").mkdir()
+    return folder
+
+
+def test_run_headless():
+    """Test a headless run returns standings and the number of matches played."""
+    result = run_headless({"A", "B", "C", "D"}, score_judge(ord))
+    assert result.standings[:2] == ["D", "C"]
+    assert sorted(result.standings) == ["A", "B", "C", "D"]
+    assert result.matches == 6
+
+
+def test_run_concurrent():
+    """Test judging matches concurrently gives the same standings as judging them in order."""
+    participants = {f"P{i:03d}": True for i in range(100)}
+    judge = score_judge(lambda participant: hash(participant) % 17)
+    serial = run_headless(participants, judge)
+    concurrent = run_concurrent(participants, judge, workers=4)
+    assert concurrent.standings == serial.standings
+    assert concurrent.matches == serial.matches
+
+
+def test_random_judge_is_reproducible():
+    """Test the random judge picks the same winners for the same seed."""
+    participants = {f"P{i}": True for i in range(50)}
+    first = run_headless(participants, random_judge(7))
+    second = run_headless(participants, random_judge(7))
+    assert first.standings == second.standings
+
+
+def test_score_file_judge(tmp_path):
+    """Test scores are looked up by full path, then by file name."""
+    scores_path = tmp_path / "scores.json"
+    scores_path.write_text(json.dumps({"/a/one.jpg": 1, "two.jpg": 2}))
+    judge = score_file_judge(scores_path)
+    assert judge("/a/one.jpg", "/b/two.jpg") == "/b/two.jpg"
+    with pytest.raises(KeyError):
+        judge("/a/one.jpg", "/c/three.jpg")
+
+
+def test_score_file_judge_csv(tmp_path):
+    """Test scores can be read from a CSV."""
+    scores_path = tmp_path / "scores.csv"
+    scores_path.write_text("one.jpg,3\ntwo.jpg,2.5\n")
+    assert score_file_judge(scores_path)("one.jpg", "two.jpg") == "one.jpg"
+
+
+def test_collect_participants(image_folder, tmp_path):
+    """Test folders are expanded to their files and list files are read."""
+    list_path = tmp_path / "list.txt"
+    list_path.write_text("/elsewhere/extra.jpg\n\n")
+    participants = collect_participants([str(image_folder)], str(list_path))
+    assert participants == [
+        str(image_folder / "large.png"),
+        str(image_folder / "medium.png"),
+        str(image_folder / "small.png"),
+        "/elsewhere/extra.jpg",
+    ]
+
+
+def test_main_pixels(image_folder, tmp_path, capsys):
+    """Test the command line ranks a folder by a metadata judge."""
+    output = tmp_path / "standings.txt"
+    main([str(image_folder), "--judge", "pixels", "--output", str(output)])
+    assert output.read_text().splitlines() == [
+        str(image_folder / "large.png"),
+        str(image_folder / "medium.png"),
+        str(image_folder / "small.png"),
+    ]
+    assert "3 participants, 4 matches" in capsys.readouterr().err
+
+
+def test_main_synthetic(capsys):
+    """Test the command line can rank synthetic participants for throughput testing."""
+    main(["--synthetic", "100", "--seed", "1"])
+    captured = capsys.readouterr()
+    assert len(captured.out.splitlines()) == 100
+    assert "100 participants, 198 matches" in captured.err
+
+
+def test_main_engine(capsys):
+    """Test the command line can rank with another engine."""
+    main(["--synthetic", "50", "--seed", "1", "--engine", "bradley_terry"])
+    captured = capsys.readouterr()
+    assert sorted(int(line) for line in captured.out.splitlines()) == list(range(1, 51))
+    assert "50 participants" in captured.err
+
+
+def test_main_confidence(capsys):
+    """Test the confidence the full ranking stops at can be set, and more confidence takes more matches."""
+    matches = []
+    for confidence in ["0.6", "0.9"]:
+        main(
+            [
+                "--synthetic",
+                "50",
+                "--seed",
+                "1",
+                "--engine",
+                "bradley_terry",
+                "--confidence",
+                confidence,
+            ]
+        )
+        matches.append(int(capsys.readouterr().err.split(", ")[1].split()[0]))
+    assert matches[0] < matches[1]
+    with pytest.raises(SystemExit):
+        main(["--synthetic", "50", "--engine", "bradley_terry", "--confidence", "2"])
+
+
+def test_main_top_k(capsys):
+    """Test the command line can decide only the first places."""
+    main(["--synthetic", "50", "--seed", "1", "--engine", "top_k", "--top-k", "3"])
+    captured = capsys.readouterr()
+    assert sorted(int(line) for line in captured.out.splitlines()) == list(range(1, 51))
+    # a knockout of 50, then at most 6 matches for each of the next 2 places
+    assert int(captured.err.split(", ")[1].split()[0]) <= 49 + 2 * 6
+
+
+def test_main_insertion(capsys, tmp_path):
+    """Test the command line can insert new participants into earlier standings."""
+    ranking = tmp_path / "ranking.txt"
+    ranking.write_text("".join(f"{i}\n" for i in range(40, 0, -1)))
+    main(
+        [
+            "--synthetic",
+            "50",
+            "--seed",
+            "1",
+            "--engine",
+            "insertion",
+            "--ranking",
+            str(ranking),
+        ]
+    )
+    captured = capsys.readouterr()
+    standings = [int(line) for line in captured.out.splitlines()]
+    assert sorted(standings) == list(range(1, 51))
+    # the ranking keeps its order
+    assert [i for i in standings if i <= 40] == list(range(40, 0, -1))
+    # 10 new participants, at most 6 matches each into the 41 gaps, and fewer among those sharing one
+    assert int(captured.err.split(", ")[1].split()[0]) <= 10 * 6 + 9 * 4
+
+
+def test_main_sharded(capsys):
+    """Test the command line can rank in shards, promoting the top of each to a final."""
+    main(
+        [
+            "--synthetic",
+            "50",
+            "--seed",
+            "1",
+            "--engine",
+            "sharded",
+            "--shard-size",
+            "10",
+            "--top-k",
+            "2",
+        ]
+    )
+    captured = capsys.readouterr()
+    assert sorted(int(line) for line in captured.out.splitlines()) == list(range(1, 51))
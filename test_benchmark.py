@@ -0,0 +1,91 @@
+import json
+
+from benchmark import bench_import, compare, generate_image, main, run
+
+
+def test_run():
+    """Test a small run reports every tournament size and display stage, with its environment."""
+    report = run(
+        ["double_elimination", "bradley_terry"],
+        [10, 20],
+        [(64, 48)],
+        ["JPEG", "PNG"],
+        repeat=1,
+        rounds=2,
+        imports=[],
+    )
+    names = [result["name"] for result in report["results"]]
+    assert names[:4] == [
+        "tournament/double_elimination/10",
+        "tournament/double_elimination/20",
+        "tournament/bradley_terry/10",
+        "tournament/bradley_terry/20",
+    ]
+    assert "display/JPEG/64x48/open" in names
+    assert "display/PNG/64x48/render" in names
+    tournament = report["results"][0]
+    assert tournament["matches"] == 18
+    assert tournament["peak_bytes"] > 0
+    assert "python" in report["meta"]
+    json.dumps(report)
+
+
+def test_bench_import():
+    """Test imports are timed in a fresh interpreter, and the core imports no imaging or GUI dependency."""
+    result = bench_import("batch_ranker", rounds=1)
+    assert result["name"] == "import/batch_ranker"
+    assert result["median_ms"] > 0
+    assert result["loaded"] == []
+
+
+def test_generate_image(tmp_path):
+    """Test generated images have the requested size and format."""
+    from PIL import Image
+
+    path = generate_image(tmp_path, (30, 20), "WEBP")
+    with Image.open(path) as img:
+        assert img.size == (30, 20)
+        assert img.format == "WEBP"
+
+
+def test_compare():
+    """Test runs are compared benchmark by benchmark, on the metric of each."""
+    baseline = {
+        "results": [
+            {"name": "a", "benchmark": "tournament", "seconds": 2.0},
+            {"name": "b", "benchmark": "display", "median_ms": 10.0},
+            {"name": "gone", "benchmark": "display", "median_ms": 1.0},
+        ]
+    }
+    current = {
+        "results": [
+            {"name": "a", "benchmark": "tournament", "seconds": 1.0},
+            {"name": "b", "benchmark": "display", "median_ms": 15.0},
+            {"name": "new", "benchmark": "display", "median_ms": 1.0},
+        ]
+    }
+    assert compare(baseline, current) == [("a", 2.0, 1.0, 0.5), ("b", 10.0, 15.0, 1.5)]
+
+
+def test_main_compare_fails_on_slowdown(tmp_path, capsys):
+    """Test the command line fails when a benchmark got slower than allowed."""
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(
+        json.dumps(
+            {
+                "results": [
+                    {
+                        "name": "tournament/double_elimination/10",
+                        "benchmark": "tournament",
+                        "seconds": 1e-9,
+                    }
+                ]
+            }
+        )
+    )
+    argv = ["--engines", "double_elimination", "--sizes", "10", "--formats", "JPEG"]
+    argv += ["--quick", "--rounds", "1", "--no-memory"]
+    output = tmp_path / "results.json"
+    assert main(argv + ["--output", str(output), "--compare", str(baseline)]) == 1
+    assert json.loads(output.read_text())["results"][0]["peak_bytes"] is None
+    assert "SLOWER" in capsys.readouterr().err
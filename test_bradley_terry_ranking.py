@@ -0,0 +1,193 @@
+import random
+import time
+
+import numpy as np
+import pytest
+
+from bradley_terry_ranking import BradleyTerryRanking
+
+
+def play(ranking, match_outcome):
+    """Run the ranking, deciding every match with match_outcome, and return the standings and match count."""
+    gen = ranking.run_tournament()
+    matches = 0
+    try:
+        a, b = next(gen)
+        while True:
+            assert a != b
+            matches += 1
+            a, b = gen.send(match_outcome(a, b))
+    except StopIteration as e:
+        return e.value, matches
+
+
+def concordance(standings, strength):
+    """Share of pairs of participants the standings order by strength."""
+    rank = {participant: index for index, participant in enumerate(standings)}
+    pairs = [(a, b) for a in standings for b in standings if strength[a] > strength[b]]
+    return sum(rank[a] < rank[b] for a, b in pairs) / len(pairs)
+
+
+@pytest.mark.parametrize(
+    "test_input,expected",
+    [
+        (set(), []),
+        ({"A"}, ["A"]),
+        ({"A", "B"}, ["B", "A"]),
+    ],
+)
+def test_small(test_input, expected):
+    """Test rankings too small to need more than one match."""
+    standings, _ = play(BradleyTerryRanking(test_input), max)
+    assert standings == expected
+
+
+def test_full_ranking():
+    """Test a consistent judge gives a close to complete ranking, in fewer matches than the limit allows."""
+    participants = [f"P{i:03d}" for i in range(100)]
+    strength = {p: random.Random(p).random() for p in participants}
+    ranking = BradleyTerryRanking(dict.fromkeys(participants, True), confidence=0.85)
+    standings, matches = play(
+        ranking, lambda a, b: a if strength[a] > strength[b] else b
+    )
+    assert sorted(standings) == participants
+    assert matches < ranking.max_matches
+    assert concordance(standings, strength) > 0.9
+
+
+def test_noisy_judge():
+    """Test a judge that sometimes picks the weaker participant still gives a mostly right ranking, in as many
+    matches as the ranking allows."""
+    rng = random.Random(2)
+    participants = list(range(1, 65))
+    standings, _ = play(
+        BradleyTerryRanking(set(participants), confidence=1),
+        lambda a, b: max(a, b) if rng.random() < 0.8 else min(a, b),
+    )
+    assert concordance(standings, {p: p for p in participants}) > 0.8
+
+
+def test_max_matches():
+    """Test the ranking stops after max_matches, whatever the confidence."""
+    ranking = BradleyTerryRanking(set(range(1, 51)), confidence=1, max_matches=30)
+    standings, matches = play(ranking, max)
+    assert matches == 30
+    assert sorted(standings) == list(range(1, 51))
+
+
+@pytest.mark.parametrize("count", [10, 20, 100])
+def test_confidence(count):
+    """Test the ranking stops once it is confident, before max_matches, later the more confident it must be."""
+    matches = []
+    for confidence in [0.7, 0.8]:
+        ranking = BradleyTerryRanking(set(range(1, count + 1)), confidence=confidence)
+        _, played = play(ranking, min)
+        assert ranking.estimated_confidence() >= confidence
+        matches.append(played)
+    assert matches[0] < matches[1] < ranking.max_matches
+
+
+def test_deterministic():
+    """Test the same results give the same matches, so a journal can replay them."""
+    first = BradleyTerryRanking(set(range(1, 41)))
+    second = BradleyTerryRanking(set(range(1, 41)))
+    while not first.finished:
+        assert second.pending_matches() == first.pending_matches()
+        match_id, a, b = first.pending_matches()[0]
+        first.submit_result(match_id, min(a, b))
+        second.submit_result(match_id, min(a, b))
+    assert second.final_standings == first.final_standings
+
+
+def test_submit_result_errors():
+    """Test only the match in play can be decided, by one of its participants."""
+    ranking = BradleyTerryRanking({"A", "B", "C"})
+    match_id, a, b = ranking.pending_matches()[0]
+    with pytest.raises(ValueError):
+        ranking.submit_result(match_id, "D")
+    with pytest.raises(KeyError):
+        ranking.submit_result(match_id + 1, a)
+    ranking.submit_result(match_id, a)
+    with pytest.raises(ValueError):
+        ranking.submit_result(match_id, a)
+
+
+def test_result_listeners():
+    """Test listeners hear about every decided match."""
+    ranking = BradleyTerryRanking({"A", "B", "C"})
+    results = []
+    ranking.result_listeners.append(lambda match_id, winner: results.append(winner))
+    standings, matches = play(ranking, max)
+    assert len(results) == matches
+
+
+def test_upcoming_matches():
+    """Test the next match is among the upcoming ones, whoever wins the match in play."""
+    ranking = BradleyTerryRanking(set(range(1, 31)))
+    gen = ranking.run_tournament()
+    a, b = next(gen)
+    for _ in range(20):
+        upcoming = ranking.upcoming_matches(2)
+        assert len(upcoming) <= 2
+        a, b = gen.send(max(a, b))
+        assert (a, b) in upcoming
+
+
+def test_pair_selection_speed():
+    """Test choosing the next match stays fast on a large pool."""
+    ranking = BradleyTerryRanking(set(range(1, 10_001)))
+    gen = ranking.run_tournament()
+    a, b = next(gen)
+    start = time.perf_counter()
+    for _ in range(1000):
+        a, b = gen.send(max(a, b))
+    assert time.perf_counter() - start < 5
+
+
+def test_undo():
+    """Test taking back a decision offers its match again, and deciding it otherwise changes the outcome."""
+    ranking = BradleyTerryRanking(set(range(1, 21)))
+    undone = []
+    ranking.undo_listeners.append(undone.append)
+    for _ in range(5):
+        match_id, a, b = ranking.pending_matches()[0]
+        ranking.submit_result(match_id, max(a, b))
+    match_id, a, b = ranking.pending_matches()[0]
+    ranking.submit_result(match_id, max(a, b))
+
+    assert ranking.undo() == (match_id, max(a, b))
+    assert undone == [match_id]
+    assert ranking.pending_matches() == [(match_id, a, b)]
+    ranking.submit_result(match_id, min(a, b))
+    assert ranking.scores[ranking.keys.index(min(a, b))] > 0
+
+
+def test_undo_restores_scores():
+    """Test taking back a decision, or looking ahead of one, leaves the scores exactly as they were before it."""
+    ranking = BradleyTerryRanking(set(range(1, 41)))
+    for _ in range(30):
+        match_id, a, b = ranking.pending_matches()[0]
+        ranking.submit_result(match_id, max(a, b))
+    scores = ranking.scores.copy()
+    information = ranking.information.copy()
+
+    ranking.upcoming_matches(2)
+    assert np.array_equal(ranking.scores, scores)
+    assert np.array_equal(ranking.information, information)
+    match_id, a, b = ranking.pending_matches()[0]
+    ranking.submit_result(match_id, min(a, b))
+    ranking.undo()
+    assert np.array_equal(ranking.scores, scores)
+    assert np.array_equal(ranking.information, information)
+
+
+def test_undo_finished():
+    """Test the last decision can be taken back after the ranking finished."""
+    ranking = BradleyTerryRanking({"A", "B"})
+    match_id, a, b = ranking.pending_matches()[0]
+    ranking.submit_result(match_id, a)
+    assert ranking.finished
+    assert ranking.undo() == (match_id, a)
+    assert not ranking.finished
+    with pytest.raises(IndexError):
+        ranking.undo()
@@ -1,3 +1,5 @@
+import random
+
 import pytest
 
 from double_elimination_tournament import DoubleEliminationTournament
@@ -14,7 +16,7 @@ class TestDoubleEliminationTournament:
         match_log = []
 
         try:
-            (a, b) = next(gen)
+            a, b = next(gen)
             # byes should not be 'played', tournaments of one or zero will StopIteration immediately
             assert a is not None
             assert b is not None
@@ -22,7 +24,7 @@ class TestDoubleEliminationTournament:
                 winner = match_outcome(a, b)
 
                 # Send the winner back to the generator
-                (a, b) = gen.send(winner)
+                a, b = gen.send(winner)
 
                 # byes should not be 'played'
                 assert a is not None
@@ -71,3 +73,138 @@ class TestDoubleEliminationTournament:
 
         standings = self.simulate_tournament(test_input, match_outcome)
         assert standings == expected
+
+    def test_upcoming_matches(self):
+        tournament = DoubleEliminationTournament(
+            {"A": True, "B": True, "C": True, "D": True, "E": True}
+        )
+        gen = tournament.run_tournament()
+
+        assert next(gen) == ("A", "B")
+        # the bye for E is not a match
+        assert tournament.upcoming_matches(5) == [("C", "D")]
+        assert gen.send("B") == ("C", "D")
+        assert tournament.upcoming_matches(5) == []
+
+        # losers bracket round, the next winners bracket round is already known
+        assert gen.send("D") == ("A", "C")
+        assert tournament.upcoming_matches(5) == [("B", "D")]
+        assert tournament.upcoming_matches(0) == []
+
+    def test_upsets(self):
+        # standings recorded with the list based bracket engine, the array based one must match them exactly
+        def match_outcome(a, b):
+            stronger, weaker = (a, b) if a > b else (b, a)
+            return stronger if random.Random(a + b).random() < 0.7 else weaker
+
+        participants = {f"P{i:02d}": True for i in range(13)}
+        standings = self.simulate_tournament(participants, match_outcome)
+        assert standings == [
+            "P12",
+            "P10",
+            "P09",
+            "P07",
+            "P05",
+            "P03",
+            "P01",
+            "P04",
+            "P11",
+            "P02",
+            "P08",
+            "P06",
+            "P00",
+        ]
+
+    def test_large_tournament(self):
+        matches = 0
+
+        def match_outcome(a, b):
+            nonlocal matches
+            matches += 1
+            return a if a > b else b
+
+        standings = self.simulate_tournament(
+            {i: True for i in range(1, 100_001)}, match_outcome
+        )
+        assert len(standings) == 100_000
+        assert standings[:2] == [100_000, 99_999]
+        # every participant but the undefeated champion loses twice
+        assert matches == 2 * 100_000 - 2
+
+    def test_pending_matches(self):
+        tournament = DoubleEliminationTournament(
+            {"A": True, "B": True, "C": True, "D": True, "E": True}
+        )
+        assert tournament.pending_matches() == [(0, "A", "B"), (1, "C", "D")]
+        assert tournament.pending_matches(1) == [(0, "A", "B")]
+
+        tournament.submit_result(1, "D")
+        assert tournament.pending_matches() == [(0, "A", "B")]
+        tournament.submit_result(0, "B")
+
+        # the losers bracket round and the next winners bracket round are independent
+        assert tournament.pending_matches() == [(2, "A", "C"), (3, "B", "D")]
+
+    def test_submit_result_errors(self):
+        tournament = DoubleEliminationTournament({"A": True, "B": True, "C": True})
+        with pytest.raises(ValueError):
+            tournament.submit_result(0, "C")
+        with pytest.raises(KeyError):
+            tournament.submit_result(1, "C")
+        tournament.submit_result(0, "A")
+        with pytest.raises(ValueError):
+            tournament.submit_result(0, "A")
+
+    def test_results_out_of_order(self):
+        # deciding the pending matches in any order gives the same standings as playing them in order
+        def match_outcome(a, b):
+            stronger, weaker = (a, b) if a > b else (b, a)
+            return stronger if random.Random(a + b).random() < 0.7 else weaker
+
+        participants = {f"P{i:02d}": True for i in range(37)}
+        expected = self.simulate_tournament(participants, match_outcome)
+
+        tournament = DoubleEliminationTournament(participants)
+        rng = random.Random(3)
+        while not tournament.finished:
+            match_id, a, b = rng.choice(tournament.pending_matches())
+            tournament.submit_result(match_id, match_outcome(a, b))
+        assert tournament.final_standings == expected
+
+    def test_undo(self):
+        # taking back every decision, across round transitions and the grand final, retraces the tournament
+        participants = {f"P{i:02d}": True for i in range(13)}
+        tournament = DoubleEliminationTournament(participants)
+        states = []
+        while not tournament.finished:
+            states.append(tournament.pending_matches())
+            match_id, a, b = states[-1][0]
+            tournament.submit_result(match_id, max(a, b))
+        standings = tournament.final_standings
+
+        undone = []
+        tournament.undo_listeners.append(undone.append)
+        while states:
+            match_id, winner = tournament.undo()
+            assert tournament.pending_matches() == states.pop()
+            assert tournament.pending_matches()[0][0] == match_id == undone[-1]
+            assert not tournament.finished
+        with pytest.raises(IndexError):
+            tournament.undo()
+
+        # and deciding again gives the same standings
+        while not tournament.finished:
+            match_id, a, b = tournament.pending_matches(1)[0]
+            tournament.submit_result(match_id, max(a, b))
+        assert tournament.final_standings == standings
+
+    def test_undo_then_decide_otherwise(self):
+        tournament = DoubleEliminationTournament({"A": True, "B": True, "C": True})
+        gen = tournament.run_tournament()
+        assert next(gen) == ("A", "B")
+        gen.send("A")
+        assert tournament.undo() == (0, "A")
+
+        gen = tournament.run_tournament()
+        assert next(gen) == ("A", "B")
+        assert gen.send("B") == ("B", "C")
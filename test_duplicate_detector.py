@@ -0,0 +1,105 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from duplicate_detector import (
+    METHODS,
+    find_duplicates,
+    load_thumbnail,
+    perceptual_hashes,
+    similar_pairs,
+)
+
+
+def draw_image(seed: int, size=(200, 150)) -> Image.Image:
+    """Random rectangles, so every seed gives a visibly different image."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(8):
+        x0, x1 = sorted(rng.randrange(size[0]) for _ in range(2))
+        y0, y1 = sorted(rng.randrange(size[1]) for _ in range(2))
+        draw.rectangle(
+            (x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3))
+        )
+    return img
+
+
+@pytest.fixture(scope="function")
+def image_folder(tmp_path):
+    for seed in range(6):
+        draw_image(seed).save(tmp_path / f"original{seed}.png")
+    # a smaller, recompressed copy and a slightly brighter copy of the first image
+    draw_image(0).resize((100, 75)).save(tmp_path / "small0.jpg", quality=70)
+    Image.eval(draw_image(0), lambda value: min(value + 8, 255)).save(
+        tmp_path / "bright0.png"
+    )
+    draw_image(3).save(tmp_path / "copy3.jpg", quality=80)
+    (tmp_path / "broken.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+    return tmp_path
+
+
+def test_load_thumbnail(image_folder):
+    """Test thumbnails are small grayscale arrays, and unreadable images give None."""
+    thumbnail, pixels = load_thumbnail(str(image_folder / "original0.png"))
+    assert thumbnail.shape == (32, 32)
+    assert thumbnail.dtype == np.float32
+    assert pixels == 200 * 150
+    assert load_thumbnail(str(image_folder / "broken.png")) == (None, 0)
+    assert load_thumbnail(str(image_folder / "missing.png")) == (None, 0)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_perceptual_hashes(image_folder, method):
+    """Test copies hash close to their original, and different images far apart."""
+    names = ["original0.png", "small0.jpg", "bright0.png", "original1.png"]
+    thumbnails = np.stack([load_thumbnail(str(image_folder / n))[0] for n in names])
+    hashes = [int(value) for value in perceptual_hashes(thumbnails, method)]
+    distance = lambda a, b: (hashes[a] ^ hashes[b]).bit_count()
+    assert distance(0, 1) <= 10
+    assert distance(0, 2) <= 10
+    assert distance(0, 3) > 20
+
+
+def test_perceptual_hashes_unknown_method():
+    """Test an unknown method is rejected."""
+    with pytest.raises(ValueError):
+        perceptual_hashes(np.zeros((1, 32, 32), dtype=np.float32), "md5")
+
+
+@pytest.mark.parametrize("threshold", [0, 3, 10])
+def test_similar_pairs(threshold):
+    """Test multi-index hashing finds exactly the pairs a full comparison finds."""
+    rng = random.Random(threshold)
+    hashes = [rng.getrandbits(64) for _ in range(200)]
+    # exact and near copies, so there are pairs to find
+    hashes += hashes[:10]
+    hashes += [value ^ (1 << rng.randrange(64)) for value in hashes[:50]]
+    expected = [
+        (a, b)
+        for a, b in itertools.combinations(range(len(hashes)), 2)
+        if (hashes[a] ^ hashes[b]).bit_count() <= threshold
+    ]
+    assert expected
+    assert similar_pairs(hashes, threshold) == expected
+
+
+def test_find_duplicates(image_folder):
+    """Test copies are grouped under the largest image, and the rest is left out."""
+    paths = sorted(str(path) for path in image_folder.iterdir())
+    duplicates = find_duplicates(paths)
+    assert duplicates == {
+        str(image_folder / "bright0.png"): [
+            str(image_folder / "original0.png"),
+            str(image_folder / "small0.jpg"),
+        ],
+        str(image_folder / "copy3.jpg"): [str(image_folder / "original3.png")],
+    }
+
+
+def test_find_duplicates_nothing_readable(tmp_path):
+    """Test no duplicates are found when no image can be read."""
+    assert find_duplicates([str(tmp_path / "missing.png")]) == {}
@@ -0,0 +1,74 @@
+import ast
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from double_elimination_tournament import DoubleEliminationTournament
+from engines import ENGINE_CLASSES, ENGINES, EngineRegistry
+
+
+def test_registry():
+    """Test every engine is found by its name, and is the class of that name."""
+    assert list(ENGINES) == list(ENGINE_CLASSES)
+    for name in ENGINES:
+        assert ENGINES[name].NAME == name
+    assert ENGINES["double_elimination"] is DoubleEliminationTournament
+    with pytest.raises(KeyError):
+        ENGINES["missing"]
+
+
+def test_lazy():
+    """Test engines are only imported when looked up."""
+    registry = EngineRegistry({"fake": ("no_such_module", "Engine")})
+    assert len(registry) == 1
+    assert "fake" in registry
+    with pytest.raises(ImportError):
+        registry["fake"]
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["engines", "batch_ranker", "sharded_tournament", "match_journal", "latency"],
+)
+def test_core_imports_light(module):
+    """Test the core imports none of numpy, Pillow or tkinter, so short-lived jobs start fast."""
+    code = (
+        f"import sys, {module}; "
+        "print(*[m for m in ('numpy', 'PIL', 'tkinter', 'cProfile') if m in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.split() == []
+
+
+def test_commands_packaged():
+    """Test every module of this tree the commands import, directly or not, or by engine name, is packaged."""
+    tomllib = pytest.importorskip("tomllib")
+    root = Path(__file__).parent
+    with open(root / "pyproject.toml", "rb") as f:
+        config = tomllib.load(f)
+    pending = [script.split(":")[0] for script in config["project"]["scripts"].values()]
+    pending += [module for module, _ in ENGINE_CLASSES.values()]
+    imported = set()
+    while pending:
+        module = pending.pop()
+        if module in imported:
+            continue
+        imported.add(module)
+        # lazy imports in functions count too, they fail just the same when the command gets to them
+        for node in ast.walk(ast.parse((root / f"{module}.py").read_text())):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                names = [node.module]
+            else:
+                continue
+            pending += [name for name in names if (root / f"{name}.py").exists()]
+    assert sorted(imported - set(config["tool"]["setuptools"]["py-modules"])) == []
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+from PIL import Image
+
+from folder_scanner import FolderScanner, has_image_header, scan_images
+
+
+@pytest.fixture(scope="function")
+def image_folder(tmp_path):
+    Image.new("RGB", (10, 10)).save(tmp_path / "photo.jpg")
+    Image.new("RGB", (10, 10)).save(tmp_path / "drawing.PNG")
+    Image.new("RGB", (10, 10)).save(tmp_path / "animation.webp")
+    (tmp_path / "notes.txt").write_text("not an image")
+    (tmp_path / "fake.jpg").write_text("not an image either")
+    (tmp_path / "empty.png").write_bytes(b"")
+    (tmp_path / "nested").mkdir()
+    Image.new("RGB", (10, 10)).save(tmp_path / "nested" / "deep.tif")
+    return tmp_path
+
+
+def test_has_image_header(image_folder):
+    """Test files are recognised by their first bytes."""
+    assert has_image_header(str(image_folder / "photo.jpg"))
+    assert has_image_header(str(image_folder / "animation.webp"))
+    assert has_image_header(str(image_folder / "nested" / "deep.tif"))
+    assert not has_image_header(str(image_folder / "fake.jpg"))
+    assert not has_image_header(str(image_folder / "empty.png"))
+    assert not has_image_header(str(image_folder / "missing.png"))
+
+
+def test_scan_images(image_folder):
+    """Test only images are found, by extension and header, in the folder itself."""
+    assert sorted(scan_images(str(image_folder))) == [
+        os.path.join(image_folder, "animation.webp"),
+        os.path.join(image_folder, "drawing.PNG"),
+        os.path.join(image_folder, "photo.jpg"),
+    ]
+
+
+def test_scan_images_recursive(image_folder):
+    """Test images in subfolders are found when recursing."""
+    images = set(scan_images(str(image_folder), recursive=True))
+    assert os.path.join(image_folder, "nested", "deep.tif") in images
+    assert len(images) == 4
+
+
+def test_scan_images_without_header_check(image_folder):
+    """Test header checks can be skipped, leaving only the extension filter."""
+    images = set(scan_images(str(image_folder), check_headers=False))
+    assert os.path.join(image_folder, "fake.jpg") in images
+    assert os.path.join(image_folder, "notes.txt") not in images
+
+
+def test_scan_missing_folder(tmp_path):
+    """Test a folder that cannot be read is an error."""
+    with pytest.raises(OSError):
+        list(scan_images(str(tmp_path / "missing")))
+
+
+def test_folder_scanner(image_folder, monkeypatch):
+    """Test the background scanner hands over everything it found, in batches."""
+    monkeypatch.setattr(FolderScanner, "BATCH_SIZE", 2)
+    scanner = FolderScanner(str(image_folder), recursive=True)
+    scanner.start()
+    scanner.thread.join()
+    paths, done = scanner.poll()
+    assert done
+    assert len(paths) == 4
+    assert scanner.poll() == ([], True)
+
+
+def test_folder_scanner_error(tmp_path):
+    """Test a scan of a folder that cannot be read ends with the error."""
+    scanner = FolderScanner(str(tmp_path / "missing"))
+    scanner.start()
+    scanner.thread.join()
+    assert scanner.poll() == ([], True)
+    assert isinstance(scanner.error, OSError)
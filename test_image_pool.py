@@ -0,0 +1,102 @@
+import threading
+import time
+
+from PIL import Image
+
+from image_pool import BLOCK_SIZE, ImagePool, bitmap_bytes
+
+
+def test_bitmap_bytes():
+    """Test bitmaps take one byte per pixel in single band modes and four otherwise."""
+    assert bitmap_bytes((10, 20), "L") == 200
+    assert bitmap_bytes((10, 20), "P") == 200
+    assert bitmap_bytes((10, 20), "RGB") == 800
+    assert bitmap_bytes((10, 20), "RGBA") == 800
+
+
+def test_least_recently_used_evicted():
+    """Test the least recently used entries are evicted once over budget."""
+    pool = ImagePool(max_bytes=300)
+    pool.add("a", "A", 100)
+    pool.add("b", "B", 100)
+    pool.add("c", "C", 100)
+    assert pool.get("a") == "A"
+    pool.add("d", "D", 100)
+    assert pool.get("b") is None
+    assert [pool.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert pool.bytes == 300
+
+
+def test_eviction_is_size_aware():
+    """Test a large entry evicts as many small ones as it needs room for."""
+    pool = ImagePool(max_bytes=300)
+    for key in "abc":
+        pool.add(key, key.upper(), 100)
+    pool.add("large", "LARGE", 250)
+    assert list(pool.entries) == ["large"]
+    assert pool.bytes == 250
+
+
+def test_replace_entry():
+    """Test adding a key again replaces its entry and its size."""
+    pool = ImagePool(max_bytes=300)
+    pool.add("a", "A", 100)
+    pool.add("a", "A2", 50)
+    assert pool.get("a") == "A2"
+    assert pool.bytes == 50
+    pool.discard("a")
+    assert pool.bytes == 0
+
+
+def test_pinned_not_evicted():
+    """Test pinned entries survive eviction, even over budget, until unpinned."""
+    pool = ImagePool(max_bytes=200)
+    pool.add("shown", "S", 150)
+    pool.pin("ui", ["shown"])
+    pool.add("other", "O", 100)
+    assert pool.get("shown") == "S"
+    assert pool.get("other") is None
+    # too large to keep next to the pinned entry
+    pool.add("big", "B", 300)
+    assert pool.get("big") is None
+    assert pool.get("shown") == "S"
+    pool.pin("ui", [])
+    pool.add("other", "O", 100)
+    assert pool.get("shown") is None
+    assert pool.get("other") == "O"
+
+
+def test_add_image():
+    """Test images are accounted by their bitmap size."""
+    pool = ImagePool()
+    pool.add_image("img", Image.new("RGB", (10, 10)))
+    assert pool.bytes == 400
+
+
+def test_block_size():
+    """Test Pillow allocates bitmaps in blocks large enough to be returned to the system once freed."""
+    ImagePool()
+    assert Image.core.get_block_size() >= BLOCK_SIZE
+
+
+def test_reserve_waits_for_room():
+    """Test a decode waits while others use the budget, and one over budget runs alone."""
+    pool = ImagePool(max_bytes=100)
+    started = []
+
+    def decode(name, size):
+        with pool.reserve(size):
+            started.append(name)
+
+    with pool.reserve(80):
+        small = threading.Thread(target=decode, args=("small", 20))
+        small.start()
+        small.join(1)
+        assert started == ["small"]
+        large = threading.Thread(target=decode, args=("large", 500))
+        large.start()
+        time.sleep(0.05)
+        assert started == ["small"]
+    large.join(1)
+    assert started == ["small", "large"]
+    assert pool.decoding == 0
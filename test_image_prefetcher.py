@@ -0,0 +1,235 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+from image_prefetcher import (
+    ImagePrefetcher,
+    fit_image,
+    fit_intermediate,
+    preview_image,
+    render_image,
+    resize_image,
+)
+from latency import LatencyRecorder
+from thumbnail_cache import ThumbnailCache
+
+
+@pytest.fixture(scope="function")
+def image_paths(tmp_path):
+    paths = []
+    for i, size in enumerate([(400, 200), (200, 400), (300, 300)]):
+        path = tmp_path / f"image{i}.png"
+        Image.new("RGB", size, color=(i * 60, 0, 0)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture(scope="function")
+def jpeg_path(tmp_path):
+    path = tmp_path / "large.jpg"
+    Image.new("RGB", (1600, 800), color=(0, 0, 255)).save(path)
+    return str(path)
+
+
+@pytest.fixture(scope="function")
+def prefetcher():
+    prefetcher = ImagePrefetcher(max_workers=2)
+    yield prefetcher
+    prefetcher.shutdown()
+
+
+def rendered(prefetcher, path, box):
+    """Prefetch the image, and wait for its rendition."""
+    prefetcher.prefetch([path], box)
+    return prefetcher.renders[(path, box)].result()
+
+
+def test_resize_image():
+    """Test images are resized to fit the box, maintaining the aspect ratio."""
+    assert resize_image(Image.new("RGB", (400, 200)), 100, 100).size == (100, 50)
+    assert resize_image(Image.new("RGB", (200, 400)), 100, 100).size == (50, 100)
+
+
+def test_render_image(image_paths):
+    """Test rendering opens and resizes the image."""
+    assert render_image(image_paths[0], (200, 200)).size == (200, 100)
+
+
+def test_render_records_stages(jpeg_path, image_paths, tmp_path):
+    """Test rendering times reading, decoding and resizing apart, and cache access when cached."""
+    recorder = LatencyRecorder()
+    prefetcher = ImagePrefetcher(max_workers=1, recorder=recorder)
+    rendered(prefetcher, jpeg_path, (200, 200))
+    prefetcher.shutdown()
+    assert set(recorder.samples) == {"read", "decode", "resize"}
+
+    cache = ThumbnailCache(tmp_path / "cache.sqlite")
+    prefetcher = ImagePrefetcher(max_workers=1, cache=cache, recorder=recorder)
+    rendered(prefetcher, image_paths[0], (200, 200))
+    prefetcher.shutdown()
+    cache.close()
+    assert {"cache_read", "cache_write"} <= set(recorder.samples)
+
+
+def test_prefetch_twice(prefetcher, image_paths):
+    """Test a prefetched image is returned without rendering it again."""
+    prefetcher.prefetch(image_paths, (100, 100))
+    images = [rendered(prefetcher, path, (100, 100)) for path in image_paths]
+    assert [image.size for image in images] == [(100, 50), (50, 100), (100, 100)]
+
+    with patch("image_prefetcher.render_image") as mock_render_image:
+        assert rendered(prefetcher, image_paths[0], (100, 100)) is images[0]
+        prefetcher.prefetch(image_paths, (100, 100))
+    mock_render_image.assert_not_called()
+
+
+def test_retain(prefetcher, image_paths):
+    """Test renders of other images or other boxes are dropped."""
+    prefetcher.prefetch(image_paths, (100, 100))
+    prefetcher.prefetch(image_paths[:1], (200, 200))
+    prefetcher.retain(image_paths[1:], (100, 100))
+    assert set(prefetcher.renders) == {
+        (image_paths[1], (100, 100)),
+        (image_paths[2], (100, 100)),
+    }
+
+
+def test_retain_moves_renders_to_pool(prefetcher, image_paths):
+    """Test renders no longer retained stay in the pool, and are not rendered again."""
+    first = rendered(prefetcher, image_paths[0], (100, 100))
+    prefetcher.retain([], (100, 100))
+    assert prefetcher.renders == {}
+    assert prefetcher.pool.get((image_paths[0], (100, 100))) is first
+    with patch("image_prefetcher.render_image") as render:
+        prefetcher.prefetch(image_paths[:1], (100, 100))
+        assert rendered(prefetcher, image_paths[0], (100, 100)) is first
+    render.assert_not_called()
+
+
+def test_fit_image_frees_bitmap(jpeg_path):
+    """Test the decoded source bitmap is freed once the rendition is made."""
+    with Image.open(jpeg_path) as img:
+        fit_image(img, (150, 150))
+        with pytest.raises(ValueError):
+            img.load()
+
+
+def test_preview_image(jpeg_path, image_paths):
+    """Test previews of JPEGs are decoded at reduced resolution, other formats have none."""
+    with Image.open(jpeg_path) as img:
+        preview = preview_image(img, (100, 100))
+        # 1/8 scale is the smallest that is still larger than the box
+        assert img.size == (200, 100)
+    assert preview.size == (100, 50)
+
+    with Image.open(image_paths[0]) as img:
+        assert preview_image(img, (100, 100)) is None
+
+
+def test_fit_image(jpeg_path):
+    """Test the final rendition is decoded with room to spare for the resize."""
+    with Image.open(jpeg_path) as img:
+        rendition = fit_image(img, (150, 150))
+        # 1/8 scale would leave less than twice the size to resize from
+        assert img.size == (400, 200)
+    assert rendition.size == (150, 75)
+
+
+def test_fit_intermediate(jpeg_path, image_paths):
+    """Test the intermediate is decoded to fit the intermediate box, reduced by a whole factor from larger images."""
+    with Image.open(jpeg_path) as img:
+        rendition, intermediate = fit_intermediate(img, (100, 100), (400, 400))
+    assert intermediate.size == (400, 200)
+    assert rendition.size == (100, 50)
+
+    with Image.open(image_paths[0]) as img:
+        rendition, intermediate = fit_intermediate(img, (50, 50), (100, 100))
+    assert intermediate.size == (100, 50)
+    assert rendition.size == (50, 25)
+
+
+def test_render_from_intermediate(image_paths):
+    """Test renditions for another box are resized from the intermediate, without opening the file again."""
+    prefetcher = ImagePrefetcher(max_workers=1, intermediate_box=(200, 200))
+    try:
+        rendered(prefetcher, image_paths[0], (100, 100))
+        with patch("PIL.Image.open") as mock_open:
+            assert rendered(prefetcher, image_paths[0], (50, 50)).size == (50, 25)
+        mock_open.assert_not_called()
+    finally:
+        prefetcher.shutdown()
+
+
+def test_retain_moves_intermediates_to_pool(image_paths):
+    """Test intermediates of images no longer retained stay in the pool, and preview other boxes at once."""
+    prefetcher = ImagePrefetcher(max_workers=1, intermediate_box=(200, 200))
+    try:
+        rendered(prefetcher, image_paths[0], (100, 100))
+        prefetcher.retain([], (100, 100))
+        assert prefetcher.intermediates == {}
+        assert prefetcher.pool.get(("intermediate", image_paths[0])).size == (200, 100)
+        with patch("PIL.Image.open") as mock_open:
+            preview, final = prefetcher.get_progressive(image_paths[0], (50, 50))
+        mock_open.assert_not_called()
+        assert not final
+        assert preview.size == (50, 25)
+        assert rendered(prefetcher, image_paths[0], (50, 50)).size == (50, 25)
+    finally:
+        prefetcher.shutdown()
+
+
+def test_get_progressive(jpeg_path):
+    """Test nothing is read or decoded on the calling thread, only in the background."""
+    prefetcher = ImagePrefetcher(max_workers=1)
+    # the worker is held until the calling thread is done
+    release = threading.Event()
+    prefetcher.executor.submit(release.wait)
+    try:
+        with patch("PIL.Image.open") as mock_open:
+            assert prefetcher.get_progressive(jpeg_path, (100, 100)) == (
+                None,
+                False,
+            )
+        mock_open.assert_not_called()
+        release.set()
+        rendition = rendered(prefetcher, jpeg_path, (100, 100))
+        assert prefetcher.get_progressive(jpeg_path, (100, 100)) == (
+            rendition,
+            True,
+        )
+    finally:
+        release.set()
+        prefetcher.shutdown()
+
+
+def test_ready_preview(jpeg_path):
+    """Test the preview decoded in the background is coarse and dropped when not retained."""
+    prefetcher = ImagePrefetcher(max_workers=1)
+    try:
+        assert prefetcher.ready_preview(jpeg_path, (100, 100)) is None
+        prefetcher.get_progressive(jpeg_path, (100, 100))
+        # the preview is submitted before the rendition, so the single worker decodes it first
+        rendition = rendered(prefetcher, jpeg_path, (100, 100))
+        preview = prefetcher.ready_preview(jpeg_path, (100, 100))
+        assert preview is not None and preview is not rendition
+        assert preview.size == rendition.size
+        prefetcher.retain([], (100, 100))
+        assert prefetcher.ready_preview(jpeg_path, (100, 100)) is None
+    finally:
+        prefetcher.shutdown()
+
+
+def test_failure(prefetcher, tmp_path):
+    """Test an image that cannot be rendered is reported, not raised, and previews nothing."""
+    path = tmp_path / "truncated.jpg"
+    Image.new("RGB", (1600, 800)).save(path)
+    path.write_bytes(path.read_bytes()[:400])
+    path = str(path)
+    assert prefetcher.failure(path, (100, 100)) is None
+    assert prefetcher.get_progressive(path, (100, 100)) == (None, False)
+    prefetcher.renders[(path, (100, 100))].exception()
+    assert prefetcher.ready(path, (100, 100)) is None
+    assert isinstance(prefetcher.failure(path, (100, 100)), OSError)
+    assert prefetcher.get_progressive(path, (100, 100)) == (None, False)
@@ -1,11 +1,17 @@
 import os
+import threading
 from tkinter import Tk
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import MagicMock, Mock
 
 import pytest
 from PIL import Image, ImageTk
 
+from bradley_terry_ranking import BradleyTerryRanking
 from image_ranker import ImageRanker
+from insertion_ranking import read_standings
+from preference_graph import PreferenceStore
+from test_image_prefetcher import rendered
+from thumbnail_cache import ThumbnailCache
 
 
 @pytest.fixture(scope="function")
@@ -18,133 +24,342 @@ def image_ranker_app():
     root.destroy()
 
 
+@pytest.fixture(scope="function")
+def image_folder(tmp_path):
+    for name in ["image1.jpg", "image2.jpg"]:
+        Image.new("RGB", (100, 100)).save(tmp_path / name)
+    # not images, should be skipped
+    (tmp_path / "notes.txt").write_text("not an image")
+    (tmp_path / "broken.jpg").write_text("not an image either")
+    (tmp_path / "subfolder").mkdir()
+    return tmp_path
+
+
+def select_folder(app, mocker, folder):
+    """Select the folder and wait for the scan to finish."""
+    mocker.patch("tkinter.filedialog.askdirectory", return_value=str(folder))
+    app.select_folder()
+    app.scanner.thread.join()
+    app.poll_scan(app.scanner)
+
+
+def show_match(app, mock_update_images):
+    """Put the match update_images was last asked to show on screen, as the mocked update_images would have."""
+    app.image1_name, app.image2_name = mock_update_images.call_args.args
+    app.shown_match = app.match_id
+
+
 def test_initialization(image_ranker_app):
     """Test that initial widgets are set up correctly."""
     assert image_ranker_app.select_folder_button is not None
     assert image_ranker_app.select_folder_button.winfo_manager() != ""
 
 
-def test_select_folder(mocker, image_ranker_app):
+def test_select_folder(mocker, image_ranker_app, image_folder):
     """Test selecting a folder sets the folder path correctly."""
-    mocker.patch("tkinter.filedialog.askdirectory", return_value="/path/to/images")
-    mocker.patch("os.listdir", return_value=["image1.jpg", "image2.jpg"])
-    image_ranker_app.select_folder()
-    assert image_ranker_app.folder_label["text"] == "/path/to/images"
-    assert os.path.join("/path/to/images", "image1.jpg") in image_ranker_app.images
-    assert os.path.join("/path/to/images", "image2.jpg") in image_ranker_app.images
-
-
-def test_start_tournament(image_ranker_app, mocker):
+    select_folder(image_ranker_app, mocker, image_folder)
+    assert image_ranker_app.folder_label["text"] == f"{image_folder}\n2 images"
+    assert image_ranker_app.images == {
+        os.path.join(image_folder, "image1.jpg"),
+        os.path.join(image_folder, "image2.jpg"),
+    }
+    assert image_ranker_app.start_tournament_button["state"] == "normal"
+
+
+def test_select_folder_without_images(mocker, image_ranker_app, tmp_path):
+    """Test the tournament cannot be started over a folder without images."""
+    (tmp_path / "notes.txt").write_text("not an image")
+    select_folder(image_ranker_app, mocker, tmp_path)
+    assert image_ranker_app.images == set()
+    assert image_ranker_app.start_tournament_button["state"] == "disabled"
+
+
+def test_select_folder_sets_aside_duplicates(mocker, image_ranker_app, image_folder):
+    """Test only one of a group of near-duplicates enters the tournament."""
+    image_ranker_app.collapse_duplicates.set(True)
+    after = mocker.patch.object(image_ranker_app.root, "after")
+    select_folder(image_ranker_app, mocker, image_folder)
+    _, poll_duplicates, scanner, future = after.call_args[0]
+    future.result()
+    poll_duplicates(scanner, future)
+    assert image_ranker_app.images == {os.path.join(image_folder, "image1.jpg")}
+    assert image_ranker_app.duplicates == {
+        os.path.join(image_folder, "image1.jpg"): [
+            os.path.join(image_folder, "image2.jpg")
+        ]
+    }
+    assert image_ranker_app.folder_label["text"] == (
+        f"{image_folder}\n1 images, 1 near-duplicates set aside"
+    )
+
+
+def test_start_tournament(image_ranker_app, mocker, image_folder):
     """Test starting the tournament updates the mode and UI correctly."""
-    mocker.patch("tkinter.filedialog.askdirectory", return_value="/path/to/images")
-    mocker.patch("os.listdir", return_value=["image1.jpg", "image2.jpg"])
     mock_update_images = mocker.patch.object(ImageRanker, "update_images")
 
-    image_ranker_app.select_folder()
+    select_folder(image_ranker_app, mocker, image_folder)
     image_ranker_app.start_tournament()
 
     mock_update_images.assert_called_once()
     assert image_ranker_app.mode == ImageRanker.PICK_WINNER
 
 
-def test_select_winner_image1(image_ranker_app, mocker):
-    """Test selecting a winner and moving to next match or standings."""
-    # Setup a simulated generator
+def test_start_tournament_engine(image_ranker_app, mocker, image_folder):
+    """Test the tournament is run by the selected engine."""
     mocker.patch.object(ImageRanker, "update_images")
+
+    select_folder(image_ranker_app, mocker, image_folder)
+    image_ranker_app.engine.set("Full ranking, fewest decisions")
+    image_ranker_app.start_tournament()
+
+    assert isinstance(image_ranker_app.tournament, BradleyTerryRanking)
+
+
+def test_start_tournament_prerenders(mocker, image_folder, tmp_path):
+    """Test every image is rendered into the thumbnail cache when pre-rendering is ticked."""
+    mocker.patch.object(ImageRanker, "update_images")
+    cache = ThumbnailCache(tmp_path / "thumbnails.sqlite3")
+    root = Tk()
+    root.withdraw()
+    app = ImageRanker(root, thumbnail_cache=cache, prerender_workers=1)
+    try:
+        select_folder(app, mocker, image_folder)
+        app.prerender.set(True)
+        app.start_tournament()
+        prerenderer = app.prerenderer
+        assert prerenderer.done.wait(60)
+        app.poll_prerender(prerenderer)
+
+        assert app.prerenderer is None
+        box = prerenderer.box
+        assert all(cache.contains(path, box) for path in app.images)
+    finally:
+        app.close()
+        root.destroy()
+        cache.close()
+
+
+def test_start_tournament_resumes(image_ranker_app, mocker, image_folder, tmp_path):
+    """Test starting a tournament over a journaled folder continues where it left off."""
+    mock_update_images = mocker.patch.object(ImageRanker, "update_images")
+    image_ranker_app.journal_dir = tmp_path / "journals"
+
+    select_folder(image_ranker_app, mocker, image_folder)
+    image_ranker_app.start_tournament()
+    show_match(image_ranker_app, mock_update_images)
+    image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
+    image_ranker_app.journal.close()
+
+    image_ranker_app.start_tournament()
+    # the first match is replayed from the journal, the grand final is next
+    assert image_ranker_app.tournament.pending_matches() == [
+        (1, image_ranker_app.image1_name, image_ranker_app.image2_name)
+    ]
+
+
+def test_start_tournament_infers(image_ranker_app, mocker, image_folder, tmp_path):
+    """Test matches whose result is known from earlier judgments are not shown, in this session or the next."""
+    mock_update_images = mocker.patch.object(ImageRanker, "update_images")
+    mocker.patch.object(ImageRanker, "update_ui")
+    preferences = PreferenceStore(tmp_path / "preferences.sqlite3")
+    image_ranker_app.preferences = preferences
+
+    select_folder(image_ranker_app, mocker, image_folder)
+    image_ranker_app.start_tournament()
+    show_match(image_ranker_app, mock_update_images)
+    image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
+    # the grand final is a rematch, its result is known
+    assert mock_update_images.call_count == 1
+    assert image_ranker_app.final_standings[0] == image_ranker_app.image1_name
+
+    image_ranker_app.final_standings = None
+    image_ranker_app.start_tournament()
+    assert mock_update_images.call_count == 1
+    assert image_ranker_app.final_standings[0] == image_ranker_app.image1_name
+    preferences.close()
+
+
+def test_start_tournament_inserts(image_ranker_app, mocker, image_folder, tmp_path):
+    """Test images added to a ranked folder are only matched against the last standings."""
+    mock_update_images = mocker.patch.object(ImageRanker, "update_images")
+    mocker.patch.object(ImageRanker, "update_ui")
+    image_ranker_app.standings_dir = tmp_path / "standings"
+    image_ranker_app.engine.set("New images into the last ranking")
+
+    select_folder(image_ranker_app, mocker, image_folder)
+    image_ranker_app.start_tournament()
+    show_match(image_ranker_app, mock_update_images)
+    image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
+    standings = image_ranker_app.final_standings
+
+    Image.new("RGB", (100, 100)).save(image_folder / "image3.jpg")
+    select_folder(image_ranker_app, mocker, image_folder)
+    image_ranker_app.start_tournament()
+    new, ranked = mock_update_images.call_args.args
+    assert os.path.basename(new) == "image3.jpg"
+    assert ranked in standings
+
+
+def test_end_tournament_keeps_full_orders(image_ranker_app, mocker, tmp_path):
+    """Test only standings in order all the way down are kept for inserting into, not those of the best few or of
+    shards."""
     mocker.patch.object(ImageRanker, "update_ui")
+    image_ranker_app.standings_dir = tmp_path / "standings"
+    image_ranker_app.folder = str(tmp_path)
+    for name in ["top_k", "sharded"]:
+        image_ranker_app.tournament = MagicMock(NAME=name)
+        image_ranker_app.end_tournament(["b.jpg", "a.jpg"])
+        assert read_standings(image_ranker_app.standings_dir, tmp_path) == []
+
+    image_ranker_app.tournament = MagicMock(NAME="double_elimination")
+    image_ranker_app.end_tournament(["b.jpg", "a.jpg"])
+    assert read_standings(image_ranker_app.standings_dir, tmp_path) == [
+        "b.jpg",
+        "a.jpg",
+    ]
+
 
-    # Simulate the generator manually since the actual logic depends on real file paths
-    image_ranker_app.image1_name = "/path/to/image1.jpg"
-    image_ranker_app.image2_name = "/path/to/image2.jpg"
-    image_ranker_app.gen = MagicMock()
-    image_ranker_app.gen.send.side_effect = [
-        ("/path/to/image3.jpg", "/path/to/image4.jpg"),
-        StopIteration(),
+def test_end_tournament_lists_duplicates(image_ranker_app, tmp_path):
+    """Test the near-duplicates set aside are listed right after the image of their group, and kept and copied too."""
+    image_ranker_app.standings_dir = tmp_path / "standings"
+    image_ranker_app.folder = str(tmp_path)
+    image_ranker_app.duplicates = {"/a/b.jpg": ["/a/b-small.jpg", "/a/b-copy.jpg"]}
+    image_ranker_app.tournament = MagicMock(NAME="double_elimination")
+    image_ranker_app.end_tournament(["/a/c.jpg", "/a/b.jpg", "/a/a.jpg"])
+
+    standings = ["/a/c.jpg", "/a/b.jpg", "/a/b-small.jpg", "/a/b-copy.jpg", "/a/a.jpg"]
+    assert image_ranker_app.final_standings == standings
+    assert read_standings(image_ranker_app.standings_dir, tmp_path) == standings
+    assert "2 near-duplicates" in image_ranker_app.standings_text.cget("text")
+    image_ranker_app.copy()
+    assert image_ranker_app.root.clipboard_get().splitlines() == [
+        "c.jpg",
+        "b.jpg",
+        "b-small.jpg",
+        "b-copy.jpg",
+        "a.jpg",
     ]
 
+
+def test_undo_redo(image_ranker_app, mocker, image_folder):
+    """Test a decision can be taken back, showing its match again, and made again."""
+    mock_update_images = mocker.patch.object(ImageRanker, "update_images")
+
+    select_folder(image_ranker_app, mocker, image_folder)
+    image_ranker_app.start_tournament()
+    first = mock_update_images.call_args.args
+    show_match(image_ranker_app, mock_update_images)
+    assert image_ranker_app.undo_button.cget("state") == "disabled"
     image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
+    second = mock_update_images.call_args.args
+    assert image_ranker_app.undo_button.cget("state") == "normal"
 
-    image_ranker_app.update_images.assert_called_once()
-    image_ranker_app.update_ui.assert_not_called()
+    image_ranker_app.undo()
+    assert mock_update_images.call_args.args == first
+    assert image_ranker_app.redo_button.cget("state") == "normal"
 
-    image_ranker_app.gen.send.assert_called_once_with("/path/to/image1.jpg")
+    image_ranker_app.redo()
+    assert mock_update_images.call_args.args == second
+    assert image_ranker_app.redo_button.cget("state") == "disabled"
 
 
-def test_select_winner_image2(image_ranker_app, mocker):
+def mock_tournament(app, pending):
+    """Put a match of a mocked tournament on screen, the matches pending after each decision given in order."""
+    app.mode = ImageRanker.PICK_WINNER
+    app.image1_name = "/path/to/image1.jpg"
+    app.image2_name = "/path/to/image2.jpg"
+    app.match_id = app.shown_match = 0
+    app.tournament = MagicMock(history=[])
+    app.tournament.pending_matches.side_effect = pending
+
+
+def test_select_winner_image1(image_ranker_app, mocker):
     """Test selecting a winner and moving to next match or standings."""
-    # Setup a simulated generator
     mocker.patch.object(ImageRanker, "update_images")
     mocker.patch.object(ImageRanker, "update_ui")
+    mock_tournament(
+        image_ranker_app, [[(1, "/path/to/image3.jpg", "/path/to/image4.jpg")]]
+    )
 
-    # Simulate the generator manually since the actual logic depends on real file paths
-    image_ranker_app.image1_name = "/path/to/image1.jpg"
-    image_ranker_app.image2_name = "/path/to/image2.jpg"
-    image_ranker_app.gen = MagicMock()
-    image_ranker_app.gen.send.side_effect = [
-        ("/path/to/image3.jpg", "/path/to/image4.jpg"),
-        StopIteration(),
-    ]
+    image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
+
+    image_ranker_app.update_images.assert_called_once_with(
+        "/path/to/image3.jpg", "/path/to/image4.jpg"
+    )
+    image_ranker_app.update_ui.assert_not_called()
+    image_ranker_app.tournament.submit_result.assert_called_once_with(
+        0, "/path/to/image1.jpg"
+    )
+    assert image_ranker_app.match_id == 1
+
+
+def test_select_winner_image2(image_ranker_app, mocker):
+    """Test selecting a winner and moving to next match or standings."""
+    mocker.patch.object(ImageRanker, "update_images")
+    mocker.patch.object(ImageRanker, "update_ui")
+    mock_tournament(
+        image_ranker_app, [[(1, "/path/to/image3.jpg", "/path/to/image4.jpg")]]
+    )
 
     image_ranker_app.select_image2()
+    image_ranker_app.root.update_idletasks()
 
     image_ranker_app.update_images.assert_called_once()
     image_ranker_app.update_ui.assert_not_called()
-
-    image_ranker_app.gen.send.assert_called_once_with("/path/to/image2.jpg")
+    image_ranker_app.tournament.submit_result.assert_called_once_with(
+        0, "/path/to/image2.jpg"
+    )
 
 
 def test_select_winner_image1_done(image_ranker_app, mocker):
     """Test selecting a winner and moving to next match or standings."""
-    # Setup a simulated generator
     mocker.patch.object(ImageRanker, "update_images")
     mocker.patch.object(ImageRanker, "update_ui")
-
-    # Simulate the generator manually since the actual logic depends on real file paths
-    image_ranker_app.image1_name = "/path/to/image1.jpg"
-    image_ranker_app.image2_name = "/path/to/image2.jpg"
-    image_ranker_app.gen = MagicMock()
-    image_ranker_app.gen.send.side_effect = [StopIteration()]
+    mock_tournament(image_ranker_app, [[]])
 
     image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
 
     image_ranker_app.update_images.assert_not_called()
     image_ranker_app.update_ui.assert_called_once()
-
-    image_ranker_app.gen.send.assert_called_once_with("/path/to/image1.jpg")
+    image_ranker_app.tournament.submit_result.assert_called_once_with(
+        0, "/path/to/image1.jpg"
+    )
 
 
 def test_select_winner_image2_done(image_ranker_app, mocker):
     """Test selecting a winner and moving to next match or standings."""
-    # Setup a simulated generator
     mocker.patch.object(ImageRanker, "update_images")
     mocker.patch.object(ImageRanker, "update_ui")
-
-    # Simulate the generator manually since the actual logic depends on real file paths
-    image_ranker_app.image1_name = "/path/to/image1.jpg"
-    image_ranker_app.image2_name = "/path/to/image2.jpg"
-    image_ranker_app.gen = MagicMock()
-    image_ranker_app.gen.send.side_effect = [StopIteration()]
+    mock_tournament(image_ranker_app, [[]])
 
     image_ranker_app.select_image2()
+    image_ranker_app.root.update_idletasks()
 
     image_ranker_app.update_images.assert_not_called()
     image_ranker_app.update_ui.assert_called_once()
-
-    image_ranker_app.gen.send.assert_called_once_with("/path/to/image2.jpg")
+    image_ranker_app.tournament.submit_result.assert_called_once_with(
+        0, "/path/to/image2.jpg"
+    )
 
 
 def test_final_standings(image_ranker_app, mocker):
     """Test final standings are shown when tournament is over."""
     mocker.patch.object(ImageRanker, "update_images")
     mocker.patch.object(ImageRanker, "update_ui")
-
-    image_ranker_app.image1_name = "/path/to/image1.jpg"
-    image_ranker_app.image2_name = "/path/to/image2.jpg"
-    image_ranker_app.gen = MagicMock()
-    image_ranker_app.gen.send.side_effect = [
-        StopIteration(["/path/to/image1.jpg", "/path/to/image2.jpg"]),
+    mock_tournament(image_ranker_app, [[]])
+    image_ranker_app.tournament.final_standings = [
+        "/path/to/image1.jpg",
+        "/path/to/image2.jpg",
     ]
+
     image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
 
     image_ranker_app.update_images.assert_not_called()
     image_ranker_app.update_ui.assert_called_once()
@@ -155,20 +370,110 @@ def test_final_standings(image_ranker_app, mocker):
     ]
 
 
-def test_update_images(image_ranker_app):
-    """Test images are updated correctly."""
-    # Create mock images
-    image1 = Image.new("RGB", (100, 100))
-    image2 = Image.new("RGB", (100, 100))
-    image1_path = "/fake/path/image1.jpg"
-    image2_path = "/fake/path/image2.jpg"
+def test_decisions_queued(image_ranker_app, mocker):
+    """Test decisions are taken once each, on the match that was on screen when they were made."""
+    mock_update_images = mocker.patch.object(ImageRanker, "update_images")
+    mocker.patch.object(ImageRanker, "update_ui")
+    mock_tournament(
+        image_ranker_app,
+        [
+            [(1, "/path/to/image3.jpg", "/path/to/image4.jpg")],
+            [(2, "/path/to/image5.jpg", "/path/to/image6.jpg")],
+        ],
+    )
+
+    # a double click, both before Tk was idle
+    image_ranker_app.select_image1()
+    image_ranker_app.select_image1()
+    assert image_ranker_app.tournament.submit_result.call_count == 0
+    image_ranker_app.root.update_idletasks()
+    image_ranker_app.tournament.submit_result.assert_called_once_with(
+        0, "/path/to/image1.jpg"
+    )
+
+    # the images of the next match are not on screen yet, the update_images mock shows nothing
+    image_ranker_app.select_image2()
+    image_ranker_app.root.update_idletasks()
+    assert image_ranker_app.tournament.submit_result.call_count == 1
 
-    # Use patch to replace Image.open to return a mock Image
-    with patch("PIL.Image.open", side_effect=[image1, image2]):
-        image_ranker_app.update_images(image1_path, image2_path)
+    show_match(image_ranker_app, mock_update_images)
+    image_ranker_app.select_image2()
+    image_ranker_app.root.update_idletasks()
+    image_ranker_app.tournament.submit_result.assert_called_with(
+        1, "/path/to/image4.jpg"
+    )
+
+
+def test_keyboard_shortcuts(image_ranker_app):
+    """Test the arrow keys and 1 and 2 pick the winner."""
+    bindings = image_ranker_app.root.bind()
+    for sequence in ["<Key-Left>", "<Key-1>", "<Key-Right>", "<Key-2>"]:
+        assert sequence in bindings
+
+
+def test_update_images(image_ranker_app, mocker, image_folder):
+    """Test images not rendered yet are left blank, decoded off the Tk thread and shown once they are rendered."""
+    image1 = str(image_folder / "image1.jpg")
+    image2 = str(image_folder / "image2.jpg")
+    # the workers open the images too, so they are opened as usual and only the threads opening them are recorded
+    opened_on = []
+    open_image = Image.open
+
+    def record_open(*args, **kwargs):
+        opened_on.append(threading.current_thread())
+        return open_image(*args, **kwargs)
+
+    mocker.patch("PIL.Image.open", side_effect=record_open)
+    image_ranker_app.update_images(image1, image2)
+    assert image_ranker_app.image1_button.cget("state") == "disabled"
+
+    box = image_ranker_app.box
+    rendered(image_ranker_app.prefetcher, image1, box)
+    rendered(image_ranker_app.prefetcher, image2, box)
+    image_ranker_app.refine_images(image1, image2, box)
+    assert opened_on
+    assert threading.main_thread() not in opened_on
 
     assert isinstance(image_ranker_app.image1_tk, ImageTk.PhotoImage)
     assert isinstance(image_ranker_app.image2_tk, ImageTk.PhotoImage)
+    assert image_ranker_app.image1_button.cget("state") == "normal"
+
+
+def test_update_images_failed(image_ranker_app, image_folder):
+    """Test an image that cannot be rendered is replaced by why, and the match can still be decided."""
+    image1 = str(image_folder / "image1.jpg")
+    broken = str(image_folder / "broken.jpg")
+    image_ranker_app.update_images(image1, broken)
+    box = image_ranker_app.box
+    rendered(image_ranker_app.prefetcher, image1, box)
+    image_ranker_app.prefetcher.renders[(broken, box)].exception()
+    image_ranker_app.refine_images(image1, broken, box)
+
+    assert isinstance(image_ranker_app.image1_tk, ImageTk.PhotoImage)
+    assert image_ranker_app.image2_tk == ""
+    assert "cannot identify image file" in image_ranker_app.image2_label.cget("text")
+    assert image_ranker_app.image1_button.cget("state") == "normal"
+    assert image_ranker_app.image2_button.cget("state") == "normal"
+
+
+def test_latency(image_ranker_app, mocker, image_folder):
+    """Test showing a match and deciding it are timed."""
+    mock_tournament(image_ranker_app, [[]])
+    image1 = str(image_folder / "image1.jpg")
+    image2 = str(image_folder / "image2.jpg")
+    image_ranker_app.update_images(image1, image2)
+    box = image_ranker_app.box
+    rendered(image_ranker_app.prefetcher, image1, box)
+    rendered(image_ranker_app.prefetcher, image2, box)
+    image_ranker_app.refine_images(image1, image2, box)
+    image_ranker_app.root.update_idletasks()
+    image_ranker_app.root.update()
+    image_ranker_app.select_image1()
+    image_ranker_app.root.update_idletasks()
+
+    summary = image_ranker_app.latency.summary()
+    for stage in ["fetch", "photo", "on_screen", "decision", "layout"]:
+        assert summary[stage]["count"] >= 1
 
 
 def test_update_ui(image_ranker_app):
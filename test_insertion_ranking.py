@@ -0,0 +1,135 @@
+import math
+import random
+
+import pytest
+
+from batch_ranker import run_concurrent, run_headless, score_judge
+from insertion_ranking import InsertionRanking, read_standings, write_standings
+
+
+def play(ranking, match_outcome):
+    """Run the ranking, deciding every match with match_outcome, and return the standings and match count."""
+    gen = ranking.run_tournament()
+    matches = 0
+    try:
+        a, b = next(gen)
+        while True:
+            assert a != b
+            matches += 1
+            a, b = gen.send(match_outcome(a, b))
+    except StopIteration as e:
+        return e.value, matches
+
+
+def participants_with_ranking(ranked_count, new_count, seed=1):
+    """Even participants ranked best first, with new odd ones among them, in a shuffled order."""
+    ranked = list(range(2 * ranked_count, 0, -2))
+    new = random.Random(seed).sample(
+        range(1, 2 * (ranked_count + new_count), 2), new_count
+    )
+    participants = ranked + new
+    random.Random(seed).shuffle(participants)
+    return dict.fromkeys(participants, True), ranked
+
+
+@pytest.mark.parametrize(
+    "test_input,ranked,expected",
+    [
+        (set(), [], []),
+        ({"A"}, [], ["A"]),
+        ({"A"}, ["A"], ["A"]),
+        ({"A", "B"}, ["B", "A"], ["B", "A"]),
+        ({"A", "B"}, ["A", "C"], ["B", "A"]),
+    ],
+)
+def test_small(test_input, ranked, expected):
+    """Test rankings too small to need more than one match, and ranked participants no longer taking part."""
+    standings, _ = play(InsertionRanking(test_input, ranked), max)
+    assert standings == expected
+
+
+@pytest.mark.parametrize("ranked_count", [0, 1, 7, 1000])
+@pytest.mark.parametrize("new_count", [1, 5, 50])
+def test_insertion(ranked_count, new_count):
+    """Test new participants are placed in order, within a binary search each and binary insertion in their gap."""
+    participants, ranked = participants_with_ranking(ranked_count, new_count)
+    standings, matches = play(InsertionRanking(participants, ranked), max)
+    assert standings == sorted(participants, reverse=True)
+    bound = new_count * math.ceil(math.log2(ranked_count + 1))
+    bound += sum(math.ceil(math.log2(placed + 1)) for placed in range(1, new_count))
+    assert matches <= bound
+
+
+def test_searches_at_once():
+    """Test every new participant is searched for in the ranking at once."""
+    participants, ranked = participants_with_ranking(100, 10)
+    ranking = InsertionRanking(participants, ranked)
+    pending = ranking.pending_matches()
+    assert len(pending) == 10
+    assert all(b in ranked for _, a, b in pending)
+
+
+def test_run_concurrent():
+    """Test the searches can be judged at once, with the same standings and matches."""
+    participants, ranked = participants_with_ranking(500, 40)
+    judge = score_judge(lambda participant: participant)
+    serial = run_headless(participants, judge, lambda p: InsertionRanking(p, ranked))
+    concurrent = run_concurrent(
+        participants, judge, 4, lambda p: InsertionRanking(p, ranked)
+    )
+    assert concurrent.standings == serial.standings
+    assert concurrent.matches == serial.matches
+
+
+def test_submit_result_errors():
+    """Test only scheduled matches can be decided, by one of their participants."""
+    ranking = InsertionRanking({"A", "B", "C"}, ["A", "B"])
+    match_id, a, b = ranking.pending_matches()[0]
+    with pytest.raises(ValueError):
+        ranking.submit_result(match_id, "D")
+    with pytest.raises(KeyError):
+        ranking.submit_result(match_id + 1, a)
+    ranking.submit_result(match_id, b)
+    with pytest.raises(ValueError):
+        ranking.submit_result(match_id, a)
+
+
+def test_upcoming_matches():
+    """Test the searches already under way follow the one in play."""
+    participants, ranked = participants_with_ranking(20, 4)
+    ranking = InsertionRanking(participants, ranked)
+    assert ranking.upcoming_matches(2) == [
+        (a, b) for _, a, b in ranking.pending_matches()[1:3]
+    ]
+
+
+def test_undo():
+    """Test decisions can be taken back, across the searches in gaps, back to the start."""
+    participants, ranked = participants_with_ranking(30, 12)
+    ranking = InsertionRanking(participants, ranked)
+    undone = []
+    ranking.undo_listeners.append(undone.append)
+    pending = []
+    while not ranking.finished:
+        pending.append(ranking.pending_matches())
+        match_id, a, b = pending[-1][0]
+        ranking.submit_result(match_id, max(a, b))
+    standings = ranking.final_standings
+    decisions = len(pending)
+
+    while pending:
+        ranking.undo()
+        assert ranking.pending_matches() == pending.pop()
+    assert len(undone) == decisions
+    with pytest.raises(IndexError):
+        ranking.undo()
+
+    assert play(ranking, max)[0] == standings
+
+
+def test_standings(tmp_path):
+    """Test the standings of a folder are kept for the next insertion."""
+    assert read_standings(tmp_path, "folder") == []
+    write_standings(tmp_path / "standings", "folder", ["b.jpg", "a.jpg"])
+    assert read_standings(tmp_path / "standings", "folder") == ["b.jpg", "a.jpg"]
+    assert read_standings(tmp_path / "standings", "other") == []
@@ -0,0 +1,75 @@
+import csv
+import json
+import pstats
+
+import pytest
+
+from latency import NULL_RECORDER, LatencyRecorder, percentile, profiled
+
+
+def test_percentile():
+    """Test nearest-rank percentiles."""
+    ordered = list(range(1, 101))
+    assert percentile(ordered, 50) == 50
+    assert percentile(ordered, 95) == 95
+    assert percentile(ordered, 100) == 100
+    assert percentile([7], 99) == 7
+
+
+def test_span():
+    """Test spans record a sample, even when the block raises."""
+    recorder = LatencyRecorder()
+    with recorder.span("decode"):
+        pass
+    with pytest.raises(KeyError):
+        with recorder.span("decode"):
+            raise KeyError("missing")
+    assert len(recorder.samples["decode"]) == 2
+
+
+def test_summary():
+    """Test stages are summarized in milliseconds, with percentiles and a histogram."""
+    recorder = LatencyRecorder()
+    for milliseconds in [0.5, 3, 3, 40, 90_000]:
+        recorder.record("decision", milliseconds / 1000)
+    summary = recorder.summary()["decision"]
+    assert summary["count"] == 5
+    assert summary["p50_ms"] == pytest.approx(3)
+    assert summary["max_ms"] == pytest.approx(90_000)
+    assert summary["histogram"]["<=1ms"] == 1
+    assert summary["histogram"]["<=5ms"] == 2
+    assert summary["histogram"]["<=50ms"] == 1
+    assert summary["histogram"][">60000ms"] == 1
+    assert sum(summary["histogram"].values()) == 5
+
+
+def test_write(tmp_path):
+    """Test the summary is exported as JSON, or as CSV with one row per stage."""
+    recorder = LatencyRecorder()
+    recorder.record("read", 0.002)
+    recorder.record("decode", 0.010)
+    recorder.write(tmp_path / "latency.json")
+    assert json.loads((tmp_path / "latency.json").read_text()) == recorder.summary()
+
+    recorder.write(tmp_path / "reports" / "latency.csv")
+    with open(tmp_path / "reports" / "latency.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["stage"] for row in rows] == ["read", "decode"]
+    assert float(rows[1]["p50_ms"]) == pytest.approx(10)
+    assert rows[1]["<=10ms"] == "1"
+
+
+def test_null_recorder():
+    """Test the null recorder accepts spans and records nothing."""
+    with NULL_RECORDER.span("decode"):
+        NULL_RECORDER.record("read", 1)
+
+
+def test_profiled(tmp_path):
+    """Test profiling writes the cProfile and tracemalloc reports."""
+    with profiled(tmp_path / "profile"):
+        sorted(str(i) for i in range(10_000))
+    pstats.Stats(str(tmp_path / "profile" / "profile.pstats"))
+    assert "cumulative" in (tmp_path / "profile" / "profile.txt").read_text()
+    allocations = (tmp_path / "profile" / "allocations.txt").read_text()
+    assert allocations.startswith("peak traced memory:")
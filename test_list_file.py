@@ -0,0 +1,10 @@
+from list_file import read_list, write_list
+
+
+def test_round_trip(tmp_path):
+    """Test a list written is read back in order, as strings, without blank lines."""
+    path = tmp_path / "list.txt"
+    write_list(path, ["b.jpg", "a.jpg", 3])
+    assert read_list(path) == ["b.jpg", "a.jpg", "3"]
+    path.write_text("a.jpg\n\n  b.jpg  \n")
+    assert read_list(path) == ["a.jpg", "b.jpg"]
@@ -0,0 +1,167 @@
+import json
+import time
+
+import pytest
+
+from bradley_terry_ranking import BradleyTerryRanking
+from double_elimination_tournament import DoubleEliminationTournament
+from insertion_ranking import InsertionRanking
+from match_journal import MatchJournal
+from top_k_selection import TopKSelection
+
+
+def match_outcome(a, b):
+    return a if a > b else b
+
+
+def play(tournament, matches=None):
+    """Decide up to matches matches of the tournament, in order."""
+    played = 0
+    while not tournament.finished and (matches is None or played < matches):
+        match_id, a, b = tournament.pending_matches(1)[0]
+        tournament.submit_result(match_id, match_outcome(a, b))
+        played += 1
+
+
+@pytest.fixture(scope="function")
+def journal(tmp_path):
+    journal = MatchJournal(tmp_path / "journals" / "journal.jsonl")
+    yield journal
+    journal.close()
+
+
+def test_new_journal(journal):
+    """Test a new journal records the participants in bracket order, then every result."""
+    tournament = journal.open_tournament(["C", "A", "B"])
+    play(tournament, 2)
+    journal.close()
+    lines = journal.path.read_text().splitlines()
+    assert json.loads(lines[0]) == {"version": 1, "participants": ["C", "A", "B"]}
+    assert [json.loads(line) for line in lines[1:]] == [
+        {"match": 0, "winner": "C"},
+        {"match": 1, "winner": "C"},
+    ]
+
+
+def test_resume(journal):
+    """Test reopening replays the journal and continues at the next match."""
+    participants = [f"P{i:02d}" for i in range(20)]
+    expected = journal.open_tournament(participants)
+    play(expected)
+    journal.discard()
+
+    tournament = journal.open_tournament(participants)
+    play(tournament, 17)
+    pending = tournament.pending_matches()
+    journal.close()
+
+    # the participants may come in another order, the journal keeps the bracket order
+    resumed = journal.open_tournament(reversed(participants))
+    assert resumed.pending_matches() == pending
+    play(resumed)
+    assert resumed.final_standings == expected.final_standings
+
+    journal.close()
+    _, results, _ = journal.read()
+    assert len(results) == 2 * 20 - 2
+
+
+def test_resume_other_engine(journal):
+    """Test an engine choosing its matches from the results so far resumes at the same match."""
+    participants = [f"P{i:02d}" for i in range(20)]
+    tournament = journal.open_tournament(participants, BradleyTerryRanking)
+    play(tournament, 25)
+    pending = tournament.pending_matches()
+    journal.close()
+
+    resumed = journal.open_tournament(participants, BradleyTerryRanking)
+    assert isinstance(resumed, BradleyTerryRanking)
+    assert resumed.pending_matches() == pending
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [DoubleEliminationTournament, BradleyTerryRanking, TopKSelection, InsertionRanking],
+)
+def test_resume_after_undo(journal, engine):
+    """Test decisions taken back are journaled and taken back again on replay."""
+    participants = [f"P{i:02d}" for i in range(20)]
+    tournament = journal.open_tournament(participants, engine)
+    play(tournament, 10)
+    tournament.undo()
+    tournament.undo()
+    match_id, a, b = tournament.pending_matches(1)[0]
+    # decided the other way this time
+    tournament.submit_result(match_id, b if match_outcome(a, b) == a else a)
+    pending = tournament.pending_matches()
+    journal.close()
+
+    lines = journal.path.read_text().splitlines()
+    assert [json.loads(line) for line in lines[-3:-1]] == [{"undo": 9}, {"undo": 8}]
+    resumed = journal.open_tournament(participants, engine)
+    assert resumed.pending_matches() == pending
+    assert len(resumed.history) == 9
+
+
+def test_path_for_engine(tmp_path):
+    """Test each engine keeps its own journal of a folder."""
+    default = MatchJournal.path_for(tmp_path, "folder")
+    assert MatchJournal.path_for(tmp_path, "folder", "double_elimination") == default
+    assert MatchJournal.path_for(tmp_path, "folder", "bradley_terry") != default
+
+
+def test_other_participants_start_over(journal):
+    """Test a journal over other participants is replaced."""
+    play(journal.open_tournament(["A", "B", "C"]), 2)
+    journal.close()
+    tournament = journal.open_tournament(["A", "B", "D"])
+    assert tournament.pending_matches() == [(0, "A", "B")]
+    journal.close()
+    participants, results, _ = journal.read()
+    assert participants == ["A", "B", "D"]
+    assert results == []
+
+
+def test_truncated_last_line(journal):
+    """Test a result cut short by a crash is dropped, and the journal carries on after it."""
+    play(journal.open_tournament(["A", "B", "C", "D"]), 2)
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('{"match":2,"win')
+
+    tournament = journal.open_tournament(["A", "B", "C", "D"])
+    assert tournament.pending_matches() == [(2, "A", "C"), (3, "B", "D")]
+    play(tournament, 1)
+    journal.close()
+    _, results, _ = journal.read()
+    assert results == [(0, "B"), (1, "D"), (2, "C")]
+
+
+def test_corrupt_line(journal):
+    """Test a corrupt line before the last one is an error rather than silently dropped results."""
+    play(journal.open_tournament(["A", "B", "C", "D"]), 2)
+    journal.close()
+    lines = journal.path.read_text().splitlines()
+    lines[1] = lines[1][:5]
+    journal.path.write_text("\n".join(lines) + "\n")
+    with pytest.raises(ValueError):
+        journal.read()
+
+
+def test_discard(journal):
+    """Test a discarded journal is deleted."""
+    journal.open_tournament(["A", "B"])
+    journal.discard()
+    assert not journal.path.exists()
+
+
+def test_replay_speed(journal):
+    """Test replaying tens of thousands of results is fast."""
+    participants = [f"P{i:05d}" for i in range(20_000)]
+    play(journal.open_tournament(participants), 39_000)
+    journal.close()
+
+    start = time.perf_counter()
+    tournament = journal.open_tournament(participants)
+    assert time.perf_counter() - start < 1.0
+    assert tournament.next_match_id > 39_000
@@ -0,0 +1,163 @@
+from functools import partial
+
+import pytest
+
+from batch_ranker import run_concurrent, run_headless, score_judge
+from bradley_terry_ranking import BradleyTerryRanking
+from double_elimination_tournament import DoubleEliminationTournament
+from match_journal import MatchJournal
+from preference_graph import InferringTournament, PreferenceGraph, PreferenceStore
+
+
+@pytest.fixture(scope="function")
+def store(tmp_path):
+    store = PreferenceStore(tmp_path / "preferences.sqlite3")
+    yield store
+    store.close()
+
+
+def test_transitive():
+    """Test a judgment implies everything below the loser is below the winner, and everything above too."""
+    graph = PreferenceGraph("ABCDE")
+    graph.add("A", "B")
+    graph.add("C", "D")
+    assert graph.winner("A", "D") is None
+    graph.add("B", "C")
+    assert graph.winner("A", "D") == "A"
+    assert graph.winner("D", "A") == "A"
+    assert graph.winner("B", "D") == "B"
+    assert graph.winner("A", "E") is None
+
+
+def test_contradiction():
+    """Test judgments in a cycle imply nothing about its participants."""
+    graph = PreferenceGraph("ABCD")
+    graph.add("A", "B")
+    graph.add("B", "C")
+    graph.add("C", "A")
+    graph.add("C", "D")
+    assert graph.winner("A", "C") is None
+    assert graph.winner("A", "D") == "A"
+
+
+def test_remove():
+    """Test a judgment taken back no longer implies anything."""
+    graph = PreferenceGraph("ABC")
+    graph.add("A", "B")
+    graph.add("B", "C")
+    graph.remove("B", "C")
+    assert graph.winner("A", "C") is None
+    assert graph.winner("A", "B") == "A"
+
+
+def test_remove_last():
+    """Test taking back the last judgment restores the closure from before it, and others are still taken back."""
+    graph = PreferenceGraph("ABCD")
+    graph.add("A", "B")
+    graph.add("C", "D")
+    before = list(graph.below)
+    graph.add("B", "C")
+    graph.remove("B", "C")
+    assert graph.below == before
+    graph.add("D", "A")
+    graph.remove("A", "B")
+    assert graph.winner("C", "A") == "C"
+    assert graph.winner("A", "B") is None
+
+
+def test_store_writes_in_background(tmp_path):
+    """Test judgments are made without waiting on the file, and are all in it once it is closed."""
+    store = PreferenceStore(tmp_path / "preferences.sqlite3")
+    graph = PreferenceGraph(["a.jpg", "b.jpg", "c.jpg"], store)
+    # nothing can be written while the file is held
+    with store.lock:
+        graph.add("a.jpg", "b.jpg")
+        graph.add("b.jpg", "c.jpg")
+        graph.remove("b.jpg", "c.jpg")
+    store.close()
+
+    store = PreferenceStore(tmp_path / "preferences.sqlite3")
+    try:
+        assert store.load(["a.jpg", "b.jpg", "c.jpg"]) == [('"a.jpg"', '"b.jpg"')]
+    finally:
+        store.close()
+
+
+def test_store(store):
+    """Test judgments are kept for later sessions, over any of the same participants."""
+    graph = PreferenceGraph(["a.jpg", "b.jpg", "c.jpg"], store)
+    assert graph.add("a.jpg", "b.jpg")
+    assert not graph.add("a.jpg", "b.jpg")
+    graph.add("b.jpg", "c.jpg")
+
+    later = PreferenceGraph(["c.jpg", "a.jpg", "x.jpg"], store)
+    assert later.winner("a.jpg", "c.jpg") is None
+    assert later.edges == set()
+    later = PreferenceGraph(["c.jpg", "b.jpg", "a.jpg"], store)
+    assert later.winner("c.jpg", "a.jpg") == "a.jpg"
+
+
+@pytest.mark.parametrize("engine", [DoubleEliminationTournament, BradleyTerryRanking])
+def test_next_session(store, engine):
+    """Test ranking the same participants again asks nothing, and gives the same standings."""
+    participants = {f"P{i:03d}": True for i in range(60)}
+    judge = score_judge(lambda participant: hash(participant) % 101)
+    first = run_headless(participants, judge, InferringTournament.wrap(engine, store))
+    second = run_headless(participants, judge, InferringTournament.wrap(engine, store))
+    assert first.matches > 0
+    assert second.matches == 0
+    assert second.standings == first.standings
+    concurrent = run_concurrent(
+        participants, judge, 4, InferringTournament.wrap(engine, store)
+    )
+    assert concurrent.standings == first.standings
+
+
+def test_fewer_matches():
+    """Test matches implied within a session are not asked."""
+    participants = {i: True for i in range(1, 101)}
+    judge = score_judge(lambda participant: participant)
+    # as many matches as it allows, so it does not stop before a match is implied
+    engine = partial(BradleyTerryRanking, confidence=1)
+    plain = run_headless(participants, judge, engine)
+    inferred = run_headless(participants, judge, InferringTournament.wrap(engine))
+    assert inferred.matches < plain.matches
+
+
+def test_undo():
+    """Test taking back a decision also takes back those inferred from it, and forgets the judgment."""
+    tournament = InferringTournament.wrap(DoubleEliminationTournament)({"A", "B"})
+    results = []
+    tournament.result_listeners.append(lambda match_id, winner: results.append(winner))
+    ((match_id, a, b),) = tournament.pending_matches()
+    tournament.submit_result(match_id, a)
+    # the grand final is a rematch
+    assert tournament.pending_matches() == []
+    assert tournament.finished
+    assert results == [a, a]
+
+    assert tournament.undo() == (match_id, a)
+    assert not tournament.finished
+    assert tournament.graph.winner(a, b) is None
+    assert tournament.pending_matches() == [(match_id, a, b)]
+    with pytest.raises(IndexError):
+        tournament.undo()
+
+
+def test_journal(tmp_path, store):
+    """Test a journal replays the inferred decisions too, and undoes them with the decision they followed."""
+    participants = [f"P{i}" for i in range(8)]
+    engine = InferringTournament.wrap(DoubleEliminationTournament, store)
+    journal = MatchJournal(tmp_path / "journal.jsonl")
+    tournament = journal.open_tournament(participants, engine)
+    for _ in range(10):
+        ((match_id, a, b),) = tournament.pending_matches(1)
+        tournament.submit_result(match_id, max(a, b))
+    tournament.undo()
+    pending = tournament.pending_matches()
+    journal.close()
+
+    resumed = MatchJournal(tmp_path / "journal.jsonl").open_tournament(
+        participants, engine
+    )
+    assert resumed.pending_matches() == pending
@@ -0,0 +1,79 @@
+import pytest
+from PIL import Image
+
+from prerenderer import Prerenderer, prerender
+from thumbnail_cache import ThumbnailCache
+
+
+@pytest.fixture(scope="function")
+def cache(tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache" / "thumbnails.sqlite3")
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(scope="function")
+def image_paths(tmp_path):
+    paths = []
+    for index in range(4):
+        path = tmp_path / f"image{index}.png"
+        Image.new("RGB", (400, 200), color=(index * 60, 0, 0)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_prerender(image_paths):
+    """Test a worker returns the rendition encoded for the cache."""
+    data = prerender(image_paths[0], (100, 100))
+    assert data.startswith(b"\xff\xd8\xff")
+
+
+def test_renders_into_cache(cache, image_paths):
+    """Test every image ends up in the cache, rendered for the box."""
+    prerenderer = Prerenderer(image_paths, (100, 100), cache, max_workers=2)
+    prerenderer.start()
+    assert prerenderer.done.wait(60)
+
+    assert prerenderer.progress() == (4, 4)
+    assert prerenderer.failed == 0
+    for path in image_paths:
+        assert cache.get(path, (100, 100)).size == (100, 50)
+
+
+def test_skips_cached(cache, image_paths, mocker):
+    """Test images already in the cache are not rendered again."""
+    for path in image_paths:
+        cache.put(path, (100, 100), Image.new("RGB", (100, 50)))
+    put_encoded = mocker.spy(cache, "put_encoded")
+    prerenderer = Prerenderer(image_paths, (100, 100), cache, max_workers=1)
+    prerenderer.start()
+    assert prerenderer.done.wait(60)
+
+    assert prerenderer.progress() == (4, 4)
+    put_encoded.assert_not_called()
+
+
+def test_unreadable_image(cache, image_paths, tmp_path):
+    """Test an image that cannot be rendered is counted, and does not stop the others."""
+    broken = tmp_path / "broken.png"
+    broken.write_text("not an image")
+    prerenderer = Prerenderer(
+        [str(broken)] + image_paths, (100, 100), cache, max_workers=1
+    )
+    prerenderer.start()
+    assert prerenderer.done.wait(60)
+
+    assert prerenderer.progress() == (5, 5)
+    assert prerenderer.failed == 1
+    assert cache.contains(image_paths[-1], (100, 100))
+
+
+def test_cancel(cache, image_paths):
+    """Test nothing is rendered into the cache after cancelling."""
+    prerenderer = Prerenderer(image_paths, (100, 100), cache, max_workers=1)
+    prerenderer.cancel()
+    prerenderer.start()
+    assert prerenderer.done.wait(60)
+
+    assert prerenderer.progress() == (0, 4)
+    assert not any(cache.contains(path, (100, 100)) for path in image_paths)
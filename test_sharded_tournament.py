@@ -0,0 +1,218 @@
+import pytest
+
+from batch_ranker import run_concurrent, run_headless, score_judge
+from bradley_terry_ranking import BradleyTerryRanking
+from match_journal import MatchJournal
+from sharded_tournament import (
+    ShardedTournament,
+    main,
+    merge_standings,
+    partition,
+    promote,
+    split_evenly,
+)
+
+
+def test_split_evenly():
+    """Test shards are as few and as even as the shard size allows."""
+    assert [len(shard) for shard in split_evenly(list(range(10)), 4)] == [3, 3, 4]
+    assert split_evenly(list(range(4)), 4) == [[0, 1, 2, 3]]
+    assert split_evenly([], 4) == []
+
+
+def test_partition_by_folder():
+    """Test paths are grouped by folder before being split."""
+    paths = ["/a/1.jpg", "/b/1.jpg", "/a/2.jpg", "/a/3.jpg", "/b/2.jpg"]
+    assert partition(paths, 2) == [
+        ["/a/1.jpg"],
+        ["/a/2.jpg", "/a/3.jpg"],
+        ["/b/1.jpg", "/b/2.jpg"],
+    ]
+    assert partition(paths, 5, by_folder=False) == [paths]
+
+
+def test_promote():
+    """Test the final is seeded with every shard's winner first."""
+    assert promote([["A1", "A2", "A3"], ["B1"], ["C1", "C2"]], 2) == [
+        "A1",
+        "B1",
+        "C1",
+        "A2",
+        "C2",
+    ]
+
+
+def test_merge_standings():
+    """Test the final comes first, then the rest by rank in their shard, stronger shards first."""
+    shards = [["A1", "A2", "A3"], ["B1", "B2", "B3", "B4"]]
+    assert merge_standings(shards, ["B1", "A1"], 1) == [
+        "B1",
+        "A1",
+        "B2",
+        "A2",
+        "B3",
+        "A3",
+        "B4",
+    ]
+
+
+def test_run_headless():
+    """Test the best of a strong shard can win overall, and everyone is ranked once."""
+    participants = {i: True for i in range(100)}
+    result = run_headless(
+        participants, score_judge(lambda participant: participant), ShardedTournament
+    )
+    assert sorted(result.standings) == list(range(100))
+    assert result.standings[0] == 99
+
+
+def test_top_k_promoted():
+    """Test the top_k of every shard are promoted, and ranked ahead of the rest, with a perfect judge."""
+    participants = {i: True for i in range(40)}
+    tournament = ShardedTournament(participants, shard_size=10, top_k=3)
+    assert len(tournament.shards) == 4
+    gen = tournament.run_tournament()
+    try:
+        a, b = next(gen)
+        while True:
+            a, b = gen.send(max(a, b))
+    except StopIteration as e:
+        standings = e.value
+    # the top 3 of each shard of 10 consecutive participants
+    assert standings[0] == 39
+    assert set(standings[:12]) == {39, 38, 37, 29, 28, 27, 19, 18, 17, 9, 8, 7}
+    assert sorted(standings) == list(range(40))
+
+
+def test_single_shard():
+    """Test a collection that fits in one shard needs no final."""
+    result = run_headless({"A", "B", "C"}, score_judge(ord), ShardedTournament)
+    assert result.standings == ["C", "B", "A"]
+
+
+def test_run_concurrent():
+    """Test matches of every shard can be judged at once, with the same standings."""
+    participants = {f"P{i:03d}": True for i in range(60)}
+    judge = score_judge(lambda participant: hash(participant) % 13)
+
+    def engine(participants):
+        return ShardedTournament(participants, shard_size=16, top_k=2)
+
+    serial = run_headless(participants, judge, engine)
+    concurrent = run_concurrent(participants, judge, 4, engine)
+    assert concurrent.standings == serial.standings
+    assert concurrent.matches == serial.matches
+
+
+def test_other_engine():
+    """Test shards and the final can be played by another engine."""
+    tournament = ShardedTournament(
+        {i: True for i in range(30)},
+        shard_size=10,
+        top_k=2,
+        engine=BradleyTerryRanking,
+    )
+    while not tournament.finished:
+        ((match_id, a, b),) = tournament.pending_matches(1)
+        tournament.submit_result(match_id, max(a, b))
+    assert sorted(tournament.final_standings) == list(range(30))
+
+
+def test_submit_result_unknown():
+    """Test matches of the final cannot be decided before it starts."""
+    tournament = ShardedTournament({i: True for i in range(20)}, shard_size=10)
+    with pytest.raises(KeyError):
+        tournament.submit_result(2, 0)
+
+
+def test_journal_resume(tmp_path):
+    """Test a journaled sharded tournament resumes at the same match, across shards."""
+    participants = [f"/photos/{folder}/{i}.jpg" for folder in "ab" for i in range(5)]
+
+    def engine(participants):
+        return ShardedTournament(participants, top_k=2)
+
+    journal = MatchJournal(tmp_path / "journal.jsonl")
+    tournament = journal.open_tournament(participants, engine)
+    for _ in range(12):
+        ((match_id, a, b),) = tournament.pending_matches(1)
+        tournament.submit_result(match_id, max(a, b))
+    journal.close()
+
+    resumed = MatchJournal(tmp_path / "journal.jsonl").open_tournament(
+        participants, engine
+    )
+    assert resumed.pending_matches() == tournament.pending_matches()
+
+
+def test_main(tmp_path, capsys):
+    """Test shards can be split, promoted and merged through files, as separate people would."""
+    paths = [str(tmp_path / f"{i}.jpg") for i in range(6)]
+    for path in paths:
+        open(path, "wb").write(b"\xff\xd8\xff\xe0")
+    main(
+        [
+            "split",
+            str(tmp_path),
+            "--shard-size",
+            "3",
+            "--output-dir",
+            str(tmp_path / "shards"),
+        ]
+    )
+    shards = sorted((tmp_path / "shards").iterdir())
+    assert [path.name for path in shards] == ["shard-001.txt", "shard-002.txt"]
+
+    # each shard ranked in reverse order, the final won by the second shard
+    standings = []
+    for number, shard in enumerate(shards):
+        standing = tmp_path / f"standings-{number}.txt"
+        standing.write_text("".join(reversed(shard.read_text().splitlines(True))))
+        standings.append(str(standing))
+    main(["final", *standings, "--top-k", "1", "--output", str(tmp_path / "final.txt")])
+    final = (tmp_path / "final.txt").read_text().splitlines()
+    assert final == [paths[2], paths[5]]
+    (tmp_path / "final-standings.txt").write_text(f"{paths[5]}\n{paths[2]}\n")
+
+    main(
+        [
+            "merge",
+            *standings,
+            "--final",
+            str(tmp_path / "final-standings.txt"),
+            "--top-k",
+            "1",
+        ]
+    )
+    assert capsys.readouterr().out.split() == [
+        paths[5],
+        paths[2],
+        paths[4],
+        paths[1],
+        paths[3],
+        paths[0],
+    ]
+
+
+def test_undo():
+    """Test decisions can be taken back across shards and the final."""
+    tournament = ShardedTournament({i: True for i in range(20)}, shard_size=10, top_k=2)
+    pending = []
+    while not tournament.finished:
+        pending.append(tournament.pending_matches())
+        match_id, a, b = pending[-1][0]
+        tournament.submit_result(match_id, max(a, b))
+    standings = tournament.final_standings
+
+    while pending:
+        match_id, winner = tournament.undo()
+        assert tournament.pending_matches() == pending.pop()
+    assert tournament.final is None
+
+    play = tournament.run_tournament()
+    a, b = next(play)
+    try:
+        while True:
+            a, b = play.send(max(a, b))
+    except StopIteration as e:
+        assert e.value == standings
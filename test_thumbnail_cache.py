@@ -0,0 +1,174 @@
+import os
+
+import pytest
+from PIL import Image
+
+from image_prefetcher import ImagePrefetcher
+from test_image_prefetcher import rendered
+from thumbnail_cache import ThumbnailCache
+
+
+@pytest.fixture(scope="function")
+def cache(tmp_path):
+    cache = ThumbnailCache(tmp_path / "cache" / "thumbnails.sqlite3")
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(scope="function")
+def image_path(tmp_path):
+    path = tmp_path / "image.png"
+    Image.new("RGB", (400, 200), color=(255, 0, 0)).save(path)
+    return str(path)
+
+
+def test_get_missing(cache, image_path):
+    """Test a rendition that was never stored is a miss."""
+    assert cache.get(image_path, (100, 100)) is None
+
+
+def test_put_then_get(cache, image_path):
+    """Test a stored rendition is returned for the same box only."""
+    cache.put(image_path, (100, 100), Image.new("RGB", (100, 50), color=(255, 0, 0)))
+    img = cache.get(image_path, (100, 100))
+    assert img.size == (100, 50)
+    assert img.getpixel((50, 25))[0] > 240
+    assert cache.get(image_path, (200, 200)) is None
+
+
+def test_persists(tmp_path, image_path):
+    """Test renditions survive reopening the cache."""
+    cache = ThumbnailCache(tmp_path / "thumbnails.sqlite3")
+    cache.put(image_path, (100, 100), Image.new("RGB", (100, 50)))
+    cache.close()
+    cache = ThumbnailCache(tmp_path / "thumbnails.sqlite3")
+    assert cache.get(image_path, (100, 100)).size == (100, 50)
+    cache.close()
+
+
+def test_transparency_kept(cache, image_path):
+    """Test renditions with an alpha channel are not flattened."""
+    cache.put(image_path, (100, 100), Image.new("RGBA", (100, 50), (0, 0, 0, 0)))
+    assert cache.get(image_path, (100, 100)).mode == "RGBA"
+
+
+def test_stale_entries_dropped(cache, image_path):
+    """Test a changed file drops all of its renditions."""
+    cache.put(image_path, (100, 100), Image.new("RGB", (100, 50)))
+    cache.put(image_path, (200, 200), Image.new("RGB", (200, 100)))
+    Image.new("RGB", (300, 300)).save(image_path)
+    stat = os.stat(image_path)
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert cache.get(image_path, (100, 100)) is None
+    (count,) = cache.connection.execute("SELECT COUNT(*) FROM thumbnails").fetchone()
+    assert count == 0
+
+
+def test_contains(cache, image_path):
+    """Test contains reports up to date renditions only."""
+    assert not cache.contains(image_path, (100, 100))
+    cache.put_encoded(
+        image_path, (100, 100), ThumbnailCache.encode(Image.new("RGB", (100, 50)))
+    )
+    assert cache.contains(image_path, (100, 100))
+    assert not cache.contains(image_path, (200, 200))
+
+    stat = os.stat(image_path)
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert not cache.contains(image_path, (100, 100))
+
+
+def test_lru_eviction(tmp_path):
+    """Test the least recently used renditions are evicted past the size limit."""
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"image{i}.png"
+        Image.new("RGB", (10, 10)).save(path)
+        paths.append(str(path))
+    size = len(ThumbnailCache.encode(Image.new("RGB", (64, 64))))
+    cache = ThumbnailCache(tmp_path / "thumbnails.sqlite3", max_bytes=2 * size)
+
+    cache.put(paths[0], (64, 64), Image.new("RGB", (64, 64)))
+    cache.put(paths[1], (64, 64), Image.new("RGB", (64, 64)))
+    # touch the first one, so the second one is the least recently used
+    assert cache.get(paths[0], (64, 64)) is not None
+    cache.put(paths[2], (64, 64), Image.new("RGB", (64, 64)))
+
+    assert cache.get(paths[0], (64, 64)) is not None
+    assert cache.get(paths[1], (64, 64)) is None
+    assert cache.get(paths[2], (64, 64)) is not None
+    assert cache.total == 2 * size
+    cache.close()
+
+
+def test_total(tmp_path, image_path):
+    """Test the bytes stored are kept count of through puts, replacements and drops, without adding up the table."""
+    path = tmp_path / "thumbnails.sqlite3"
+    cache = ThumbnailCache(path)
+    statements = []
+    cache.connection.set_trace_callback(statements.append)
+
+    def stored():
+        (total,) = cache.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM thumbnails"
+        ).fetchone()
+        return total
+
+    cache.put(image_path, (100, 100), Image.new("RGB", (100, 50)))
+    cache.put(image_path, (200, 200), Image.new("RGB", (200, 100)))
+    cache.put(image_path, (100, 100), Image.new("RGBA", (100, 50), (0, 0, 0, 0)))
+    assert "SELECT COALESCE(SUM(size), 0) FROM thumbnails" not in statements
+    assert cache.total == stored()
+
+    stat = os.stat(image_path)
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.get(image_path, (100, 100)) is None
+    assert cache.total == stored() == 0
+    cache.put(image_path, (100, 100), Image.new("RGB", (100, 50)))
+    total = cache.total
+    cache.close()
+
+    cache = ThumbnailCache(path)
+    assert cache.total == total
+    cache.close()
+
+
+def test_prefetcher_uses_cache(cache, image_path, mocker):
+    """Test the prefetcher fills the cache and reads from it afterwards."""
+    prefetcher = ImagePrefetcher(max_workers=1, cache=cache)
+    assert rendered(prefetcher, image_path, (100, 100)).size == (100, 50)
+    prefetcher.shutdown()
+
+    mock_render_image = mocker.patch("image_prefetcher.render_image")
+    prefetcher = ImagePrefetcher(max_workers=1, cache=cache)
+    assert rendered(prefetcher, image_path, (100, 100)).size == (100, 50)
+    prefetcher.shutdown()
+    mock_render_image.assert_not_called()
+
+
+def test_cmyk(cache, tmp_path):
+    """Test a CMYK rendition is stored as RGB, and the prefetcher renders CMYK images with the cache on."""
+    path = tmp_path / "cmyk.jpg"
+    Image.new("CMYK", (400, 200), (0, 255, 255, 0)).save(path)
+    cache.put(str(path), (100, 100), Image.new("CMYK", (100, 50), (0, 255, 255, 0)))
+    img = cache.get(str(path), (100, 100))
+    assert img.mode == "RGB"
+    assert img.getpixel((50, 25))[0] > 240
+
+    prefetcher = ImagePrefetcher(max_workers=1, cache=cache)
+    try:
+        assert rendered(prefetcher, str(path), (200, 200)).size == (200, 100)
+        assert cache.contains(str(path), (200, 200))
+    finally:
+        prefetcher.shutdown()
+
+
+def test_failed_put_keeps_rendition(cache, image_path, mocker):
+    """Test a rendition the cache cannot store is still rendered."""
+    mocker.patch.object(cache, "put", side_effect=OSError("disk full"))
+    prefetcher = ImagePrefetcher(max_workers=1, cache=cache)
+    try:
+        assert rendered(prefetcher, image_path, (100, 100)).size == (100, 50)
+    finally:
+        prefetcher.shutdown()
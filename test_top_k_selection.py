@@ -0,0 +1,116 @@
+import math
+import random
+
+import pytest
+
+from batch_ranker import run_concurrent, run_headless, score_judge
+from double_elimination_tournament import DoubleEliminationTournament
+from top_k_selection import TopKSelection
+
+
+def play(selection, match_outcome):
+    """Run the selection, deciding every match with match_outcome, and return the standings and match count."""
+    gen = selection.run_tournament()
+    matches = 0
+    try:
+        a, b = next(gen)
+        while True:
+            assert a != b
+            matches += 1
+            a, b = gen.send(match_outcome(a, b))
+    except StopIteration as e:
+        return e.value, matches
+
+
+@pytest.mark.parametrize(
+    "test_input,expected",
+    [
+        (set(), []),
+        ({"A"}, ["A"]),
+        ({"A", "B"}, ["B", "A"]),
+    ],
+)
+def test_small(test_input, expected):
+    """Test selections too small to need more than one match."""
+    standings, _ = play(TopKSelection(test_input), max)
+    assert standings == expected
+
+
+@pytest.mark.parametrize("count", [3, 9, 64, 1000])
+@pytest.mark.parametrize("top_k", [1, 3, 10])
+def test_top_k(count, top_k):
+    """Test the first top_k places are decided in order, within the matches a tournament tree needs."""
+    participants = list(range(1, count + 1))
+    random.Random(count).shuffle(participants)
+    standings, matches = play(
+        TopKSelection(dict.fromkeys(participants, True), top_k=top_k), max
+    )
+    assert standings[:top_k] == list(range(count, 0, -1))[:top_k]
+    assert sorted(standings) == list(range(1, count + 1))
+    places = min(top_k, count)
+    assert matches <= count - 1 + (places - 1) * math.ceil(math.log2(count))
+
+
+def test_fewer_matches():
+    """Test the best 10 of a large collection take about half the matches of a full double elimination."""
+    participants = {i: True for i in range(1, 3001)}
+    judge = score_judge(lambda participant: participant)
+    selection = run_headless(participants, judge, TopKSelection)
+    full = run_headless(participants, judge, DoubleEliminationTournament)
+    assert selection.standings[:10] == list(range(3000, 2990, -1))
+    assert selection.matches < 0.55 * full.matches
+
+
+def test_run_concurrent():
+    """Test the matches of the knockout can be judged at once, with the same places."""
+    participants = {f"P{i:03d}": True for i in range(100)}
+    judge = score_judge(lambda participant: hash(participant) % 37)
+    serial = run_headless(participants, judge, TopKSelection)
+    concurrent = run_concurrent(participants, judge, 4, TopKSelection)
+    assert concurrent.standings[:10] == serial.standings[:10]
+    assert concurrent.matches == serial.matches
+
+
+def test_submit_result_errors():
+    """Test only scheduled matches can be decided, by one of their participants."""
+    selection = TopKSelection({"A", "B", "C"})
+    match_id, a, b = selection.pending_matches()[0]
+    with pytest.raises(ValueError):
+        selection.submit_result(match_id, "D")
+    with pytest.raises(KeyError):
+        selection.submit_result(match_id + 1, a)
+    selection.submit_result(match_id, a)
+    with pytest.raises(ValueError):
+        selection.submit_result(match_id, a)
+
+
+def test_upcoming_matches():
+    """Test the matches of the knockout already fixed follow the one in play."""
+    selection = TopKSelection(set(range(1, 9)))
+    assert len(selection.pending_matches()) == 4
+    assert selection.upcoming_matches(2) == [
+        (a, b) for _, a, b in selection.pending_matches()[1:3]
+    ]
+
+
+def test_undo():
+    """Test decisions can be taken back across extractions, back to the start."""
+    selection = TopKSelection(set(range(1, 21)), top_k=4)
+    undone = []
+    selection.undo_listeners.append(undone.append)
+    pending = []
+    while not selection.finished:
+        pending.append(selection.pending_matches())
+        match_id, a, b = pending[-1][0]
+        selection.submit_result(match_id, max(a, b))
+    standings = selection.final_standings
+    decisions = len(pending)
+
+    while pending:
+        match_id, winner = selection.undo()
+        assert selection.pending_matches() == pending.pop()
+    assert len(undone) == decisions
+    with pytest.raises(IndexError):
+        selection.undo()
+
+    assert play(selection, max)[0] == standings
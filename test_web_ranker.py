@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import pytest
+from PIL import Image
+
+from thumbnail_cache import ThumbnailCache
+from web_ranker import WebRanker
+
+
+@pytest.fixture(scope="function")
+def images(tmp_path):
+    paths = []
+    for index in range(4):
+        path = tmp_path / f"image{index}.png"
+        Image.new("RGB", (400, 200), color=(index * 60, 0, 0)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture(scope="function")
+def ranker(images, tmp_path):
+    ranker = WebRanker(images, str(tmp_path), box=(100, 100))
+    yield ranker
+    ranker.close()
+
+
+def request(ranker, method, target, body=None, headers=None):
+    """Handle a request on a new event loop, returning the status, headers and body."""
+    content = json.dumps(body).encode() if body is not None else b""
+    return asyncio.run(ranker.handle(method, target, headers or {}, content))
+
+
+def test_page(ranker):
+    """Test the judging page is served."""
+    status, headers, body = request(ranker, "GET", "/")
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/html")
+    assert b"/decide" in body
+
+
+def test_clients_get_different_matches(ranker):
+    """Test clients judging at once are handed different matches while there are enough."""
+    _, _, first = request(ranker, "GET", "/match")
+    _, _, second = request(ranker, "GET", "/match")
+    first, second = json.loads(first), json.loads(second)
+    assert first["match"] != second["match"]
+    # all are held, the one held longest is handed out again
+    _, _, third = request(ranker, "GET", "/match")
+    assert json.loads(third)["match"] == first["match"]
+
+
+def test_decide(ranker):
+    """Test a decision is taken once, and the next match is returned."""
+    _, _, state = request(ranker, "GET", "/match")
+    state = json.loads(state)
+    decision = {"match": state["match"], "winner": state["images"][0]}
+    status, _, body = request(ranker, "POST", "/decide", decision)
+    assert status == 200
+    assert json.loads(body)["decided"] == 1
+
+    status, _, body = request(ranker, "POST", "/decide", decision)
+    assert status == 409
+    assert "match" in json.loads(body)
+
+    status, _, _ = request(ranker, "POST", "/decide", {"match": "x"})
+    assert status == 400
+
+
+def test_undo(ranker):
+    """Test the last decision can be taken back."""
+    status, _, _ = request(ranker, "POST", "/undo", {})
+    assert status == 409
+    state = json.loads(request(ranker, "GET", "/match")[2])
+    request(
+        ranker,
+        "POST",
+        "/decide",
+        {"match": state["match"], "winner": state["images"][1]},
+    )
+    status, _, body = request(ranker, "POST", "/undo", {})
+    assert status == 200
+    assert json.loads(body)["decided"] == 0
+
+
+def test_finish(ranker):
+    """Test the standings are returned once every match is decided."""
+    state = json.loads(request(ranker, "GET", "/match")[2])
+    while not state["finished"]:
+        winner = max(state["images"])
+        state = json.loads(
+            request(
+                ranker, "POST", "/decide", {"match": state["match"], "winner": winner}
+            )[2]
+        )
+    assert state["standings"][0] == "image3.png"
+    status, _, body = request(ranker, "GET", "/standings?format=text")
+    assert status == 200
+    assert body.decode().splitlines()[0] == ranker.tournament.keys[3]
+
+
+def test_image(ranker):
+    """Test images are served rendered for the box, with a validator browsers can revalidate with."""
+    status, headers, body = request(ranker, "GET", "/image/0")
+    assert status == 200
+    assert headers["Content-Type"] == "image/jpeg"
+    assert "max-age" in headers["Cache-Control"]
+    assert body.startswith(b"\xff\xd8")
+
+    status, _, body = request(
+        ranker, "GET", "/image/0", headers={"if-none-match": headers["ETag"]}
+    )
+    assert status == 304
+    assert body == b""
+    assert request(ranker, "GET", "/image/99")[0] == 404
+
+
+def test_image_from_cache(images, tmp_path, mocker):
+    """Test renditions already in the thumbnail cache are served as stored."""
+    cache = ThumbnailCache(tmp_path / "thumbnails.sqlite3")
+    cache.put(images[0], (100, 100), Image.new("RGB", (100, 50)))
+    mock_render_image = mocker.patch("web_ranker.render_image")
+    ranker = WebRanker(images, str(tmp_path), box=(100, 100), thumbnail_cache=cache)
+    try:
+        index = ranker.index[images[0]]
+        status, _, body = request(ranker, "GET", f"/image/{index}")
+        assert status == 200
+        assert body == cache.get_encoded(images[0], (100, 100))
+        mock_render_image.assert_not_called()
+    finally:
+        ranker.close()
+        cache.close()
+
+
+def test_journal(images, tmp_path):
+    """Test decisions are journaled, so a restarted server continues the tournament."""
+    journal_dir = tmp_path / "journals"
+    ranker = WebRanker(images, str(tmp_path), journal_dir=journal_dir)
+    state = json.loads(request(ranker, "GET", "/match")[2])
+    request(
+        ranker,
+        "POST",
+        "/decide",
+        {"match": state["match"], "winner": state["images"][0]},
+    )
+    ranker.close()
+
+    ranker = WebRanker(images, str(tmp_path), journal_dir=journal_dir)
+    assert json.loads(request(ranker, "GET", "/match")[2])["decided"] == 1
+    ranker.close()
+
+
+def test_confidence(images, tmp_path):
+    """Test the confidence the full ranking stops at is passed to it."""
+    ranker = WebRanker(
+        images, str(tmp_path), engine_name="bradley_terry", confidence=0.6
+    )
+    assert ranker.tournament.confidence == 0.6
+    ranker.close()
+
+
+def test_serve(ranker):
+    """Test requests over a kept-alive connection."""
+
+    async def exchange():
+        server = await asyncio.start_server(ranker.serve_client, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        for target in ["/match", "/missing"]:
+            writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            await writer.drain()
+            status = (await reader.readline()).decode()
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                headers[name.lower()] = value.strip()
+            body = await reader.readexactly(int(headers["content-length"]))
+            responses.append((status, body))
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses
+
+    (match_status, match_body), (missing_status, _) = asyncio.run(exchange())
+    assert match_status.startswith("HTTP/1.1 200")
+    assert "match" in json.loads(match_body)
+    assert missing_status.startswith("HTTP/1.1 404")
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image
+
+box_type = Tuple[int, int]
+
+
+def default_cache_dir() -> Path:
+    """
+    The per-user directory image ranker keeps its caches in.
+    """
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        base = Path(os.environ["LOCALAPPDATA"])
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "image-ranker"
+
+
+class ThumbnailCache:
+    """
+    Persistent cache of display sized renditions, stored in a single SQLite file.
+
+    Entries are keyed by absolute path, modification time, file size and target box, so a changed file is never
+    served from the cache. The least recently used entries are evicted once the cache grows past max_bytes.
+    """
+
+    DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(
+        self,
+        path: Optional[os.PathLike] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        if path is None:
+            path = default_cache_dir() / "thumbnails.sqlite3"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # renders run on worker threads, so the connection is shared behind a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS thumbnails (
+                    path TEXT NOT NULL,
+                    width INTEGER NOT NULL,
+                    height INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    last_used INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (path, width, height)
+                )
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS thumbnails_last_used ON thumbnails (last_used)"
+            )
+            # last_used is a counter rather than a timestamp, so the order of uses is never ambiguous
+            (self.clock,) = self.connection.execute(
+                "SELECT COALESCE(MAX(last_used), 0) FROM thumbnails"
+            ).fetchone()
+            # bytes stored, kept up to date by every put and delete so a put need not add up the table
+            (self.total,) = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM thumbnails"
+            ).fetchone()
+
+    @staticmethod
+    def file_key(path: str) -> Tuple[str, int, int]:
+        """
+        The absolute path, modification time and size of the file, which a cached rendition must match.
+        """
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str, box: box_type) -> Optional[Image.Image]:
+        """
+        Returns the cached rendition of the image at path for the box, or None. Stale renditions are dropped.
+        """
+        data = self.get_encoded(path, box)
+        if data is None:
+            return None
+        img = Image.open(BytesIO(data))
+        img.load()
+        return img
+
+    def get_encoded(self, path: str, box: box_type) -> Optional[bytes]:
+        """
+        Returns the cached rendition as stored, JPEG or PNG, or None.
+        """
+        abs_path, mtime_ns, file_size = self.file_key(path)
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT mtime_ns, file_size, data FROM thumbnails WHERE path = ? AND width = ? AND height = ?",
+                (abs_path, *box),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != mtime_ns or row[1] != file_size:
+                # the file changed, none of its renditions are any good
+                (size,) = self.connection.execute(
+                    "SELECT SUM(size) FROM thumbnails WHERE path = ?", (abs_path,)
+                ).fetchone()
+                self.connection.execute(
+                    "DELETE FROM thumbnails WHERE path = ?", (abs_path,)
+                )
+                self.total -= size
+                return None
+            self.connection.execute(
+                "UPDATE thumbnails SET last_used = ? WHERE path = ? AND width = ? AND height = ?",
+                (self.tick(), abs_path, *box),
+            )
+        return row[2]
+
+    def contains(self, path: str, box: box_type) -> bool:
+        """
+        Whether an up to date rendition of the image at path for the box is cached, without decoding it.
+        """
+        abs_path, mtime_ns, file_size = self.file_key(path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM thumbnails WHERE path = ? AND width = ? AND height = ? AND mtime_ns = ? AND file_size = ?",
+                (abs_path, *box, mtime_ns, file_size),
+            ).fetchone()
+        return row is not None
+
+    def put(self, path: str, box: box_type, img: Image.Image):
+        """
+        Store the rendition of the image at path for the box, evicting old entries if the cache is full.
+        """
+        self.put_encoded(path, box, self.encode(img))
+
+    def put_encoded(self, path: str, box: box_type, data: bytes):
+        """
+        Store a rendition already encoded by encode, e.g. in another process.
+        """
+        abs_path, mtime_ns, file_size = self.file_key(path)
+        with self.lock, self.connection:
+            # the renditions of an older version of the file, and the one replaced
+            (replaced,) = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM thumbnails WHERE path = ? "
+                "AND (mtime_ns != ? OR file_size != ? OR (width = ? AND height = ?))",
+                (abs_path, mtime_ns, file_size, *box),
+            ).fetchone()
+            self.connection.execute(
+                "DELETE FROM thumbnails WHERE path = ? AND (mtime_ns != ? OR file_size != ?)",
+                (abs_path, mtime_ns, file_size),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (abs_path, *box, mtime_ns, file_size, self.tick(), len(data), data),
+            )
+            self.total += len(data) - replaced
+            self.evict()
+
+    def tick(self) -> int:
+        """
+        Advance the use counter. Callers hold the lock.
+        """
+        self.clock += 1
+        return self.clock
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the cache fits in max_bytes. Callers hold the lock.
+        """
+        if self.total <= self.max_bytes:
+            return
+        # another process may share the file, so the entries are only added up when it seems full
+        (total,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM thumbnails"
+        ).fetchone()
+        cursor = self.connection.execute(
+            "SELECT path, width, height, size FROM thumbnails ORDER BY last_used"
+        )
+        expired = []
+        for path, width, height, size in cursor:
+            if total <= self.max_bytes:
+                break
+            expired.append((path, width, height))
+            total -= size
+        self.connection.executemany(
+            "DELETE FROM thumbnails WHERE path = ? AND width = ? AND height = ?",
+            expired,
+        )
+        self.total = total
+
+    @staticmethod
+    def encode(img: Image.Image) -> bytes:
+        """
+        Encode a rendition, as JPEG when there is no transparency to keep, otherwise as PNG. Other modes, e.g. CMYK,
+        are converted to RGB, or RGBA if they have transparency, first.
+        """
+        buffer = BytesIO()
+        if img.mode in ("RGBA", "LA"):
+            img.save(buffer, format="PNG")
+        elif img.mode in ("PA", "RGBa", "La") or "transparency" in img.info:
+            img.convert("RGBA").save(buffer, format="PNG")
+        else:
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(buffer, format="JPEG", quality=92)
+        return buffer.getvalue()
+
+    def close(self):
+        """
+        Close the SQLite file.
+        """
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,247 @@
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
+
+from double_elimination_tournament import UNDECIDED, immutable_type, match_type
+
+# a node of the tree with no participant under it left to play
+EMPTY = -2
+
+
+class TopKSelection:
+    """
+    Decides only the first top_k places, with a tournament tree: a knockout over every participant finds the best,
+    then the best is taken out and only the matches on its way to the top are played again, against the participants
+    it beat, to find the next. Every other result still holds, so each place after the first takes at most
+    ceil(log2(participants)) matches, at most participants - 1 + (top_k - 1) * ceil(log2(participants)) in all.
+
+    The tree is a heap in a compact array: node 1 is the top, node i's children are 2i and 2i + 1, and the leaves
+    follow the internal nodes, one per participant, padded to a power of two with empty ones. Each node holds the
+    winner of the match between its children, UNDECIDED while that match is to be played, or EMPTY. A match against an
+    empty node is a bye.
+    """
+
+    NAME = "top_k"
+
+    DEFAULT_TOP_K = 10
+
+    def __init__(
+        self,
+        participants: Union[set, Dict[immutable_type, Any]],
+        top_k: int = DEFAULT_TOP_K,
+    ):
+        """
+        Initializes the tree with participants, in their order, and schedules the first round of the knockout.
+        """
+        if isinstance(participants, set):
+            participants = {participant: True for participant in participants}
+
+        self.participants = participants
+        self.keys: List[immutable_type] = list(participants.keys())
+        count = len(self.keys)
+        self.top_k = top_k
+        self.size = 1
+        while self.size < count:
+            self.size *= 2
+        self.values = (
+            array("q", [UNDECIDED]) * self.size
+            + array("q", range(count))
+            + array("q", [EMPTY]) * (self.size - count)
+        )
+        # matches won by each participant, to order those outside the top_k by how far they got
+        self.wins = array("q", [0]) * count
+        # the participants taken out of the tree, best first
+        self.standings = array("q")
+        self.final_standings: Optional[List[immutable_type]] = None
+        # the node of every undecided match, in match id order
+        self.scheduled: Dict[int, int] = OrderedDict()
+        self.next_match_id = 0
+        # called with the match id and the winner of every decided match, e.g. to journal it
+        self.result_listeners: List[Callable[[int, immutable_type], None]] = []
+        # called with the match id of every decision taken back
+        self.undo_listeners: List[Callable[[int], None]] = []
+        # every decision in the order made: its match id, node and winner, the standings and next match id before it,
+        # and the nodes it changed with their previous values
+        self.history: List[Tuple[int, int, int, int, int, List[Tuple[int, int]]]] = []
+        self.changes: List[Tuple[int, int]] = []
+        if count < 2 or top_k < 1:
+            self.final_standings = list(self.keys)
+            return
+        for node in range(self.size // 2, self.size):
+            self.settle(node)
+
+    def set(self, node: int, value: int):
+        self.changes.append((node, self.values[node]))
+        self.values[node] = value
+
+    def settle(self, node: int):
+        """
+        Fill in the node and those above it as far as byes allow, then schedule the match the next one needs, or take
+        out the best once the top is filled in.
+        """
+        while True:
+            a = self.values[2 * node]
+            b = self.values[2 * node + 1]
+            if a == UNDECIDED or b == UNDECIDED:
+                return
+            if a != EMPTY and b != EMPTY:
+                self.scheduled[self.next_match_id] = node
+                self.next_match_id += 1
+                return
+            self.set(node, a if b == EMPTY else b)
+            if node == 1:
+                self.extract()
+                return
+            node //= 2
+
+    def extract(self):
+        """
+        Take the best out of the tree, and replay its way to the top without it, unless the top_k are decided.
+        """
+        best = self.values[1]
+        if best == EMPTY:
+            self.finish()
+            return
+        self.standings.append(best)
+        if len(self.standings) >= self.top_k:
+            self.finish()
+            return
+        node = self.size + best
+        self.set(node, EMPTY)
+        node //= 2
+        while node >= 1:
+            self.set(node, UNDECIDED)
+            node //= 2
+        self.settle((self.size + best) // 2)
+
+    def finish(self):
+        """
+        The decided places, then everyone else by how many matches they won. Only the first top_k are in order.
+        """
+        decided = set(self.standings)
+        rest = sorted(
+            (
+                participant
+                for participant in range(len(self.keys))
+                if participant not in decided
+            ),
+            key=lambda participant: -self.wins[participant],
+        )
+        self.final_standings = [
+            self.keys[participant] for participant in (*self.standings, *rest)
+        ]
+
+    @property
+    def finished(self) -> bool:
+        return self.final_standings is not None
+
+    def pending_matches(self, count: Optional[int] = None) -> List[match_type]:
+        """
+        Returns up to count undecided matches, as (match id, participant, participant), in match id order. None of them
+        depends on the outcome of another, so they can be decided in any order.
+        """
+        pending = []
+        for match_id, node in self.scheduled.items():
+            if count is not None and len(pending) >= count:
+                break
+            a = self.values[2 * node]
+            b = self.values[2 * node + 1]
+            pending.append((match_id, self.keys[a], self.keys[b]))
+        return pending
+
+    def submit_result(self, match_id: int, winner: immutable_type):
+        """
+        Decide a pending match.
+        """
+        node = self.scheduled.get(match_id)
+        if node is None:
+            if 0 <= match_id < self.next_match_id:
+                raise ValueError(f"Match {match_id} was already decided.")
+            raise KeyError(f"Match {match_id} is not scheduled.")
+        a = self.values[2 * node]
+        b = self.values[2 * node + 1]
+        if winner == self.keys[a]:
+            self.decide(match_id, node, a)
+        elif winner == self.keys[b]:
+            self.decide(match_id, node, b)
+        else:
+            raise ValueError(f"{winner!r} is not in match {match_id}.")
+
+    def decide(self, match_id: int, node: int, winner: int):
+        """
+        Record the winner of a scheduled match, and move it up the tree.
+        """
+        standings = len(self.standings)
+        next_match_id = self.next_match_id
+        self.changes = []
+        del self.scheduled[match_id]
+        self.wins[winner] += 1
+        for listener in self.result_listeners:
+            listener(match_id, self.keys[winner])
+        self.set(node, winner)
+        if node == 1:
+            self.extract()
+        else:
+            self.settle(node // 2)
+        self.history.append(
+            (match_id, node, winner, standings, next_match_id, self.changes)
+        )
+
+    def undo(self) -> Tuple[int, immutable_type]:
+        """
+        Take back the last decision, restoring the nodes it changed. Returns the match id and the winner of the match
+        taken back, which is undecided again.
+        """
+        if not self.history:
+            raise IndexError("There is no decision to undo.")
+        match_id, node, winner, standings, next_match_id, changes = self.history.pop()
+        for changed, value in reversed(changes):
+            self.values[changed] = value
+        self.wins[winner] -= 1
+        del self.standings[standings:]
+        self.next_match_id = next_match_id
+        self.scheduled = OrderedDict(
+            sorted(
+                [
+                    (scheduled_id, scheduled_node)
+                    for scheduled_id, scheduled_node in self.scheduled.items()
+                    if scheduled_id < next_match_id
+                ]
+                + [(match_id, node)]
+            )
+        )
+        self.final_standings = None
+        for listener in self.undo_listeners:
+            listener(match_id)
+        return match_id, self.keys[winner]
+
+    def run_tournament(
+        self,
+    ) -> Generator[
+        Tuple[immutable_type, immutable_type], immutable_type, List[immutable_type]
+    ]:
+        """
+        Generator to run the selection. Yields pairs of participants to compete in a match and accepts the winner of
+        each match.
+        """
+        keys = self.keys
+        while not self.finished:
+            match_id, node = next(iter(self.scheduled.items()))
+            a = self.values[2 * node]
+            b = self.values[2 * node + 1]
+            winner = yield (keys[a], keys[b])
+            # if the winner is None, it is an usage error
+            if not winner:
+                raise ValueError("Winner must be provided via generator send.")
+            if match_id not in self.scheduled:
+                raise ValueError("Match was decided through submit_result.")
+            self.decide(match_id, node, b if winner == keys[b] else a)
+        return self.final_standings
+
+    def upcoming_matches(
+        self, count: int
+    ) -> List[Tuple[immutable_type, immutable_type]]:
+        """
+        Returns up to count matches that are already fixed, following the match in play.
+        """
+        return [(a, b) for _, a, b in self.pending_matches(count + 1)[1:]]
@@ -0,0 +1,537 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from double_elimination_tournament import DoubleEliminationTournament
+from engines import ENGINES
+from folder_scanner import scan_images
+from image_pool import ImagePool
+from image_prefetcher import box_type, render_image
+from match_journal import MatchJournal
+from preference_graph import InferringTournament, PreferenceStore
+from thumbnail_cache import ThumbnailCache, default_cache_dir
+
+response_type = Tuple[int, Dict[str, str], bytes]
+
+REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Image Ranker</title>
+<style>
+  body { margin: 0; font-family: sans-serif; text-align: center; }
+  #match { display: flex; height: 90vh; }
+  #match figure { flex: 1; margin: 8px; cursor: pointer; display: flex; flex-direction: column; }
+  #match img { flex: 1; min-height: 0; object-fit: contain; width: 100%; }
+  #status { padding: 4px; }
+</style>
+</head>
+<body>
+<div id="match">
+  <figure id="side0"><img alt=""><figcaption></figcaption></figure>
+  <figure id="side1"><img alt=""><figcaption></figcaption></figure>
+</div>
+<div id="status">Click the better image, or press the left or right arrow key. Backspace takes the last decision
+back.</div>
+<ol id="standings"></ol>
+<script>
+let current = null;
+const preloaded = new Map();
+
+function show(state) {
+  current = state;
+  const status = document.getElementById("status");
+  if (state.finished) {
+    document.getElementById("match").hidden = true;
+    status.textContent = "Final standings";
+    document.getElementById("standings").innerHTML =
+      state.standings.map(name => "<li>" + name.replace(/</g, "&lt;") + "</li>").join("");
+    return;
+  }
+  state.images.forEach((image, side) => {
+    const figure = document.getElementById("side" + side);
+    figure.querySelector("img").src = "/image/" + image;
+    figure.querySelector("figcaption").textContent = state.names[side];
+  });
+  status.textContent = state.decided + " decisions so far";
+  // let the browser fetch and decode the next images while this match is judged
+  for (const image of state.upcoming.flat()) {
+    if (!preloaded.has(image)) {
+      const img = new Image();
+      img.src = "/image/" + image;
+      preloaded.set(image, img);
+    }
+  }
+}
+
+async function request(method, path, body) {
+  const response = await fetch(path, {
+    method: method,
+    headers: {"Content-Type": "application/json"},
+    body: body === undefined ? undefined : JSON.stringify(body),
+  });
+  return response.json();
+}
+
+async function decide(side) {
+  if (!current || current.finished) return;
+  const state = current;
+  current = null;
+  // a conflict means another judge decided the match first, the reply is the next match either way
+  show(await request("POST", "/decide", {match: state.match, winner: state.images[side]}));
+}
+
+document.getElementById("side0").onclick = () => decide(0);
+document.getElementById("side1").onclick = () => decide(1);
+document.onkeydown = async event => {
+  if (event.key === "ArrowLeft") decide(0);
+  else if (event.key === "ArrowRight") decide(1);
+  else if (event.key === "Backspace") show(await request("POST", "/undo", {}));
+};
+request("GET", "/match").then(show);
+</script>
+</body>
+</html>
+"""
+
+
+class WebRanker:
+    """
+    Runs a tournament for any number of browsers judging at once, on localhost or the network.
+
+    Every client is handed a match no other client holds, while the engine has enough undecided matches, and a
+    decision is taken from whoever submits it first. Images are served as display sized renditions, encoded once,
+    from memory, the thumbnail cache or a render on a worker thread, and marked for browsers to cache. Everything but
+    rendering runs on the event loop, so the engine needs no locking.
+    """
+
+    # how long a match handed to a client is kept from other clients, unless it is decided first
+    LEASE_SECONDS = 60
+    # how many upcoming matches a client is told about, to fetch their images ahead
+    PREFETCH_MATCHES = 4
+    DEFAULT_BOX = (1600, 1600)
+    MAX_BODY_BYTES = 64 * 1024
+
+    def __init__(
+        self,
+        images: List[str],
+        folder: str,
+        engine_name: str = DoubleEliminationTournament.NAME,
+        box: box_type = DEFAULT_BOX,
+        thumbnail_cache: Optional[ThumbnailCache] = None,
+        journal_dir: Optional[os.PathLike] = None,
+        max_workers: Optional[int] = None,
+        memory_budget: int = ImagePool.DEFAULT_MAX_BYTES,
+        preferences: Optional[PreferenceStore] = None,
+        confidence: Optional[float] = None,
+    ):
+        engine = ENGINES[engine_name]
+        create = engine
+        if engine_name == "bradley_terry" and confidence is not None:
+            create = partial(engine, confidence=confidence)
+        if preferences is not None:
+            # the same judgments as the desktop app, neither asks what the other already knows
+            create = InferringTournament.wrap(create, preferences)
+        self.journal: Optional[MatchJournal] = None
+        if journal_dir is not None:
+            # the same journal as the desktop app, either can continue a tournament the other started
+            self.journal = MatchJournal(
+                MatchJournal.path_for(journal_dir, folder, engine.NAME)
+            )
+            self.tournament = self.journal.open_tournament(images, create)
+        else:
+            self.tournament = create(dict.fromkeys(images, True))
+        self.index = {key: index for index, key in enumerate(self.tournament.keys)}
+        self.box = box
+        self.cache = thumbnail_cache
+        # encoded renditions, by participant index
+        self.pool = ImagePool(memory_budget)
+        self.renders: Dict[int, asyncio.Future] = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(4, os.cpu_count() or 1),
+            thread_name_prefix="render",
+        )
+        # match id to when it was handed out
+        self.leases: Dict[int, float] = {}
+
+    def encode(self, index: int) -> bytes:
+        """
+        The encoded rendition of a participant, from the thumbnail cache if possible. Runs on a worker thread.
+        """
+        path = self.tournament.keys[index]
+        if self.cache is not None:
+            data = self.cache.get_encoded(path, self.box)
+            if data is not None:
+                return data
+        data = ThumbnailCache.encode(render_image(path, self.box, pool=self.pool))
+        if self.cache is not None:
+            self.cache.put_encoded(path, self.box, data)
+        return data
+
+    async def rendition(self, index: int) -> bytes:
+        """
+        The encoded rendition of a participant, rendered once however many clients ask for it at once.
+        """
+        data = self.pool.get(index)
+        if data is not None:
+            return data
+        future = self.renders.get(index)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, self.encode, index
+            )
+            self.renders[index] = future
+        try:
+            data = await asyncio.shield(future)
+        finally:
+            self.renders.pop(index, None)
+        self.pool.add(index, data, len(data))
+        return data
+
+    def prefetch(self, matches):
+        """
+        Start rendering the images of the matches in the background.
+        """
+        for match in matches:
+            for participant in match:
+                index = self.index[participant]
+                if index not in self.renders and self.pool.get(index) is None:
+                    task = asyncio.ensure_future(self.rendition(index))
+                    # a broken image is reported when its match is shown
+                    task.add_done_callback(lambda task: task.exception())
+
+    def next_match(self) -> Optional[Tuple[int, Any, Any]]:
+        """
+        Hand out an undecided match, one not held by another client if there is any, otherwise the one held longest.
+        """
+        now = time.monotonic()
+        for match_id, leased_at in list(self.leases.items()):
+            if now - leased_at > self.LEASE_SECONDS:
+                del self.leases[match_id]
+        # at most len(leases) of them are held, so if any match is free, one of these is
+        pending = self.tournament.pending_matches(len(self.leases) + 1)
+        if not pending:
+            return None
+        free = [match for match in pending if match[0] not in self.leases]
+        if free:
+            match = free[0]
+        else:
+            match = min(pending, key=lambda match: self.leases[match[0]])
+        self.leases[match[0]] = now
+        return match
+
+    def state(self) -> Dict[str, Any]:
+        """
+        What a client shows next: a match, or the final standings.
+        """
+        if self.tournament.finished:
+            return {
+                "finished": True,
+                "standings": [
+                    os.path.basename(str(participant))
+                    for participant in self.tournament.final_standings
+                ],
+            }
+        match_id, a, b = self.next_match()
+        upcoming = self.tournament.upcoming_matches(self.PREFETCH_MATCHES)
+        self.prefetch([(a, b), *upcoming])
+        return {
+            "finished": False,
+            "match": match_id,
+            "images": [self.index[a], self.index[b]],
+            "names": [os.path.basename(str(a)), os.path.basename(str(b))],
+            "upcoming": [[self.index[c], self.index[d]] for c, d in upcoming],
+            "decided": len(self.tournament.history),
+        }
+
+    def decide(self, match_id: int, winner: int) -> response_type:
+        """
+        Decide a match, unless someone else decided it first.
+        """
+        try:
+            self.tournament.submit_result(match_id, self.tournament.keys[winner])
+        except (KeyError, ValueError, IndexError) as e:
+            return self.json(409, {**self.state(), "error": str(e)})
+        self.leases.pop(match_id, None)
+        if self.tournament.finished:
+            self.finish()
+        return self.json(200, self.state())
+
+    def undo(self) -> response_type:
+        """
+        Take back the last decision, by whoever made it.
+        """
+        if self.tournament.finished or not self.tournament.history:
+            return self.json(409, {**self.state(), "error": "Nothing to undo."})
+        match_id, _ = self.tournament.undo()
+        # hand the match taken back out first
+        self.leases.pop(match_id, None)
+        return self.json(200, self.state())
+
+    def finish(self):
+        """
+        The journal is no longer needed once the tournament is over.
+        """
+        if self.journal is not None:
+            self.journal.discard()
+            self.journal = None
+
+    @staticmethod
+    def json(status: int, payload: Any) -> response_type:
+        return (
+            status,
+            {"Content-Type": "application/json", "Cache-Control": "no-store"},
+            json.dumps(payload).encode("utf-8"),
+        )
+
+    async def image(self, index: int, headers: Dict[str, str]) -> response_type:
+        """
+        A rendition, with a validator that changes whenever the file does, so browsers can keep it.
+        """
+        path = self.tournament.keys[index]
+        try:
+            _, mtime_ns, file_size = ThumbnailCache.file_key(path)
+            etag = f'"{mtime_ns:x}-{file_size:x}-{self.box[0]}x{self.box[1]}"'
+            cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+            if headers.get("if-none-match") == etag:
+                return 304, cache_headers, b""
+            data = await self.rendition(index)
+        except (OSError, ValueError) as e:
+            return 404, {"Content-Type": "text/plain"}, str(e).encode("utf-8")
+        content_type = "image/jpeg" if data.startswith(b"\xff\xd8") else "image/png"
+        return 200, {"Content-Type": content_type, **cache_headers}, data
+
+    async def handle(
+        self, method: str, target: str, headers: Dict[str, str], body: bytes
+    ) -> response_type:
+        """
+        Route a request to its handler.
+        """
+        url = urlsplit(target)
+        if url.path == "/" and method == "GET":
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, PAGE.encode()
+        if url.path == "/match" and method == "GET":
+            return self.json(200, self.state())
+        if url.path == "/decide" and method == "POST":
+            try:
+                decision = json.loads(body)
+                match_id, winner = int(decision["match"]), int(decision["winner"])
+            except (ValueError, KeyError, TypeError):
+                return self.json(400, {"error": "Expected match and winner."})
+            return self.decide(match_id, winner)
+        if url.path == "/undo" and method == "POST":
+            return self.undo()
+        if url.path.startswith("/image/") and method == "GET":
+            try:
+                index = int(url.path[len("/image/") :])
+                self.tournament.keys[index]
+            except (ValueError, IndexError):
+                return 404, {"Content-Type": "text/plain"}, b"No such image."
+            return await self.image(index, headers)
+        if url.path == "/standings" and method == "GET":
+            query = parse_qs(url.query)
+            if not self.tournament.finished:
+                return self.json(409, {"error": "The tournament is not over."})
+            if query.get("format") == ["text"]:
+                text = "".join(f"{key}\n" for key in self.tournament.final_standings)
+                return 200, {"Content-Type": "text/plain"}, text.encode("utf-8")
+            return self.json(200, self.state())
+        if url.path in ("/", "/match", "/decide", "/undo", "/standings"):
+            return 405, {"Content-Type": "text/plain"}, b"Method not allowed."
+        return 404, {"Content-Type": "text/plain"}, b"Not found."
+
+    async def serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """
+        Answer the requests of one connection, keeping it open between requests unless asked not to.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {}, b"", close=True)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > self.MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {}, b"", close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                close = headers.get("connection", "").lower() == "close" or (
+                    version == "HTTP/1.0"
+                    and headers.get("connection", "").lower() != "keep-alive"
+                )
+                try:
+                    status, response_headers, content = await self.handle(
+                        method, target, headers, body
+                    )
+                except Exception as e:
+                    # the connection, and the server, stay up
+                    status, response_headers, content = (
+                        500,
+                        {"Content-Type": "text/plain"},
+                        repr(e).encode("utf-8"),
+                    )
+                await self.respond(writer, status, response_headers, content, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: Dict[str, str],
+        content: bytes,
+        close: bool = False,
+    ):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        headers = {**headers, "Content-Length": str(len(content))}
+        if close:
+            headers["Connection"] = "close"
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + content)
+        await writer.drain()
+
+    async def serve(self, host: str, port: int):
+        """
+        Serve until cancelled.
+        """
+        server = await asyncio.start_server(self.serve_client, host, port)
+        addresses = ", ".join(
+            f"http://{socket.getsockname()[0]}:{socket.getsockname()[1]}/"
+            for socket in server.sockets
+        )
+        print(f"Judging at {addresses}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.journal is not None:
+            self.journal.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Rank a folder of images from web browsers, several judges at once."
+    )
+    parser.add_argument("folder", help="folder of images")
+    parser.add_argument(
+        "--recursive", action="store_true", help="include images in subfolders"
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address to listen on, 0.0.0.0 to judge from other machines",
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--engine",
+        choices=list(ENGINES),
+        default=DoubleEliminationTournament.NAME,
+        help="ranking engine",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        help="with --engine bradley_terry, stop once this share of the pairs of images is expected to be in the right "
+        "order, 0.8 by default",
+    )
+    parser.add_argument(
+        "--box",
+        type=int,
+        default=WebRanker.DEFAULT_BOX[0],
+        help="images are served scaled to fit a square of this many pixels",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=ThumbnailCache.DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="size limit of the thumbnail cache in MB, 0 disables the cache",
+    )
+    parser.add_argument(
+        "--no-journal",
+        action="store_true",
+        help="do not journal decisions, so an interrupted tournament cannot be resumed",
+    )
+    parser.add_argument(
+        "--no-preferences",
+        action="store_true",
+        help="ask every match, rather than deciding those that follow from judgments in this or earlier sessions",
+    )
+    parser.add_argument("--output", help="write the final standings to this file")
+    args = parser.parse_args(argv)
+
+    if args.confidence is not None and not 0 < args.confidence <= 1:
+        parser.error("--confidence must be above 0 and at most 1")
+    images = sorted(scan_images(args.folder, args.recursive))
+    if not images:
+        parser.error("no images to rank")
+    thumbnail_cache = None
+    if args.cache_size > 0:
+        thumbnail_cache = ThumbnailCache(max_bytes=args.cache_size * 1024 * 1024)
+    preferences = None
+    if not args.no_preferences:
+        preferences = PreferenceStore(default_cache_dir() / "preferences.sqlite3")
+    ranker = WebRanker(
+        images,
+        args.folder,
+        args.engine,
+        box=(args.box, args.box),
+        thumbnail_cache=thumbnail_cache,
+        journal_dir=None if args.no_journal else default_cache_dir() / "journals",
+        preferences=preferences,
+        confidence=args.confidence,
+    )
+    try:
+        asyncio.run(ranker.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ranker.close()
+        if thumbnail_cache is not None:
+            thumbnail_cache.close()
+        if preferences is not None:
+            preferences.close()
+    if args.output and ranker.tournament.finished:
+        Path(args.output).write_text(
+            "".join(f"{key}\n" for key in ranker.tournament.final_standings)
+        )
+
+
+if __name__ == "__main__":
+    main()